@@ -0,0 +1,247 @@
+"""
+bench_structures.py
+Microbenchmarks for the CPU side of the bot, on synthetic repositories: building repo structures, comparing them to a
+template, counting the differences and computing subtree stats. Nothing is sent over the network; the synthetic repos
+answer listings and tree requests from memory, with complete ContentFile leaves made by make_content_file.
+
+Run from the repository root:
+    python -m benchmarks.bench_structures                      # all sizes, print a table
+    python -m benchmarks.bench_structures --quick              # skip the 200k-file monorepo
+    python -m benchmarks.bench_structures --save benchmarks/baseline.json
+    python -m benchmarks.bench_structures --compare benchmarks/baseline.json
+"""
+from typing import List, Tuple, Dict, Any, Callable, Optional
+from types import SimpleNamespace
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from repository_management_bot.src.includes import ContentFile
+from repository_management_bot.src.repo_detail import (
+    StructureSource, RepoStructureType, FileRegistererType, TREE_STATS,
+    get_repo_structure, get_repo_structure_api, get_subtree_stats, make_content_file
+)
+from repository_management_bot.src.access_gh import get_repo_dir
+from repository_management_bot.src.get_template_details import RepoTemplate
+from repository_management_bot.src.build_pr import check_diff
+
+# name -> (files, maximum directory depth, directories per level)
+TREE_SIZES: Dict[str, Tuple[int, int, int]] = {
+    "tiny": (10, 2, 3),
+    "small": (1_000, 4, 6),
+    "medium": (20_000, 8, 8),
+    "monorepo": (200_000, 12, 10)
+}
+QUICK_SIZES = ["tiny", "small", "medium"]
+# The number of template files
+TEMPLATE_SIZES: Dict[str, int] = {"template8": 8, "template64": 64, "template512": 512}
+# Template files that the repos do not have, and that they have with other content
+MISSING_SHARE = 0.25
+DRIFTED_SHARE = 0.25
+# A run is a regression when it is this much slower (or uses this much more memory) than the baseline
+REGRESSION_RATIO = 1.25
+
+EntryType = Tuple[str, str, int] # path, blob SHA, size
+
+def blob_sha(seed: str)->str:
+    return hashlib.sha1(seed.encode("utf-8")).hexdigest()
+
+def make_entries(files: int, depth: int, fanout: int, seed: int = 0)->List[EntryType]:
+    """make_entries
+    Generate the files of a synthetic repo: a README at the root, then files at random depths below
+    directories with a bounded number of children per level
+    """
+    rng = random.Random(seed)
+    entries = [("README.md", blob_sha("README.md"), 1024)]
+    seen = {"README.md"}
+    while len(entries) < files:
+        levels = rng.randint(0, depth)
+        parts = [f"dir{rng.randrange(fanout)}" for _ in range(levels)]
+        parts.append(f"file{len(entries)}.{rng.choice(['py', 'md', 'json', 'txt'])}")
+        path = "/".join(parts)
+        if path in seen:
+            continue
+        seen.add(path)
+        entries.append((path, blob_sha(path), rng.randrange(1, 1 << 16)))
+    return entries
+
+def make_template_entries(repo_entries: List[EntryType], files: int, seed: int = 0)->List[EntryType]:
+    """make_template_entries
+    Pick the files of a synthetic template: the repo's README, files of the repo (some with other content),
+    and files the repo does not have
+    """
+    rng = random.Random(seed)
+    missing = int(files * MISSING_SHARE)
+    drifted = int(files * DRIFTED_SHARE)
+    picked = rng.sample(repo_entries[1:], min(files - 1 - missing, len(repo_entries) - 1))
+    entries = [repo_entries[0]]
+    for i, (path, sha, size) in enumerate(picked):
+        entries.append((path, blob_sha(f"template:{path}") if i < drifted else sha, size))
+    for i in range(files - len(entries)):
+        path = f".github/template/missing{i}.yml" if i % 2 else f"doc/missing{i}.md"
+        entries.append((path, blob_sha(path), 512))
+    return entries
+
+class SyntheticRepository(StructureSource):
+    """SyntheticRepository
+    A repo that only exists in memory. It answers get_structure (like the git and local backends), get_contents
+    (like the Contents API, one directory per call) and get_git_tree (like a recursive tree request)
+    """
+    full_name: str
+    name: str
+    entries: List[EntryType]
+    listings: Dict[str, List[ContentFile]]
+    def __init__(self, full_name: str, entries: List[EntryType]):
+        self.full_name = full_name
+        self.name = full_name.rpartition("/")[2]
+        self.entries = entries
+        self.listings = {"": []}
+        for path, sha, size in entries:
+            parent = ""
+            parts = path.split("/")
+            for i, part in enumerate(parts[:-1]):
+                directory = "/".join(parts[:i + 1])
+                if directory not in self.listings:
+                    self.listings[directory] = []
+                    self.listings[parent].append(make_content_file(directory, blob_sha(f"tree:{directory}"), 0, "dir"))
+                parent = directory
+            self.listings[parent].append(make_content_file(path, sha, size))
+
+    def get_structure(self, path: str = "", file_registerer: Optional[FileRegistererType] = None)->RepoStructureType:
+        structure: RepoStructureType = {}
+        for file_path, sha, size in self.entries:
+            parts = file_path.split("/")
+            cur = structure
+            for part in parts[:-1]:
+                cur = cur.setdefault(part, {})
+            content = make_content_file(file_path, sha, size)
+            cur[parts[-1]] = content
+            if file_registerer:
+                file_registerer(content, file_path.rpartition("/")[0])
+        return structure
+
+    def get_contents(self, path: str)->List[ContentFile]:
+        return self.listings[path]
+
+    def get_git_tree(self, sha: str, recursive: bool = False)->SimpleNamespace:
+        elements = [
+            SimpleNamespace(path=content.path, sha=content.sha, size=None, type="tree")
+            for listing in self.listings.values() for content in listing if content.type == "dir"
+        ]
+        elements.extend(SimpleNamespace(path=path, sha=sha, size=size, type="blob") for path, sha, size in self.entries)
+        return SimpleNamespace(tree=elements, truncated=False)
+
+def measure(func: Callable[[], Any], setup: Optional[Callable[[], None]] = None, repeat: int = 5)->Dict[str, float]:
+    """measure
+    Time a function (best and median of several runs), then measure its peak traced memory in one more run.
+    Memory is measured separately, so tracing does not slow down the timed runs
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best_seconds": min(times), "median_seconds": statistics.median(times), "peak_kib": peak / 1024}
+
+def clear_structure_caches():
+    get_repo_dir.cache.clear()
+    check_diff.cache.clear()
+    TREE_STATS.clear()
+
+def run_benchmarks(sizes: List[str], repeat: int)->Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    def record(name: str, result: Dict[str, float]):
+        results[name] = result
+        print(
+            f"{name:<42}{result['best_seconds'] * 1000:>12.2f}{result['median_seconds'] * 1000:>12.2f}{result['peak_kib']:>14.1f}",
+            flush=True
+        )
+    print(f"{'benchmark':<42}{'best ms':>12}{'median ms':>12}{'peak KiB':>14}")
+    for size in sizes:
+        files, depth, fanout = TREE_SIZES[size]
+        # Fewer runs for the biggest trees, which take seconds each
+        runs = repeat if files <= 20_000 else max(1, repeat // 3)
+        repo = SyntheticRepository(f"bench/{size}", make_entries(files, depth, fanout))
+        record(f"structure/flat/{size}", measure(lambda: get_repo_structure(repo), repeat=runs))
+        record(f"structure/api/{size}", measure(lambda: get_repo_structure_api(repo), clear_structure_caches, runs))
+        root_sha = blob_sha("tree:")
+        record(f"subtree_stats/{size}", measure(lambda: get_subtree_stats(repo, root_sha), clear_structure_caches, runs))
+        structure = get_repo_structure(repo)
+        for template_name, template_files in TEMPLATE_SIZES.items():
+            template_source = SyntheticRepository(f"bench/{template_name}", make_template_entries(repo.entries, template_files))
+            template = RepoTemplate(template_source)
+            record(
+                f"compare/{template_name}/{size}",
+                measure(lambda: template.compare_repo_structure(structure, check_drift=True), repeat=runs)
+            )
+            record(f"find_drift/{template_name}/{size}", measure(lambda: template.find_drift_structure(structure), repeat=runs))
+            record(
+                f"check_diff/{template_name}/{size}",
+                measure(lambda: check_diff(repo, template, True), clear_structure_caches, runs)
+            )
+    return results
+
+def compare_results(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]])->List[str]:
+    """compare_results
+    Print how every benchmark compares to the baseline
+
+    returns:
+        List[str] - the benchmarks that regressed
+    """
+    regressions = []
+    print(f"\n{'benchmark':<42}{'time ratio':>12}{'memory ratio':>14}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        time_ratio = result["best_seconds"] / base["best_seconds"] if base["best_seconds"] else 1.0
+        memory_ratio = result["peak_kib"] / base["peak_kib"] if base["peak_kib"] else 1.0
+        regressed = time_ratio > REGRESSION_RATIO or memory_ratio > REGRESSION_RATIO
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<42}{time_ratio:>12.2f}{memory_ratio:>14.2f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None)->int:
+    parser = argparse.ArgumentParser(description="Benchmark structure building and diffing on synthetic repositories")
+    parser.add_argument("--sizes", nargs="+", choices=list(TREE_SIZES), help="The tree sizes to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help=f"Only run {', '.join(QUICK_SIZES)}")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--save", type=Path, help="Write the results to this JSON file, e.g. as a new baseline")
+    parser.add_argument("--compare", type=Path, help="Compare the results to a baseline JSON file; exits with 1 on regressions")
+    args = parser.parse_args(argv)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else list(TREE_SIZES))
+    # The structures of the biggest trees are deeply nested
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10_000))
+    results = run_benchmarks(sizes, args.repeat)
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_results(results, baseline)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {REGRESSION_RATIO}x: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
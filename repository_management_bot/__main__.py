@@ -1,4 +1,6 @@
-from .src.build_pr import compliance_pr_dispatch
+from pathlib import Path
+# Only the standard library is imported before the arguments are parsed, so --profile can cover the remaining imports
+from .src.profiling import enable_profiling, profile_phase, write_profile_reports
 from .cli.arguments import DefaultArgParse, ProgInfoExp
 
 if __name__ == "__main__":
@@ -13,14 +15,112 @@ if __name__ == "__main__":
     )
     DefaultArgParse.add_prog_info(proginfo)
     arg = DefaultArgParse.parse_args()
+    if arg["profile"]:
+        enable_profiling(Path(arg["profile"]))
+    with profile_phase("import"):
+        from .src.build_pr import compliance_pr_dispatch
+        from .src.multi_org import is_multi_org, multi_org_dispatch
+        from .src.lazy_guard import enable_lazy_guard, report_lazy_completions
+        from .src.access_gh import configure_client, enable_request_metrics
+        from .src.metrics import start_metrics_server
+        from .src.mirror_cache import configure_mirror_cache
+        from .src.caching import load_cache, save_cache
+        from .src.includes import fprint
+        from .src.reporting import ReportWriter
+        from .src.repo_detail import set_structure_provider
+        from .src import git_backend
     org = arg["org"]
     user = arg["user"]
     repo = arg["repo"]
     template = arg["template"]
+    drift = arg["drift"]
+    configure_client(
+        base_url=arg["base-url"],
+        per_page=arg["per-page"],
+        pool_size=arg["pool-size"],
+        timeout=arg["timeout"],
+        retries=arg["retries"],
+        workers=arg["workers"],
+        credentials=arg["credentials"]
+    )
+    set_structure_provider(arg["structure-provider"])
+    if arg["metrics-port"] is not None:
+        enable_request_metrics()
+        server = start_metrics_server(arg["metrics-port"], arg["metrics-host"])
+        fprint(f"Serving metrics at http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+    configure_mirror_cache(max_bytes=arg["mirror-max-mb"] * 1024 ** 2)
+    cache_file = arg["cache-file"]
+    if cache_file:
+        loaded = load_cache(cache_file, max_age=arg["cache-max-age"] * 60)
+        fprint(f"Loaded {loaded} cached responses from {cache_file}")
+    lazy_guard = arg["lazy-guard"]
+    if lazy_guard is not None:
+        enable_lazy_guard(strict=lazy_guard == "strict")
     # This is the main entry point for the program
     # It will list repositories in the {org} organization, and what files are missing from each repository
     # It will query the user for which repositories to create PRs for, and then create the PRs
     # 
     # The repository assumes that the user has the GitHub CLI installed and authenticated (gh auth login),
     # and uses their account to create the PRs
-    compliance_pr_dispatch(user_name=user, org_name=org, repo_name=repo, template_name=template)
\ No newline at end of file
+    multi_org = is_multi_org(org)
+    if multi_org and (repo or user or arg["local-dir"] or arg["shards"] or arg["shard"] or arg["merge"]):
+        raise ValueError("Several organizations can not be combined with --repo, --user, --local-dir or sharding")
+    if arg["shards"] or arg["shard"] or arg["merge"]:
+        # Scan only, split across processes or machines. Shards only produce the compliance diffs
+        if arg["report"] or arg["incremental"] or arg["strategy"] != "tree" or arg["missing-any"] or arg["missing-all"]:
+            raise ValueError("Sharding can not be combined with --report, --incremental, --strategy, --missing-any or --missing-all")
+        from .src.sharding import shard_dispatch
+        shard_dispatch(
+            {
+                "user_name": user, "org_name": org, "repo_name": repo, "template_name": template,
+                "check_drift": drift, "structure_provider": arg["structure-provider"],
+                "local_dir": arg["local-dir"], "repo_filter": arg["filter"]
+            },
+            shards=arg["shards"],
+            shard=arg["shard"],
+            merge=arg["merge"],
+            shard_dir=Path(arg["shard-dir"])
+        )
+    else:
+        report = ReportWriter(arg["report"], arg["report-format"]) if arg["report"] else None
+        try:
+            if multi_org:
+                multi_org_dispatch(
+                    org_names=org,
+                    template_name=template,
+                    check_drift=drift,
+                    report=report,
+                    scan_only=arg["scan-only"],
+                    incremental=arg["incremental"],
+                    strategy=arg["strategy"],
+                    repo_filter=arg["filter"],
+                    request_budget=arg["request-budget"],
+                    missing_any=arg["missing-any"],
+                    missing_all=arg["missing-all"]
+                )
+            else:
+                compliance_pr_dispatch(
+                    user_name=user, 
+                    org_name=org, 
+                    repo_name=repo, 
+                    template_name=template, 
+                    check_drift=drift,
+                    report=report,
+                    scan_only=arg["scan-only"],
+                    local_dir=arg["local-dir"],
+                    incremental=arg["incremental"],
+                    strategy=arg["strategy"],
+                    repo_filter=arg["filter"],
+                    missing_any=arg["missing-any"],
+                    missing_all=arg["missing-all"]
+                )
+        finally:
+            if report is not None:
+                report.close()
+    if cache_file:
+        fprint(f"Saved {save_cache(cache_file)} cached responses to {cache_file}")
+    if lazy_guard is not None:
+        report_lazy_completions()
+    if arg["profile"]:
+        fprint(f"Profile reports written to {arg['profile']}:")
+        write_profile_reports()
\ No newline at end of file
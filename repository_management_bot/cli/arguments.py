@@ -261,9 +261,9 @@ class argparser:
         kw = ""
         while i < len(args):
             # print(args[i])
-            if args[i].startswith("-"):
-                if kw:
-                    kwargs[kw] = " ".join(argval) if argval else ""
+            if args[i].startswith("-") and args[i] != "-":
+                if kw and (argval or kw not in kwargs):
+                    kwargs[kw] = " ".join(argval)
                 argval = []
                 kw = self.arg_aliases[args[i].lstrip("-")]
                 if self.arg_config_by_name[kw][1]["argtype"] == bool:
@@ -271,7 +271,7 @@ class argparser:
             else:
                 argval.append(args[i])
             i += 1
-        if argval and kw:
+        if kw and (argval or kw not in kwargs):
             kwargs[kw] = " ".join(argval)
         # print(posargs, kwargs)
         return (tuple(posargs), kwargs)
@@ -285,10 +285,11 @@ class argparser:
         """
         self.setup()
         result = self.arg_type.parse(self.parse_argv())
-        for arg_name, config in self.arg_configs:
+        for arg_name, (names, config) in self.arg_config_by_name.items():
             if arg_name in result and isinstance(result[arg_name], str) and "argtype" in config:
                 result[arg_name] = config["argtype"](result[arg_name])
-        if result["help"] or (not any(result.values())):
+        defaults = self.arg_type.parse(((), {}))
+        if result["help"] or result == defaults:
             self.help_message()
             sys.exit(0)
         if result.get("version", False):
@@ -331,7 +332,7 @@ arg_configs = [
         "-o",
         default=None,
         argtype=str,
-        help="A target organization to check for template compliance"
+        help="A target organization to check for template compliance. Several comma-separated organizations, or 'all' for every organization of the authenticated user, are checked in one run that shares the template, the cache and the workers"
     ),
     argtuple(
         "template",
@@ -356,6 +357,188 @@ arg_configs = [
         default=None,
         argtype=str,
         help="A specific user to check for template compliance."
+    ),
+    argtuple(
+        "-d",
+        "--drift",
+        default=False,
+        argtype=bool,
+        help="Also treat files that exist, but differ from the template (by blob SHA), as non-compliant and update them"
+    ),
+    argtuple(
+        "--lazy-guard",
+        default=None,
+        argtype=str,
+        help="Count lazy PyGithub attribute completions per call site and report them at the end. Pass 'strict' to raise on the first one instead"
+    ),
+    argtuple(
+        "--base-url",
+        default=None,
+        argtype=str,
+        help="The GitHub API root, for GitHub Enterprise (https://host/api/v3) or a local stand-in"
+    ),
+    argtuple(
+        "--per-page",
+        default=100,
+        argtype=int,
+        help="The page size used when listing repositories and other collections"
+    ),
+    argtuple(
+        "--credentials",
+        default="gh",
+        argtype=str,
+        help="The credentials to spread API requests over: gh (the GitHub CLI token), env:NAME (a token in an environment variable), file:PATH (one token per line) or app:APP_ID:INSTALLATION_ID:KEY_PATH (a GitHub App installation). Reads go to the credential with the most remaining quota; each repo's PR is made with one credential"
+    ),
+    argtuple(
+        "--workers",
+        "-w",
+        default=1,
+        argtype=int,
+        help="The number of repos checked at once by --scan-only runs (other runs ask before each repo, so they check one at a time). The HTTP connection pool is sized to match"
+    ),
+    argtuple(
+        "--pool-size",
+        default=None,
+        argtype=int,
+        help="The number of kept-alive HTTP connections (default: the number of workers, at least 10)"
+    ),
+    argtuple(
+        "--timeout",
+        default=15,
+        argtype=int,
+        help="The timeout for a single request, in seconds"
+    ),
+    argtuple(
+        "--retries",
+        default=5,
+        argtype=int,
+        help="How many times a failed or rate limited request is retried, with exponential backoff"
+    ),
+    argtuple(
+        "--shards",
+        default=None,
+        argtype=int,
+        help="Scan without creating PRs, split into this many shards scanned by a pool of processes, and merge the results"
+    ),
+    argtuple(
+        "--shard",
+        default=None,
+        argtype=str,
+        help="Scan without creating PRs, only the shard given as 'index/count' (e.g. '0/4'), and write its results to the shard directory"
+    ),
+    argtuple(
+        "--merge",
+        default=False,
+        argtype=bool,
+        help="Merge the shard results in the shard directory and print them"
+    ),
+    argtuple(
+        "--shard-dir",
+        default="shards",
+        argtype=str,
+        help="The directory shard results are written to and merged from"
+    ),
+    argtuple(
+        "--report",
+        default=None,
+        argtype=str,
+        help="Stream one compliance record per checked repo to this file ('-' for stdout) while the run goes on"
+    ),
+    argtuple(
+        "--report-format",
+        default=None,
+        argtype=str,
+        help="The report format, 'jsonl' or 'csv' (default: csv for .csv files, jsonl otherwise)"
+    ),
+    argtuple(
+        "--scan-only",
+        default=False,
+        argtype=bool,
+        help="Check every target repo without asking, and never prepare PRs"
+    ),
+    argtuple(
+        "--structure-provider",
+        default="api",
+        argtype=str,
+        help="How repo structures are read: 'api' (REST contents requests) or 'git' (a blobless clone, which uses no API quota)"
+    ),
+    argtuple(
+        "--local-dir",
+        default=None,
+        argtype=str,
+        help="Check the checkouts, bare mirrors or plain directories in this directory instead of GitHub repos (no PRs are prepared). --template may name one of them"
+    ),
+    argtuple(
+        "--mirror-max-mb",
+        default=2048,
+        argtype=int,
+        help="The size limit of the bare mirrors cached in clones/ for preparing PRs. The least recently used mirrors are removed beyond it"
+    ),
+    argtuple(
+        "--cache-file",
+        default=None,
+        argtype=str,
+        help="Load cached GitHub responses from this file at startup, and save them back at the end. Entries for a repo are only reused until it is pushed to, and entries for a template until its head changes"
+    ),
+    argtuple(
+        "--cache-max-age",
+        default=60,
+        argtype=int,
+        help="Minutes after which entries in --cache-file expire (e.g. org listings and searches). Blobs by SHA never expire"
+    ),
+    argtuple(
+        "--profile",
+        default=None,
+        argtype=str,
+        help="Profile CPU time and memory allocations per phase (import, auth, template, listing, structure, diff, commit, pr) and write the reports to this directory"
+    ),
+    argtuple(
+        "--incremental",
+        default=False,
+        argtype=bool,
+        help="Reuse the results stored in snapshots/ by earlier runs for repos that have not been pushed to since, and only check them for template files that changed"
+    ),
+    argtuple(
+        "--filter",
+        default="archived=false disabled=false mirror=false",
+        argtype=str,
+        help="Only check listed org or user repos that match all of these expressions, using the listing response only. Fields: archived, disabled, fork, private, is_template, mirror, empty, size, stargazers_count, pushed_at, created_at, updated_at, topics, language, visibility, name, full_name. Operators: = != > >= < <= ~ (contains). Comma-separated values match any; dates are ISO dates or <N>d for N days ago. empty and size come from the listed size, which GitHub updates lazily, so empty=false may skip repos that were pushed to recently. 'none' checks every repo"
+    ),
+    argtuple(
+        "--metrics-port",
+        default=None,
+        argtype=int,
+        help="Serve live metrics in the Prometheus text format at http://<metrics-host>:<port>/metrics while the bot runs"
+    ),
+    argtuple(
+        "--metrics-host",
+        default="127.0.0.1",
+        argtype=str,
+        help="The address the metrics endpoint listens on (only local by default)"
+    ),
+    argtuple(
+        "--missing-any",
+        default=None,
+        argtype=str,
+        help="After the scan, list the checked repos that are missing (or have outdated) at least one of these comma-separated template files"
+    ),
+    argtuple(
+        "--missing-all",
+        default=None,
+        argtype=str,
+        help="After the scan, list the checked repos that are missing (or have outdated) all of these comma-separated template files"
+    ),
+    argtuple(
+        "--request-budget",
+        default=None,
+        argtype=int,
+        help="With several organizations, the most API requests to make for all of them together. Every organization gets an equal share, and the share one does not need goes to the others (default: no limit, but requests are still spread evenly)"
+    ),
+    argtuple(
+        "--strategy",
+        default="tree",
+        argtype=str,
+        help="How repos are checked: 'tree' (read every repo's tree), 'search' (one code search per template file, for org and user targets; results search may have missed are verified) or 'auto' (search when the org is much larger than the template)"
     )
 ]
 
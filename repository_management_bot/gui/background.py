@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar, Iterator
+import threading
+import queue
+import tkinter as tk
+from github.PaginatedList import PaginatedList
+
+"""
+background.py
+Helpers for running GitHub requests off of the Tk main thread.
+Worker threads never touch Tk; they post results to a queue, which is drained on the main thread with after().
+"""
+
+T = TypeVar("T")
+
+def iter_pages(paginated: PaginatedList[T])->Iterator[List[T]]:
+    """iter_pages
+    Iterate over a paginated list one page (one request) at a time
+
+    args:
+        paginated: PaginatedList[T] - the paginated list to iterate
+    returns:
+        Iterator[List[T]] - the pages of the list, in order
+    """
+    page_num = 0
+    while True:
+        page = paginated.get_page(page_num)
+        if not page:
+            return
+        yield page
+        page_num += 1
+
+class BackgroundTask:
+    """## BackgroundTask
+    Run a loading function on a worker thread, and hand its results back to a Tk widget.
+    <br> The loading function receives the task, and calls `post` for every piece of data it produces.
+    <br> `on_result` is called on the Tk main thread for every posted item, and `on_done` once the worker has finished.
+    """
+    widget: tk.Misc
+    work: Callable[["BackgroundTask"], None]
+    on_result: Callable[[Any], None]
+    on_done: Optional[Callable[[Optional[BaseException]], None]]
+    poll_ms: int
+    results: "queue.Queue[Any]"
+    cancel_event: threading.Event
+    thread: Optional[threading.Thread]
+    error: Optional[BaseException]
+    finished: bool
+    def __init__(
+        self,
+        widget: tk.Misc,
+        work: Callable[["BackgroundTask"], None],
+        on_result: Callable[[Any], None],
+        on_done: Optional[Callable[[Optional[BaseException]], None]] = None,
+        poll_ms: int = 50
+    ):
+        self.widget = widget
+        self.work = work
+        self.on_result = on_result
+        self.on_done = on_done
+        self.poll_ms = poll_ms
+        self.results = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.error = None
+        self.finished = False
+
+    @property
+    def cancelled(self)->bool:
+        return self.cancel_event.is_set()
+
+    def start(self)->"BackgroundTask":
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.widget.after(self.poll_ms, self.poll)
+        return self
+
+    def run(self):
+        try:
+            self.work(self)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.finished = True
+
+    def post(self, item: Any)->bool:
+        """## post
+        hand a result to the Tk main thread. called from the worker thread
+
+        ### Parameters:
+        - `item: Any` - the result to hand over
+
+        ### Returns:
+        - `bool` - False if the task was cancelled, and the worker should stop
+        """
+        if self.cancelled:
+            return False
+        self.results.put(item)
+        return True
+
+    def cancel(self):
+        """## cancel
+        stop delivering results. the worker stops at its next call to `post`
+        """
+        self.cancel_event.set()
+
+    def poll(self):
+        if self.cancelled:
+            return
+        # Check before draining, so that results posted right before finishing are not lost
+        finished = self.finished
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.on_result(item)
+            if self.cancelled:
+                return
+        if not finished:
+            self.widget.after(self.poll_ms, self.poll)
+        elif self.on_done is not None:
+            self.on_done(self.error)
@@ -8,9 +8,14 @@ from tkinter import ttk
 # Local imports
 if __name__ == "__main__":
     sys.path.append(".")
-from repository_management_bot.src.access_gh import get_user, get_org, get_repo
+from repository_management_bot.src.access_gh import get_user, get_org, get_repo, fetch_repo_dir
 from repository_management_bot.src.includes import *
-from repository_management_bot.src.repo_detail import get_repo_structure, RepoStructureType
+from repository_management_bot.src.repo_detail import get_repo_structure, get_subtree_stats, get_last_modified_batch, RepoStructureType
+from repository_management_bot.src.caching import BoundedCache
+from repository_management_bot.src.lazy_guard import listed_attribute
+from repository_management_bot.gui.background import BackgroundTask, iter_pages
+from repository_management_bot.gui.search_index import SearchIndex
+from repository_management_bot.gui.virtual_tree import VirtualTree
 
 class MinimizableFrame(ttk.Frame):
     stored_pack_info: List[Tuple[tk.Widget, Dict[str, Any]]]
@@ -18,17 +23,55 @@ class MinimizableFrame(ttk.Frame):
     cf: ttk.Frame # Content frame
     is_minimized: bool
     minimize_button: ttk.Button
+    loading_bar: ttk.Progressbar
+    task: Optional[BackgroundTask]
     def __init__(self, master: tk.Misc, **kwargs):
         super().__init__(master, **kwargs)
         self.stored_pack_info = []
         self.is_minimized = False
+        self.task = None
         self.hf = ttk.Frame(self)
         self.hf.pack(expand=True, fill=tk.BOTH)
         self.minimize_button = ttk.Button(self.hf, text="-", command=self.toggle_minimize)
         self.minimize_button.pack(side=tk.RIGHT, anchor=tk.NE)
+        self.loading_bar = ttk.Progressbar(self.hf, mode="indeterminate", length=80)
         self.cf = ttk.Frame(self)
         self.cf.pack(expand=True, fill=tk.BOTH)
         self.header_widgets = [self.minimize_button]
+        self.bind("<Destroy>", self.on_destroy)
+    
+    def show_loading(self):
+        self.loading_bar.pack(side=tk.RIGHT, anchor=tk.NE)
+        self.loading_bar.start()
+        
+    def hide_loading(self):
+        self.loading_bar.stop()
+        self.loading_bar.pack_forget()
+        
+    def run_task(self, work: Callable[[BackgroundTask], None], on_result: Callable[[Any], None]):
+        """run_task
+        Load data on a worker thread, cancelling whatever this frame was loading before.
+        on_result is called on the Tk thread for every item the worker posts.
+        """
+        self.cancel_task()
+        self.show_loading()
+        self.task = BackgroundTask(self, work, on_result, self.on_task_done).start()
+        
+    def cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.hide_loading()
+            
+    def on_task_done(self, error: Optional[BaseException]):
+        self.task = None
+        self.hide_loading()
+        if error is not None:
+            fprint(f"{type(self).__name__}: loading failed: {error!r}")
+            
+    def on_destroy(self, event):
+        if event.widget is self and self.task is not None:
+            self.task.cancel()
     
     def content_children(self)->List[tk.Widget]:
         return self.cf.winfo_children()
@@ -66,12 +109,83 @@ class MinimizableFrame(ttk.Frame):
         self.update()
         self.master.update()
             
+class RepoList(ttk.Frame):
+    """RepoList
+    A list of repositories with a search box. Every repo is indexed by name, description, language and topics
+    as it is added, and searching only detaches and reattaches rows, so the list is never rebuilt while typing.
+    Rows are inserted in chunks, and clicking a column heading sorts by it
+    """
+    repos: Dict[str, Repository]
+    index: SearchIndex[str]
+    search_var: tk.StringVar
+    search_entry: ttk.Entry
+    count_label: ttk.Label
+    tree: ttk.Treeview
+    rows: VirtualTree
+    def __init__(self, master: tk.Misc, **kwargs):
+        super().__init__(master, **kwargs)
+        self.repos = {}
+        self.index = SearchIndex()
+        search_frame = ttk.Frame(self)
+        search_frame.pack(fill=tk.X)
+        ttk.Label(search_frame, text="Search: ").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.search_entry.bind("<Escape>", lambda event: self.search_var.set(""))
+        self.count_label = ttk.Label(search_frame, text="")
+        self.count_label.pack(side=tk.RIGHT)
+        self.search_var.trace_add("write", lambda *args: self.apply_filter())
+        self.tree = ttk.Treeview(self, columns=("name", "description", "language", "stars", "forks"), show="headings")
+        self.tree.heading("name", text="Name")
+        self.tree.heading("description", text="Description")
+        self.tree.heading("language", text="Language")
+        self.tree.heading("stars", text="Stars")
+        self.tree.heading("forks", text="Forks")
+        self.tree.pack(expand=True, fill=tk.BOTH)
+        self.rows = VirtualTree(self.tree)
+        
+    def add_repos(self, repos: List[Repository]):
+        rows = []
+        for repo in repos:
+            iid = repo.full_name
+            if iid in self.repos:
+                continue
+            self.repos[iid] = repo
+            # Topics are part of the listing, so reading them never completes the repo
+            self.index.add(iid, (repo.name, repo.description, repo.language, listed_attribute(repo, "topics", [])))
+            values = (repo.name, repo.description, repo.language, repo.stargazers_count, repo.forks_count)
+            key = (repo.name.lower(), (repo.description or "").lower(), (repo.language or "").lower(), repo.stargazers_count, repo.forks_count)
+            rows.append((iid, values, key))
+        self.rows.add_rows(rows)
+        if self.search_var.get().strip():
+            # The index changed, so the current search is run again over every row
+            self.apply_filter()
+        else:
+            self.update_count()
+            
+    def set_repos(self, repos: List[Repository]):
+        self.rows.clear()
+        self.repos = {}
+        self.index.clear()
+        self.add_repos(repos)
+        
+    def apply_filter(self):
+        self.rows.set_filter(self.index.search(self.search_var.get()))
+        self.update_count()
+        
+    def update_count(self):
+        if self.rows.matches is None:
+            self.count_label.config(text=f"{len(self.rows)} repos")
+        else:
+            self.count_label.config(text=f"{len(self.rows.matches)} / {len(self.rows)} repos")
+            
 class OrgViewer(MinimizableFrame):
     org_name: Optional[str]
     org: Optional[Organization]
     org_repos: List[Repository]
     org_name_label: ttk.Label
-    org_repo_list: ttk.Treeview
+    org_repo_list: RepoList
     
     def __init__(self, master: tk.Misc, org_name: Optional[str] = None, **kwargs):
         super().__init__(master, **kwargs)
@@ -82,34 +196,37 @@ class OrgViewer(MinimizableFrame):
         # self.pack_header(self.org_name_label, side=tk.LEFT, anchor=tk.NW)
         # self.header_widgets.append(self.org_name_label)
         self.org_repos = []
-        self.org_repo_list = ttk.Treeview(self.cf, columns=("name", "description", "language", "stars", "forks"), show="headings")
-        self.org_repo_list.heading("name", text="Name")
-        self.org_repo_list.heading("description", text="Description")
-        self.org_repo_list.heading("language", text="Language")
-        self.org_repo_list.heading("stars", text="Stars")
-        self.org_repo_list.heading("forks", text="Forks")
+        self.org_repo_list = RepoList(self.cf)
         self.org_repo_list.pack(expand=True, fill=tk.BOTH)
         # self.pack_content(self.org_repo_list, expand=True, fill=tk.BOTH)
         self.update_org()
         
     def update_org(self):
         if self.org_name is not None:
-            self.org = get_org(self.org_name)
-            self.org_name_label.config(text=f"Organization: {self.org_name}")
-            self.org_repos = list(self.org.get_repos())
+            org_name = self.org_name
+            self.org_name_label.config(text=f"Organization: {org_name}")
+            self.org_repos = []
             self.update_repos()
+            def load(task: BackgroundTask):
+                self.org = get_org(org_name)
+                for page in iter_pages(self.org.get_repos()):
+                    if not task.post(page):
+                        return
+            self.run_task(load, self.add_repos)
+            
+    def add_repos(self, repos: List[Repository]):
+        self.org_repos.extend(repos)
+        self.org_repo_list.add_repos(repos)
             
     def update_repos(self):
-        self.org_repo_list.delete(*self.org_repo_list.get_children())
-        for repo in self.org_repos:
-            self.org_repo_list.insert("", "end", values=(repo.name, repo.description, repo.language, repo.stargazers_count, repo.forks_count))
+        self.org_repo_list.set_repos(self.org_repos)
             
 class UserViewer(MinimizableFrame):
     user_name: Optional[str]
     user: Optional[User]
     user_repos: List[Repository]
     user_name_label: ttk.Label
-    user_repo_list: ttk.Treeview
+    user_repo_list: RepoList
     
     def __init__(self, master: tk.Misc, user_name: Optional[str] = None, **kwargs):
         super().__init__(master, **kwargs)
@@ -120,50 +237,65 @@ class UserViewer(MinimizableFrame):
         # self.pack_header(self.user_name_label, side=tk.TOP, anchor=tk.NW)
         # self.header_widgets.append(self.user_name_label)
         self.user_repos = []
-        self.user_repo_list = ttk.Treeview(self.cf, columns=("name", "description", "language", "stars", "forks"), show="headings")
-        self.user_repo_list.heading("name", text="Name")
-        self.user_repo_list.heading("description", text="Description")
-        self.user_repo_list.heading("language", text="Language")
-        self.user_repo_list.heading("stars", text="Stars")
-        self.user_repo_list.heading("forks", text="Forks")
+        self.user_repo_list = RepoList(self.cf)
         self.user_repo_list.pack(expand=True, fill=tk.BOTH)
         # self.pack_content(self.user_repo_list, expand=True, fill=tk.BOTH)
         self.update_user()
         
     def update_user(self):
         if self.user_name is not None:
-            user = get_user(self.user_name)
-            if user is not None:
+            user_name = self.user_name
+            self.user_name_label.config(text=f"User: {user_name}")
+            self.user_repos = []
+            self.update_repos()
+            def load(task: BackgroundTask):
+                user = get_user(user_name)
+                if user is None:
+                    return
                 self.user = user
-                self.user_repos = list(user.get_repos())
-                self.user_name_label.config(text=f"User: {self.user_name}")
-                self.update_repos()
+                for page in iter_pages(user.get_repos()):
+                    if not task.post(page):
+                        return
+            self.run_task(load, self.add_repos)
+            
+    def add_repos(self, repos: List[Repository]):
+        self.user_repos.extend(repos)
+        self.user_repo_list.add_repos(repos)
             
     def update_repos(self):
-        self.user_repo_list.delete(*self.user_repo_list.get_children())
-        for repo in self.user_repos:
-            self.user_repo_list.insert("", "end", values=(repo.name, repo.description, repo.language, repo.stargazers_count, repo.forks_count))
+        self.user_repo_list.set_repos(self.user_repos)
+            
+def file_sort_key(name: str, content_type: str, size: Union[int, str], last_modified: Optional[str])->Tuple[str, str, int, str]:
+    # Sizes that are not loaded yet sort before every size, dates are ISO strings that sort as dates
+    return (name.lower(), content_type, size if isinstance(size, int) else -1, last_modified or "")
             
 class RepoViewer(MinimizableFrame):
     repo_name: Optional[str]
     repo: Optional[Repository]
-    repo_structure: Optional[RepoStructureType]
-    structure_stats: Dict[str, Tuple[int, int, Optional[str]]]
+    listings: BoundedCache[str, List[ContentFile]]
+    details: BoundedCache[str, Dict[str, Tuple[int, Optional[str]]]]
+    tree_shas: Dict[str, str]
     current_path: str
+    prefetch_limit: int
+    prefetch_task: Optional[BackgroundTask]
     back_button: ttk.Button
     repo_name_label: ttk.Label
     repo_file_tree: ttk.Treeview
+    rows: VirtualTree
     
-    def __init__(self, master: tk.Misc, repo_name: Optional[str] = None, **kwargs):
+    def __init__(self, master: tk.Misc, repo_name: Optional[str] = None, cache_size: int = 256, prefetch_limit: int = 16, **kwargs):
         super().__init__(master, **kwargs)
         self.repo_name = repo_name
         self.repo = None
-        self.repo_structure = None
+        self.listings = BoundedCache(cache_size)
+        self.details = BoundedCache(cache_size)
+        self.tree_shas = {}
+        self.prefetch_limit = prefetch_limit
+        self.prefetch_task = None
         self.repo_name_label = ttk.Label(self.hf, text="Repository: ")
         self.repo_name_label.pack(side=tk.LEFT, anchor=tk.NW)
         # self.pack_header(self.repo_name_label, side=tk.TOP, anchor=tk.NW)
         # self.header_widgets.append(self.repo_name_label)
-        self.structure_stats = {}
         self.current_path = ""
         self.back_button = ttk.Button(self.cf, text="Back", command=self.back)
         self.back_button.pack()
@@ -177,6 +309,7 @@ class RepoViewer(MinimizableFrame):
         self.repo_file_tree.column("date-modified", width=150)
         self.repo_file_tree.pack(expand=True, fill=tk.BOTH)
         # self.pack_content(self.repo_file_tree, expand=True, fill=tk.BOTH)
+        self.rows = VirtualTree(self.repo_file_tree)
         self.setup_bindings()
         self.update_repo()
         
@@ -189,25 +322,137 @@ class RepoViewer(MinimizableFrame):
         
     def update_repo(self):
         if self.repo_name is not None:
-            self.repo = get_repo(self.repo_name)
-            self.repo_name_label.config(text=f"Repository: {self.repo_name}")
-            self.repo_structure = get_repo_structure(self.repo)
-            self.show_root()
+            repo_name = self.repo_name
+            self.repo_name_label.config(text=f"Repository: {repo_name}")
+            self.repo = None
+            self.listings.clear()
+            self.details.clear()
+            self.tree_shas = {}
+            self.current_path = ""
+            self.cancel_prefetch()
+            self.rows.clear()
+            def load(task: BackgroundTask):
+                repo = get_repo(repo_name)
+                task.post((repo, fetch_repo_dir(repo, "")))
+            self.run_task(load, self.on_repo_loaded)
             
-    def pathto(self, path: str)->Union[ContentFile, RepoStructureType, None]:
-        cur_dir = self.repo_structure
-        for part in path.split("/"):
-            if not part:
-                continue
-            if isinstance(cur_dir, dict):
-                cur_dir = cur_dir[part]
+    def on_repo_loaded(self, result: Tuple[Repository, List[ContentFile]]):
+        self.repo, listing = result
+        self.store_listing("", listing)
+        self.show_root()
+        
+    def store_listing(self, path: str, listing: List[ContentFile]):
+        self.listings.put(path, listing)
+        for content in listing:
+            if content.type == "dir":
+                self.tree_shas[content.path] = content.sha
+            
+    def on_listing_loaded(self, path: str, listing: List[ContentFile]):
+        self.store_listing(path, listing)
+        if path == self.current_path:
+            self.show_structure(path)
+            
+    def on_details_loaded(self, path: str, details: Dict[str, Tuple[int, Optional[str]]]):
+        self.details.put(path, details)
+        if path != self.current_path:
+            return
+        rows = []
+        for name, (size, last_modified) in details.items():
+            values = self.rows.values.get(name)
+            if values is not None:
+                rows.append((name, (name, values[1], size, last_modified or ""), file_sort_key(name, values[1], size, last_modified)))
+        # Moves the rows if the list is sorted by size or date
+        self.rows.add_rows(rows)
+                
+    def get_subtree_stats(self, content: ContentFile)->Tuple[int, int]:
+        """get_subtree_stats
+        Get the total size and number of files in a directory. Makes requests, so only call from a worker
+        """
+        if self.repo is None:
+            raise ValueError("No repository loaded")
+        return get_subtree_stats(self.repo, content.sha)
+    
+    def load_details(self, path: str, listing: List[ContentFile])->Dict[str, Tuple[int, Optional[str]]]:
+        """load_details
+        Get the size and last modified date of every entry of a directory. Makes requests, so only call from a worker.
+        All dates come from one batched history query, and all subdirectory sizes from one recursive tree of the directory
+        """
+        if self.repo is None:
+            raise ValueError("No repository loaded")
+        if path in self.tree_shas:
+            # Warms the stats of every subdirectory at once
+            get_subtree_stats(self.repo, self.tree_shas[path])
+        dates = get_last_modified_batch(self.repo, [content.path for content in listing])
+        details = {}
+        for content in listing:
+            if content.type == "dir":
+                size, _ = self.get_subtree_stats(content)
             else:
-                raise ValueError(f"Path {path} is invalid for structure {cur_dir}")
-        return cur_dir
+                size = content.size
+            details[content.name] = (size, dates.get(content.path))
+        return details
+    
+    def request_details(self, path: str, listing: List[ContentFile]):
+        def load(task: BackgroundTask):
+            task.post(self.load_details(path, listing))
+        self.run_task(load, lambda details: self.on_details_loaded(path, details))
             
     def navigate(self, path: str):
         self.current_path = path
-        self.show_structure(path)
+        self.cancel_prefetch()
+        if path in self.listings:
+            self.cancel_task()
+            self.show_structure(path)
+            return
+        # Not opened before (or evicted), load it in the background
+        repo = self.repo
+        if repo is None:
+            return
+        self.rows.clear()
+        def load(task: BackgroundTask):
+            listing = fetch_repo_dir(repo, path)
+            if task.post(("listing", listing)):
+                task.post(("details", self.load_details(path, listing)))
+        def on_result(result: Tuple[str, Any]):
+            kind, value = result
+            if kind == "listing":
+                self.on_listing_loaded(path, value)
+            else:
+                self.on_details_loaded(path, value)
+        self.run_task(load, on_result)
+        
+    def prefetch(self, listing: List[ContentFile]):
+        """prefetch
+        Load the listings of the subdirectories shown in the current directory in the background,
+        so that opening them is instant
+        """
+        self.cancel_prefetch()
+        repo = self.repo
+        if repo is None:
+            return
+        subdirs = [content.path for content in listing if content.type == "dir" and content.path not in self.listings]
+        subdirs = subdirs[:self.prefetch_limit]
+        if not subdirs:
+            return
+        def load(task: BackgroundTask):
+            for path in subdirs:
+                if task.cancelled:
+                    return
+                if not task.post((path, fetch_repo_dir(repo, path))):
+                    return
+        def store(result: Tuple[str, List[ContentFile]]):
+            self.store_listing(*result)
+        self.prefetch_task = BackgroundTask(self, load, store).start()
+        
+    def cancel_prefetch(self):
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+            
+    def on_destroy(self, event):
+        super().on_destroy(event)
+        if event.widget is self:
+            self.cancel_prefetch()
         
     def back(self):
         if self.current_path:
@@ -219,13 +464,20 @@ class RepoViewer(MinimizableFrame):
         else:
             self.show_root()
             
-    def on_double_click(self, event):
-        item = self.repo_file_tree.selection()[0]
-        path = self.repo_file_tree.item(item, "values")[0]
+    def selected_dir(self)->Optional[str]:
+        selection = self.repo_file_tree.selection()
+        if not selection:
+            return None
+        name, content_type = self.repo_file_tree.item(selection[0], "values")[:2]
+        if content_type != "dir":
+            return None
         if self.current_path:
-            path = f"{self.current_path}/{path}"
-        destination = self.pathto(path)
-        if not destination or isinstance(destination, ContentFile):
+            return f"{self.current_path}/{name}"
+        return name
+            
+    def on_double_click(self, event):
+        path = self.selected_dir()
+        if path is None:
             return
         self.navigate(path)
         
@@ -233,55 +485,38 @@ class RepoViewer(MinimizableFrame):
         self.back()
         
     def on_open(self, event):
-        item = self.repo_file_tree.selection()[0]
-        path = self.repo_file_tree.item(item, "values")[0]
-        if self.current_path:
-            path = f"{self.current_path}/{path}"
-        destination = self.pathto(path)
-        if not destination or isinstance(destination, ContentFile):
+        path = self.selected_dir()
+        if path is None:
             return
         self.navigate(path)
             
     def show_root(self):
-        if self.repo_structure is not None:
-            self.show_structure("")
-            
-    def get_subtree_stats(self, key: str, subtree: RepoStructureType)->Tuple[int, int, Optional[str]]:
-        if key in self.structure_stats:
-            return self.structure_stats[key]
-        last_modified = None
-        total_size = 0
-        total_files = 0
-        for name, content in subtree.items():
-            if isinstance(content, ContentFile):
-                total_size += content.size
-                total_files += 1
-                if content.last_modified is not None:
-                    if not last_modified or content.last_modified > last_modified:
-                        last_modified = content.last_modified
-            else:
-                subtree_size, subtree_files, subtree_last_modified = self.get_subtree_stats(f"{key}/{name}", content)
-                total_size += subtree_size
-                total_files += subtree_files
-                if subtree_last_modified is not None:
-                    if not last_modified or subtree_last_modified > last_modified:
-                        last_modified = subtree_last_modified
-        self.structure_stats[key] = (total_size, total_files, last_modified)
-        return total_size, total_files, last_modified
+        if self.repo is not None:
+            self.navigate("")
             
     def show_structure(self, path: str):
-        self.repo_file_tree.delete(*self.repo_file_tree.get_children())
-        cur_dir = self.pathto(path)
-        if isinstance(cur_dir, dict):
-            for name, content in cur_dir.items():
-                if isinstance(content, ContentFile):
-                    self.repo_file_tree.insert("", "end", values=(name, content.type, content.size, content.last_modified))
-                else:
-                    subtree_size, subtree_files, subtree_last_modified = self.get_subtree_stats(f"{path}/{name}", content)
-                    self.repo_file_tree.insert("", "end", values=(name, "dir", subtree_size, subtree_last_modified))
-        else:
-            raise ValueError(f"Path {path} is invalid for structure {cur_dir}")
+        listing = self.listings.get(path)
+        if listing is None:
+            raise ValueError(f"Path {path} has not been loaded")
+        details = self.details.get(path)
+        self.rows.clear()
+        rows = []
+        for content in listing:
+            size, last_modified = ("", None)
+            if details is not None and content.name in details:
+                size, last_modified = details[content.name]
+            elif content.type != "dir":
+                size = content.size
+            rows.append((
+                content.name,
+                (content.name, content.type, size, last_modified or ""),
+                file_sort_key(content.name, content.type, size, last_modified)
+            ))
+        self.rows.add_rows(rows)
         self.current_path = path
+        if details is None and (self.task is None or self.task.finished):
+            self.request_details(path, listing)
+        self.prefetch(listing)
                     
             
             
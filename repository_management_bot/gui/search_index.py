@@ -0,0 +1,143 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar, Generic, Iterable, Sequence
+import re
+
+"""
+search_index.py
+An in-memory index for searching rows as the user types, without any Tk code.
+Every word of the indexed text is split into trigrams, and its first one or two characters are kept as prefixes,
+so a search term only has to look at the rows that share its rarest trigram (or its prefix, if it is shorter).
+Typing more characters only narrows the previous result, which is filtered instead of searched again.
+"""
+
+K = TypeVar("K")
+
+NGRAM = 3
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+def split_words(text: str)->List[str]:
+    """## split_words
+    lowercase text and split it into words. names like `repo-management_bot.py` are split on their separators
+    """
+    return WORD_RE.findall(text.lower())
+
+def ngrams(word: str)->Set[str]:
+    return {word[i:i + NGRAM] for i in range(len(word) - NGRAM + 1)}
+
+class SearchIndex(Generic[K]):
+    """## SearchIndex
+    Find rows whose text contains every term of a query.
+    <br> Each term matches inside words (`mgmt` finds `repo-mgmt-bot`), terms of one or two characters match the start of words.
+    """
+    texts: Dict[K, str]
+    grams: Dict[str, Set[K]]
+    prefixes: Dict[str, Set[K]]
+    last_query: Optional[Tuple[str, ...]]
+    last_result: Set[K]
+    def __init__(self):
+        self.texts = {}
+        self.grams = {}
+        self.prefixes = {}
+        self.last_query = None
+        self.last_result = set()
+
+    def add(self, key: K, fields: Iterable[Any]):
+        """## add
+        index a row. a row that is already indexed is replaced
+
+        ### Parameters:
+        - `key: K` - the row, e.g. a Treeview item id
+        - `fields: Iterable[Any]` - the searchable values of the row. None values are skipped, lists are joined
+        """
+        if key in self.texts:
+            self.remove(key)
+        parts = []
+        for field in fields:
+            if field is None:
+                continue
+            parts.append(" ".join(map(str, field)) if isinstance(field, (list, tuple)) else str(field))
+        words = split_words(" ".join(parts))
+        # Words are joined with a space, so a term can not match across two words
+        self.texts[key] = " ".join(words)
+        for word in set(words):
+            for gram in ngrams(word):
+                self.grams.setdefault(gram, set()).add(key)
+            for length in range(1, NGRAM):
+                self.prefixes.setdefault(word[:length], set()).add(key)
+        self.last_query = None
+
+    def remove(self, key: K):
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for word in set(text.split()):
+            for gram in ngrams(word):
+                self.grams[gram].discard(key)
+            for length in range(1, NGRAM):
+                self.prefixes[word[:length]].discard(key)
+        self.last_query = None
+
+    def clear(self):
+        self.texts.clear()
+        self.grams.clear()
+        self.prefixes.clear()
+        self.last_query = None
+        self.last_result = set()
+
+    def candidates(self, term: str)->Set[K]:
+        if len(term) < NGRAM:
+            return self.prefixes.get(term, set())
+        grams = sorted((self.grams.get(gram, set()) for gram in ngrams(term)), key=len)
+        return grams[0]
+
+    def matches(self, key: K, terms: Sequence[str])->bool:
+        text = self.texts[key]
+        for term in terms:
+            if len(term) < NGRAM:
+                if not (text.startswith(term) or f" {term}" in text):
+                    return False
+            elif term not in text:
+                return False
+        return True
+
+    def search(self, query: str)->Optional[Set[K]]:
+        """## search
+        find the rows that match every term of a query
+
+        ### Parameters:
+        - `query: str` - the search text, e.g. `python api`
+
+        ### Returns:
+        - `Optional[Set[K]]` - the matching rows, None if the query is empty (every row matches)
+        """
+        terms = tuple(split_words(query))
+        if not terms:
+            self.last_query = None
+            return None
+        if self.last_query is not None and narrows(self.last_query, terms):
+            # Typing on: every match is one of the previous matches
+            pool: Iterable[K] = self.last_result
+        else:
+            pool = min((self.candidates(term) for term in terms), key=len)
+        result = {key for key in pool if self.matches(key, terms)}
+        self.last_query = terms
+        self.last_result = result
+        return result
+
+    def __len__(self)->int:
+        return len(self.texts)
+
+def narrows(previous: Tuple[str, ...], terms: Tuple[str, ...])->bool:
+    """## narrows
+    check whether every row that matches `terms` also matches `previous`
+    """
+    if len(terms) < len(previous):
+        return False
+    for old, term in zip(previous, terms):
+        if len(old) >= NGRAM:
+            if old not in term:
+                return False
+        # A short term matches the start of a word, which a longer term (matching anywhere) does not imply
+        elif len(term) >= NGRAM or not term.startswith(old):
+            return False
+    return True
@@ -0,0 +1,194 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar, Iterable
+import tkinter as tk
+from tkinter import ttk
+
+"""
+virtual_tree.py
+Fill a flat ttk.Treeview with many rows without blocking Tk.
+Rows are kept as plain tuples, and only turned into Treeview items when they are about to be seen:
+the first rows of a list are inserted in chunks over several event loop ticks, and further rows
+only once the user scrolls near the end of what is already there.
+Sorting and filtering reorder the tuples, then reattach the items that already exist with one call.
+"""
+
+# Rows inserted per event loop tick
+CHUNK_ROWS = 200
+# Rows materialized before the user scrolls; scrolling past WINDOW_GROW_AT of them materializes WINDOW_ROWS more
+WINDOW_ROWS = 1000
+WINDOW_GROW_AT = 0.9
+SORT_ARROWS = {False: " ▲", True: " ▼"}
+
+RowValues = Tuple[Any, ...]
+SortKey = Tuple[Any, ...] # One value per column, compared when sorting by that column
+
+class VirtualTree:
+    """## VirtualTree
+    Manage the rows of a flat ttk.Treeview: chunked insertion, on-demand materialization,
+    sorting by column (clicking a heading) and filtering.
+    <br> Every row has its values and a precomputed sort key, so sorting never reads the objects behind the rows.
+    """
+    tree: ttk.Treeview
+    columns: Tuple[str, ...]
+    headings: Dict[str, str]
+    values: Dict[str, RowValues]
+    keys: Dict[str, SortKey]
+    order: List[str] # Every row, in the order it was added
+    created: Set[str] # Rows that are Treeview items
+    matches: Optional[Set[str]] # None when not filtering
+    sort_column: Optional[str]
+    sort_reverse: bool
+    view: List[str] # The rows to show, sorted and filtered
+    window: int
+    attached: int # view[:attached] are attached to the Treeview, in order
+    reattached: int # Every row of view[:reattached] that already existed was reattached by show
+    fill_job: Optional[str]
+    def __init__(self, tree: ttk.Treeview):
+        self.tree = tree
+        self.columns = tuple(tree["columns"])
+        self.headings = {column: tree.heading(column, "text") for column in self.columns}
+        for column in self.columns:
+            tree.heading(column, command=lambda column=column: self.sort_by(column))
+        tree.configure(yscrollcommand=self.on_scroll)
+        self.values = {}
+        self.keys = {}
+        self.order = []
+        self.created = set()
+        self.matches = None
+        self.sort_column = None
+        self.sort_reverse = False
+        self.view = []
+        self.window = WINDOW_ROWS
+        self.attached = 0
+        self.reattached = 0
+        self.fill_job = None
+
+    def add_rows(self, rows: Iterable[Tuple[str, RowValues, SortKey]]):
+        """## add_rows
+        add rows at the end (or in their sorted place). rows that already exist are updated instead,
+        and moved if their sort key changed
+
+        ### Parameters:
+        - `rows: Iterable[Tuple[str, RowValues, SortKey]]` - the item id, values and sort key of every row
+        """
+        added = []
+        resort = False
+        for iid, values, key in rows:
+            if iid in self.values:
+                resort = resort or self.keys[iid] != key
+                self.update_row(iid, values, key)
+                continue
+            self.values[iid] = values
+            self.keys[iid] = key
+            self.order.append(iid)
+            added.append(iid)
+        if self.sort_column is not None:
+            if added or resort:
+                self.refresh()
+        elif added:
+            # Only new rows are appended to the view, the rows already shown stay as they are
+            self.view.extend(iid for iid in added if self.matches is None or iid in self.matches)
+            self.schedule_fill()
+
+    def update_row(self, iid: str, values: RowValues, key: Optional[SortKey] = None):
+        if iid not in self.values:
+            return
+        self.values[iid] = values
+        if key is not None:
+            self.keys[iid] = key
+        if iid in self.created:
+            self.tree.item(iid, values=values)
+
+    def clear(self):
+        """## clear
+        remove every row. the sort column is kept
+        """
+        self.cancel_fill()
+        self.tree.delete(*self.created)
+        self.values = {}
+        self.keys = {}
+        self.order = []
+        self.created = set()
+        self.matches = None
+        self.view = []
+        self.window = WINDOW_ROWS
+        self.attached = 0
+        self.reattached = 0
+
+    def set_filter(self, matches: Optional[Set[str]]):
+        """## set_filter
+        only show some rows
+
+        ### Parameters:
+        - `matches: Optional[Set[str]]` - the item ids to show, None to show every row
+        """
+        self.matches = matches
+        self.refresh()
+
+    def sort_by(self, column: str):
+        """## sort_by
+        sort the rows by a column. sorting by the same column again reverses the order
+        """
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        for name in self.columns:
+            arrow = SORT_ARROWS[self.sort_reverse] if name == column else ""
+            self.tree.heading(name, text=self.headings[name] + arrow)
+        self.refresh()
+
+    def refresh(self):
+        rows = list(self.order) if self.matches is None else [iid for iid in self.order if iid in self.matches]
+        if self.sort_column is not None:
+            index = self.columns.index(self.sort_column)
+            keys = self.keys
+            rows = sorted(rows, key=lambda iid: keys[iid][index], reverse=self.sort_reverse)
+        self.show(rows)
+
+    def show(self, view: List[str]):
+        self.cancel_fill()
+        self.view = view
+        # Rows that already exist are reattached in one call; the rest are inserted in between over the next ticks
+        limit = min(len(view), self.window)
+        self.tree.set_children("", *[iid for iid in view[:limit] if iid in self.created])
+        self.reattached = limit
+        self.attached = 0
+        while self.attached < limit and view[self.attached] in self.created:
+            self.attached += 1
+        self.schedule_fill()
+
+    def schedule_fill(self):
+        if self.fill_job is None and self.attached < min(len(self.view), self.window):
+            self.fill_job = self.tree.after_idle(self.fill)
+
+    def cancel_fill(self):
+        if self.fill_job is not None:
+            self.tree.after_cancel(self.fill_job)
+            self.fill_job = None
+
+    def fill(self):
+        self.fill_job = None
+        end = min(len(self.view), self.window, self.attached + CHUNK_ROWS)
+        for index in range(self.attached, end):
+            iid = self.view[index]
+            if iid in self.created:
+                if index >= self.reattached:
+                    # Beyond the rows show reattached, after the window grew
+                    self.tree.move(iid, "", index)
+            else:
+                self.tree.insert("", index, iid=iid, values=self.values[iid])
+                self.created.add(iid)
+        self.attached = end
+        if self.attached < min(len(self.view), self.window):
+            # Yield to Tk between chunks, so the list stays responsive while it fills
+            self.fill_job = self.tree.after(1, self.fill)
+
+    def on_scroll(self, first: str, last: str):
+        if float(last) >= WINDOW_GROW_AT and self.window < len(self.view) and self.attached >= self.window:
+            self.window += WINDOW_ROWS
+            self.schedule_fill()
+
+    def __len__(self)->int:
+        return len(self.order)
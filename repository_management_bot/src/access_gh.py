@@ -1,44 +1,283 @@
 from .includes import *
-from github import Github
+from github import Github, Auth
+from github.GithubRetry import GithubRetry
+from .lazy_guard import get_repo_fields, listed_attribute
+from .caching import transient_cache, register_cache_key, register_persistent_type
+from .adv_wrap import ReturnType
+from .profiling import profiled
+from .token_pool import TokenPool, parse_credentials
+from functools import wraps
+from .metrics import GITHUB_REQUESTS, GITHUB_REQUEST_SECONDS, RATE_LIMIT_REMAINING, RATE_LIMIT_RESET, CREDENTIAL_REMAINING, register_collector
+import time
+from github.Requester import Requester
+from typing import TypedDict
+from urllib.parse import urlparse
 
-@cache
-def get_auth()->str:
+DEFAULT_BASE_URL = "https://api.github.com"
+
+ClientConfig = TypedDict(
+    "ClientConfig", # Settings for the shared GitHub client
+    {
+        "base_url": str,
+        "per_page": int,
+        "pool_size": int,
+        "timeout": int,
+        "retries": int,
+        "backoff": float,
+        "workers": int,
+        "credentials": str
+    }
+)
+CLIENT_CONFIG: ClientConfig = {
+    "base_url": DEFAULT_BASE_URL,
+    "per_page": 100, # The API maximum, 30 is the PyGithub default
+    "pool_size": 10,
+    "timeout": 15,
+    "retries": 5,
+    "backoff": 0.5,
+    "workers": 1,
+    "credentials": "gh"
+}
+
+def configure_client(
+    base_url: Optional[str] = None,
+    per_page: Optional[int] = None,
+    pool_size: Optional[int] = None,
+    timeout: Optional[int] = None,
+    retries: Optional[int] = None,
+    backoff: Optional[float] = None,
+    workers: Optional[int] = None,
+    credentials: Optional[str] = None
+)->ClientConfig:
+    """configure_client
+    Configure the GitHub client shared by the whole bot. Settings that are not provided are kept.
+    Clients made after this call use the new settings.
+    
+    args:
+        base_url: Optional[str] - the API root, for GitHub Enterprise ("https://host/api/v3") or a local stand-in
+        per_page: Optional[int] - the page size for listings (max 100)
+        pool_size: Optional[int] - the number of kept-alive HTTP connections. Defaults to the number of workers
+        timeout: Optional[int] - the request timeout, in seconds
+        retries: Optional[int] - how many times a failed or rate limited request is retried
+        backoff: Optional[float] - the backoff factor between retries, in seconds
+        workers: Optional[int] - the number of concurrent workers that will share the client
+        credentials: Optional[str] - the credentials to spread requests over (see token_pool.py)
+    returns:
+        ClientConfig - the resulting configuration
+    """
+    if base_url is not None:
+        CLIENT_CONFIG["base_url"] = base_url.rstrip("/")
+    if per_page is not None:
+        CLIENT_CONFIG["per_page"] = max(1, min(per_page, 100))
+    if timeout is not None:
+        CLIENT_CONFIG["timeout"] = timeout
+    if retries is not None:
+        CLIENT_CONFIG["retries"] = retries
+    if backoff is not None:
+        CLIENT_CONFIG["backoff"] = backoff
+    if workers is not None:
+        CLIENT_CONFIG["workers"] = max(1, workers)
+    if credentials is not None:
+        CLIENT_CONFIG["credentials"] = credentials
+    if pool_size is not None:
+        CLIENT_CONFIG["pool_size"] = pool_size
+    elif workers is not None:
+        # One kept-alive connection per worker, so workers never wait on the pool
+        CLIENT_CONFIG["pool_size"] = max(CLIENT_CONFIG["pool_size"], CLIENT_CONFIG["workers"])
+    return CLIENT_CONFIG
+
+def get_hostname()->Optional[str]:
+    """get_hostname
+    Get the hostname to use with the GitHub CLI, None for github.com
+    """
+    if CLIENT_CONFIG["base_url"] == DEFAULT_BASE_URL:
+        return None
+    return urlparse(CLIENT_CONFIG["base_url"]).hostname
+
+@transient_cache
+@profiled("auth")
+def get_auth(hostname: Optional[str] = None)->str:
     # Query gh for the token
     cmd = "gh auth token"
+    if hostname is not None:
+        cmd += f" --hostname {hostname}"
     token = os.popen(cmd).read().strip()
     return token
 
-@cache
+@transient_cache
+@profiled("auth")
+def make_token_pool(credentials: str, base_url: str)->TokenPool:
+    """make_token_pool
+    Build the pool of credentials that requests are spread over. Pools are shared per set of credentials
+    
+    returns:
+        TokenPool - the pool
+    """
+    pool = TokenPool(parse_credentials(credentials, lambda: get_auth(get_hostname())), base_url)
+    if len(pool) > 1 or any(credential.kind == "app" for credential in pool.credentials):
+        pool.start_refresher()
+    return pool
+
+def get_token_pool()->TokenPool:
+    return make_token_pool(CLIENT_CONFIG["credentials"], CLIENT_CONFIG["base_url"])
+
+def writes_to_repo(func: Callable[..., ReturnType])->Callable[..., ReturnType]:
+    """writes_to_repo
+    Decorator for functions that write to the repo given as their first argument. Every request they make
+    (permissions, fork, branch, push, PR) is sent as the credential that writes to that repo
+    """
+    @wraps(func)
+    def wrapped(repo: Repository, *args: Any, **kwargs: Any)->ReturnType:
+        with get_token_pool().writing(repo.full_name):
+            return func(repo, *args, **kwargs)
+    return wrapped
+
+@transient_cache
+@profiled("auth")
+def make_Github(pool: TokenPool, base_url: str, per_page: int, pool_size: int, timeout: int, retries: int, backoff: float)->Github:
+    """make_Github
+    Build a GitHub client. Clients are shared per set of settings
+    
+    returns:
+        Github - the client
+    """
+    retry = GithubRetry(total=retries, backoff_factor=backoff)
+    return Github(
+        auth=pool.auth if pool.usable() else None,
+        base_url=base_url,
+        per_page=per_page,
+        pool_size=pool_size,
+        timeout=timeout,
+        retry=retry
+    )
+
 def get_Github()->Github:
-    token = get_auth()
-    return Github(token)
+    config = CLIENT_CONFIG
+    return make_Github(
+        get_token_pool(), 
+        config["base_url"], 
+        config["per_page"], 
+        config["pool_size"], 
+        config["timeout"], 
+        config["retries"], 
+        config["backoff"]
+    )
+
+@transient_cache
+def get_identity_user(credential: str)->User:
+    with get_token_pool().pinned():
+        # Complete the authenticated user up front, rather than on the first lazy attribute access
+        return get_Github().get_user().complete()
 
-@cache
 def get_user(name: Optional[str] = None)->User:
+    """get_user
+    Get a user by name, or the authenticated user (of the credential requests are pinned to, or the first one)
+    """
     if name is None:
-        return get_Github().get_user()
+        return get_identity_user(get_token_pool().identity().name)
     return get_Github().get_user(name)
 
+# Cache entries for the same repo or file are shared, whichever listing the object came from.
+# The push time is part of the key, so entries loaded from a saved cache are not used once the repo was pushed to
+register_cache_key(Repository, lambda repo: (
+    listed_attribute(repo, "full_name") or repo.full_name, listed_attribute(repo, "node_id"), listed_attribute(repo, "pushed_at")
+))
+register_cache_key(ContentFile, lambda content: (content.sha, content.path))
+# Saved caches never contain the token; objects loaded from them use the current client
+register_persistent_type(Requester, "requester", lambda: get_Github().requester)
+
+def endpoint_label(url: str)->str:
+    """endpoint_label
+    Reduce a request URL to its endpoint, without owner, repo or file names, so metrics stay a bounded set
+    """
+    path = urlparse(url).path
+    prefix = urlparse(CLIENT_CONFIG["base_url"]).path.rstrip("/")
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    parts = [part for part in path.split("/") if part]
+    if not parts:
+        return "/"
+    if parts[0] == "repos" and len(parts) >= 3:
+        return "/repos/{owner}/{repo}" + (f"/{parts[3]}" if len(parts) > 3 else "")
+    if parts[0] in ("orgs", "users") and len(parts) >= 2:
+        return f"/{parts[0]}/{{name}}" + (f"/{parts[2]}" if len(parts) > 2 else "")
+    if parts[0] in ("user", "search") and len(parts) >= 2:
+        return f"/{parts[0]}/{parts[1]}"
+    return f"/{parts[0]}"
+
+_original_request_raw: Optional[Callable[..., Any]] = None
+
+def enable_request_metrics():
+    """enable_request_metrics
+    Count every GitHub request by endpoint and status, and track the rate limit headers, for the metrics endpoint
+    """
+    global _original_request_raw
+    if _original_request_raw is not None:
+        return
+    original = Requester._Requester__requestRaw # type: ignore
+    _original_request_raw = original
+    def measured_request_raw(self: Requester, cnx: Any, verb: str, url: str, *args: Any, **kwargs: Any)->Tuple[int, Dict[str, Any], Any]:
+        start = time.perf_counter()
+        endpoint = endpoint_label(url)
+        try:
+            status, headers, output = original(self, cnx, verb, url, *args, **kwargs)
+        except Exception:
+            GITHUB_REQUESTS.inc(verb, endpoint, "error")
+            raise
+        GITHUB_REQUEST_SECONDS.observe(endpoint, value=time.perf_counter() - start)
+        GITHUB_REQUESTS.inc(verb, endpoint, str(status))
+        resource = headers.get("x-ratelimit-resource", "core")
+        if "x-ratelimit-remaining" in headers:
+            RATE_LIMIT_REMAINING.set(resource, value=float(headers["x-ratelimit-remaining"]))
+        if "x-ratelimit-reset" in headers:
+            RATE_LIMIT_RESET.set(resource, value=float(headers["x-ratelimit-reset"]))
+        return status, headers, output
+    Requester._Requester__requestRaw = measured_request_raw # type: ignore
+
+def collect_credentials():
+    # Only pools that exist are read, so scraping never creates one (and runs gh)
+    for pool in list(make_token_pool.cache.entries.values()):
+        for name, stats in pool.stats().items():
+            CREDENTIAL_REMAINING.set(name, value=stats["remaining"])
+
+register_collector(collect_credentials)
+
 @cache
 def get_org(org: str)->Organization:
     return get_Github().get_organization(org)
 
 @cache
 def get_user_orgs(name: Optional[str] = None)->List[Organization]:
-    return list(get_user(name).get_orgs())
+    # /user/orgs depends on who is asking, so the whole listing is sent as one credential
+    with get_token_pool().pinned():
+        return list(get_user(name).get_orgs())
 
 @cache
+@profiled("listing")
 def get_user_repos(name: Optional[str] = None)->List[Repository]:
-    return list(get_user(name).get_repos())
+    with get_token_pool().pinned():
+        return list(get_user(name).get_repos())
 
 @cache
 def get_user_repo(repo: str, user: Optional[str] = None)->Repository:
     return get_user(user).get_repo(repo)
 
 @cache
+@profiled("listing")
 def get_org_repos(org: str)->List[Repository]:
     return list(get_Github().get_organization(org).get_repos())
 
+@cache
+def search_code(query: str)->Tuple[int, List[ContentFile]]:
+    """search_code
+    Run a code search and fetch every result GitHub will return (at most 1000)
+
+    returns:
+        Tuple[int, List[ContentFile]] - the total number of matches, and the matching files
+    """
+    results = get_Github().search_code(query)
+    return results.totalCount, list(results)
+
 @cache
 def get_org_repo(org: str, repo: str)->Repository:
     return get_Github().get_organization(org).get_repo(repo)
@@ -74,7 +313,7 @@ def get_repo_branches(repo: Repository)->List[Branch]:
 
 @cache
 def get_repo_main_branch(repo: Repository)->Branch:
-    return repo.get_branch(repo.default_branch)
+    return repo.get_branch(get_repo_fields(repo)["default_branch"])
 
 @cache
 def get_repo_main_dir(repo: Repository)->List[ContentFile]:
@@ -85,14 +324,25 @@ def contentfile_isdir(cf: ContentFile)->bool:
 @cache
 def contentfile_isfile(cf: ContentFile)->bool:
     return cf.type == "file"
-@cache
-def get_repo_dir(repo: Repository, dir: str)->List[ContentFile]:
+def fetch_repo_dir(repo: Repository, dir: str)->List[ContentFile]:
+    """fetch_repo_dir
+    List a directory of a repository, without caching the result
+    
+    args:
+        repo: Repository - the repository to list
+        dir: str - the path of the directory, "" for the root
+    returns:
+        List[ContentFile] - the contents of the directory
+    """
     content = repo.get_contents(dir)
     if isinstance(content, ContentFile):
         return [content]
     else:
         return content
 @cache
+def get_repo_dir(repo: Repository, dir: str)->List[ContentFile]:
+    return fetch_repo_dir(repo, dir)
+@cache
 def get_repo_file(repo: Repository, file: str)->ContentFile:
     content = repo.get_contents(file)
     if isinstance(content, ContentFile):
@@ -0,0 +1,228 @@
+from .includes import *
+from typing import Iterable, Iterator
+import hashlib
+import shutil
+import subprocess
+import urllib.request
+
+from . import mirror_cache
+from .access_gh import CLIENT_CONFIG, get_token_pool
+from .git_backend import git_auth_env
+from .lazy_guard import get_repo_fields
+from .local_repo import LocalRepository, file_blob_sha
+from .repo_detail import StructureSource
+
+"""
+blob_spool.py
+Stream template files to disk, so files of any size are copied into PRs with bounded memory.
+Blobs are downloaded raw (not as base64 JSON, and without the 1 MB limit of the Contents API) in chunks, into a
+content-addressed spool next to the mirrors, and verified against their SHA. Every template blob is downloaded once
+and then copied into the worktree of each PR that needs it.
+Git LFS pointers are resolved to the object they point to, through the LFS batch API, when the target repo
+also stores the file in LFS; otherwise the pointer is copied as it is, like the template has it.
+
+    clones/
+        blobs/<sha[:2]>/<sha>          - git blobs of template files, by blob SHA
+        blobs/lfs/<oid[:2]>/<oid>      - LFS objects, by SHA-256
+"""
+
+CHUNK_SIZE = 1 << 20
+# LFS pointer files are small text files that start with this line
+LFS_POINTER_PREFIX = b"version https://git-lfs.github.com/spec/v1"
+LFS_POINTER_MAX_SIZE = 1024
+
+class BlobIntegrityError(Exception):
+    """BlobIntegrityError
+    A downloaded blob or LFS object does not match its SHA
+    """
+
+def spool_dir()->Path:
+    # Follows configure_mirror_cache
+    return mirror_cache.CLONE_DIR / "blobs"
+
+def spool_path(sha: str)->Path:
+    return spool_dir() / sha[:2] / sha
+
+def lfs_spool_path(oid: str)->Path:
+    return spool_dir() / "lfs" / oid[:2] / oid
+
+def stream_to_file(chunks: Iterable[bytes], path: Path)->Path:
+    """stream_to_file
+    Write chunks to a file, through a temporary file, so a failed download never leaves a partial file behind
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return path
+
+def read_chunks(stream: Any)->Iterator[bytes]:
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        yield chunk
+
+def open_url(url: str, headers: Dict[str, str], data: Optional[bytes] = None)->Any:
+    request = urllib.request.Request(url, data=data, headers=headers)
+    return urllib.request.urlopen(request, timeout=CLIENT_CONFIG["timeout"])
+
+def api_token_headers()->Dict[str, str]:
+    # For a REST API request made outside PyGithub, so it is counted like the requests made through it
+    pool = get_token_pool()
+    if not pool.usable():
+        return {}
+    credential = pool.current()
+    pool.record_request(credential)
+    return {"Authorization": f"token {credential.token}"}
+
+def download_github_blob(repo: Repository, sha: str, path: Path):
+    # The raw media type returns the blob itself, for blobs of up to 100 MB
+    url = f"{CLIENT_CONFIG['base_url']}/repos/{repo.full_name}/git/blobs/{sha}"
+    headers = {"Accept": "application/vnd.github.raw+json", **api_token_headers()}
+    with open_url(url, headers) as response:
+        stream_to_file(read_chunks(response), path)
+
+def export_local_blob(repo: LocalRepository, sha: str, path: Path):
+    if repo.kind == "directory":
+        raise ValueError(f"{repo.full_name} is not a git repository; its files are copied directly")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as f:
+        result = subprocess.run(
+            ["git", "--git-dir", str(repo.git_dir()), "cat-file", "blob", sha], stdout=f, stderr=subprocess.PIPE
+        )
+    if result.returncode != 0:
+        temp_path.unlink()
+        raise RuntimeError(f"git cat-file blob {sha} failed: {result.stderr.decode(errors='replace').strip()}")
+    os.replace(temp_path, path)
+
+def spool_blob(repo: Union[Repository, StructureSource], sha: str)->Path:
+    """spool_blob
+    Get a git blob of a repo as a file in the spool, downloading it (in chunks) if it is not there yet
+
+    args:
+        repo: Union[Repository, StructureSource] - the repo that holds the blob
+        sha: str - the blob SHA
+    returns:
+        Path - the spooled file
+    """
+    path = spool_path(sha)
+    if path.exists():
+        return path
+    if isinstance(repo, LocalRepository):
+        export_local_blob(repo, sha, path)
+    else:
+        download_github_blob(repo, sha, path)
+    if file_blob_sha(path, path.stat().st_size) != sha:
+        path.unlink()
+        raise BlobIntegrityError(f"Blob {sha} of {repo.full_name} does not match its SHA")
+    return path
+
+def read_lfs_pointer(path: Path)->Optional[Tuple[str, int]]:
+    """read_lfs_pointer
+    Read the object ID (SHA-256) and size from a Git LFS pointer file, None if the file is not a pointer
+    """
+    if path.stat().st_size > LFS_POINTER_MAX_SIZE:
+        return None
+    data = path.read_bytes()
+    if not data.startswith(LFS_POINTER_PREFIX):
+        return None
+    fields = dict(line.split(" ", 1) for line in data.decode("utf-8", errors="replace").splitlines() if " " in line)
+    oid = fields.get("oid", "")
+    if not oid.startswith("sha256:") or not fields.get("size", "").isdigit():
+        return None
+    return oid[len("sha256:"):], int(fields["size"])
+
+def download_lfs_object(repo: Repository, oid: str, size: int, path: Path):
+    # The batch API hands out a download URL (and its headers) for each object
+    clone_url = get_repo_fields(repo)["clone_url"]
+    batch_url = f"{clone_url[:-len('.git')] if clone_url.endswith('.git') else clone_url}.git/info/lfs/objects/batch"
+    headers = {"Accept": "application/vnd.git-lfs+json", "Content-Type": "application/vnd.git-lfs+json"}
+    auth = git_auth_env(clone_url).get("GIT_CONFIG_VALUE_0")
+    if auth:
+        name, _, value = auth.partition(": ")
+        headers[name] = value
+    body = json.dumps({"operation": "download", "transfers": ["basic"], "objects": [{"oid": oid, "size": size}]})
+    with open_url(batch_url, headers, body.encode("utf-8")) as response:
+        batch = json.load(response)
+    lfs_object = batch["objects"][0]
+    if "error" in lfs_object:
+        raise RuntimeError(f"LFS object {oid} of {repo.full_name}: {lfs_object['error'].get('message')}")
+    download = lfs_object["actions"]["download"]
+    with open_url(download["href"], download.get("header", {})) as response:
+        stream_to_file(read_chunks(response), path)
+
+def local_lfs_object(repo: LocalRepository, oid: str)->Optional[Path]:
+    path = repo.git_dir() / "lfs" / "objects" / oid[:2] / oid[2:4] / oid
+    return path if path.exists() else None
+
+def file_sha256(path: Path)->str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in read_chunks(f):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def spool_lfs_object(repo: Union[Repository, StructureSource], oid: str, size: int)->Optional[Path]:
+    """spool_lfs_object
+    Get an LFS object as a file in the spool, downloading it if it is not there yet
+
+    returns:
+        Optional[Path] - the spooled object, None if a local repo does not have it
+    """
+    path = lfs_spool_path(oid)
+    if path.exists():
+        return path
+    if isinstance(repo, LocalRepository):
+        local_path = local_lfs_object(repo, oid)
+        if local_path is None:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, path)
+    else:
+        download_lfs_object(repo, oid, size, path)
+    if file_sha256(path) != oid:
+        path.unlink()
+        raise BlobIntegrityError(f"LFS object {oid} of {repo.full_name} does not match its SHA-256")
+    return path
+
+def fetch_template_file(template_repo: Union[Repository, StructureSource], content: ContentFile, worktree: Optional[Path] = None)->Path:
+    """fetch_template_file
+    Get a template file on disk, for copying into a PR. An LFS pointer is resolved to its object only when the
+    attributes of the target worktree route the file through LFS, so the commit holds what the template holds
+
+    args:
+        template_repo: Union[Repository, StructureSource] - the template repo
+        content: ContentFile - the template file
+        worktree: Optional[Path] - the worktree of the target repo. Without one, pointers are never resolved
+    returns:
+        Path - a file with the content to commit
+    """
+    if isinstance(template_repo, LocalRepository) and template_repo.kind == "directory":
+        return template_repo.path / content.path
+    path = spool_blob(template_repo, content.sha)
+    pointer = read_lfs_pointer(path)
+    if pointer is None or worktree is None or not mirror_cache.lfs_tracked(worktree, content.path):
+        return path
+    oid, size = pointer
+    lfs_path = spool_lfs_object(template_repo, oid, size)
+    if lfs_path is None:
+        fprint(f"LFS object of {content.path} is not available locally; committing its pointer")
+        return path
+    return lfs_path
+
+def copy_template_file(template_repo: Union[Repository, StructureSource], content: ContentFile, worktree: Path)->Path:
+    """copy_template_file
+    Copy a template file into a PR worktree, at the same path, streaming it from the spool
+
+    returns:
+        Path - the copied file
+    """
+    destination = worktree / content.path
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(fetch_template_file(template_repo, content, worktree), destination)
+    return destination
@@ -1,5 +1,8 @@
 from .includes import *
 import subprocess
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 def check_output(cmd: str, **kwargs)->str:
     try:
@@ -16,29 +19,43 @@ def check_output(cmd: str, **kwargs)->str:
             return result.decode("utf-8")
         return result
     
-from .access_gh import get_user, get_user_repos, get_org_repos, get_org_repo, get_user_repo, get_repo
+from .access_gh import CLIENT_CONFIG, get_Github, get_token_pool, writes_to_repo, get_user, get_user_repos, get_org_repos, get_org_repo, get_user_repo, get_repo
+from github.GithubException import GithubException
 
 from .get_template_details import RepoTemplate, AWI_TEMPLATE_REPO, AWI_ORG_NAME
-from .repo_detail import get_repo_structure, RepoStructureType
+from .lazy_guard import get_repo_fields
+from .reporting import ReportWriter, make_report_record
+from .repo_detail import get_repo_structure, structure_paths, RepoStructureType
+from .local_repo import LocalRepository, list_local_repos, file_blob_sha
+from .blob_spool import copy_template_file, BlobIntegrityError
+from .mirror_cache import checkout_worktree, push_worktree, remove_worktree
+from .profiling import profiled
+from .incremental import IncrementalScan
+from .compliance_matrix import ComplianceMatrix
+from .search_scan import SearchScan, choose_strategy, search_qualifier
+from .repo_filter import parse_repo_filter, filter_repos
+from .metrics import REPOS_CHECKED, DIFF_SECONDS, PULL_REQUESTS, SCAN_QUEUE_DEPTH, WorkerBusy, start_scan_clock
 
-TEMPLATE = RepoTemplate()
-CLONE_DIR = Path("clones")
+@cache
+def get_default_template()->RepoTemplate:
+    # Loaded on first use rather than at import, so offline (local) scans never reach GitHub for it
+    return RepoTemplate()
 
-if not CLONE_DIR.exists():
-    CLONE_DIR.mkdir()
-    
 @cache
-def check_diff(repo: Repository, template: RepoTemplate = TEMPLATE)->Tuple[bool, Optional[RepoStructureType]]:
+def check_diff(repo: Repository, template: Optional[RepoTemplate] = None, check_drift: bool = False)->Tuple[bool, Optional[RepoStructureType]]:
     """check_diff
     Check if pieces of the template repo are missing from the target repo.
     If so, return the missing pieces.
     
     Args:
         repo (Repository): the target repo
+        check_drift (bool): whether files that differ from the template count as missing
     Returns:
         result_tup (Tuple[bool, Optional[RepoStructureType]]):  (missing, missing_structure)
     """
-    result = template.compare_repo(repo)
+    if template is None:
+        template = get_default_template()
+    result = template.compare_repo(repo, check_drift)
     # print(result) 
     def count_diff(structure: RepoStructureType)->int:
         count = 0
@@ -52,6 +69,32 @@ def check_diff(repo: Repository, template: RepoTemplate = TEMPLATE)->Tuple[bool,
     if missing == 0:
         return False, None
     return True, result
+
+@cache
+def get_drifted_paths(repo: Repository, template: Optional[RepoTemplate] = None)->List[str]:
+    """get_drifted_paths
+    Get the template files that are present in the target repo, but differ from the template.
+    
+    Args:
+        repo (Repository): the target repo
+    Returns:
+        drifted (List[str]): the paths of the files that differ from the template
+    """
+    if template is None:
+        template = get_default_template()
+    return template.find_drift(repo)
+
+def git_blob_sha(data: bytes)->str:
+    """git_blob_sha
+    Compute the git blob SHA of some file content, the same way `git hash-object` does
+    
+    Args:
+        data (bytes): the file content
+    Returns:
+        sha (str): the blob SHA
+    """
+    header = f"blob {len(data)}\0".encode("utf-8")
+    return hashlib.sha1(header + data).hexdigest()
     
 # Prepare to submit a PR
 # 1. Check if the repo is missing any files
@@ -72,25 +115,33 @@ def get_repo_permissions(repo: Repository)->Dict[str, bool]:
     Returns:
         permissions (Dict[str, bool]): the permissions for the authenticated user
     """
+    listed_permissions = get_repo_fields(repo)["permissions"]
+    if listed_permissions is not None and len(get_token_pool()) == 1:
+        # Repository listings made by an authenticated user already include their permissions.
+        # With several credentials, the listing may have been made by another credential than the one that writes
+        results = dict(listed_permissions)
+        results["read"] = results["pull"]
+        return results
     user = get_user()
     results = {}
     # Check if the user has push access
-    result = check_output(f"gh api repos/{repo.full_name}/collaborators/{user.login}/permission", shell=True)
     try:
-        response = json.loads(result)
-        status = int(response["status"]) if "status" in response else 0
-        if status == 403:
-            results["push"] = False
-        elif status == 200:
-            results["push"] = True
-        elif "user" in response:
-            if "permissions" in response["user"]:
-                results.update(response["user"]["permissions"])
+        _, response = get_Github().requester.requestJsonAndCheck(
+            "GET", f"/repos/{repo.full_name}/collaborators/{user.login}/permission"
+        )
+        if "user" in response and response["user"] and "permissions" in response["user"]:
+            results.update(response["user"]["permissions"])
+        elif "permission" in response:
+            results["push"] = response["permission"] in ("admin", "maintain", "write")
         else:
-            raise
+            raise ValueError("no permissions in response")
+    except GithubException as e:
+        results["push"] = False
+        if e.status != 403:
+            warnings.warn(f"Unexpected response from GitHub API: {e.status}, {e.data}")
     except Exception as e:
         results["push"] = False
-        warnings.warn(f"Unexpected response from GitHub API: {result}, {e}")
+        warnings.warn(f"Unexpected response from GitHub API: {e}")
     if "push" not in results:
         results["push"] = False
     if "read" not in results:
@@ -101,21 +152,18 @@ def get_repo_permissions(repo: Repository)->Dict[str, bool]:
 
 def clone_tip(repo: Repository, branch: Branch)->Path:
     """clone_tip
-    Clone the tip (Bare minimum objects) of the repo to the specified path
+    Check out the branch of the repo in a worktree of its cached bare mirror.
+    The mirror is only fetched incrementally, so repeated runs do not clone the repo again
 
     Args:
         repo (Repository): the target repo
-        branch (Branch): the branch to clone
+        branch (Branch): the branch to check out
     Returns:
-        clone_path (Path): the path to the cloned repo
+        clone_path (Path): the path to the worktree
     """
-    clone_path = CLONE_DIR / repo.full_name
-    if clone_path.exists():
-        return clone_path
-    os.system(f"git clone --depth 1 --branch {branch.name} {repo.clone_url} {clone_path}")
-    return clone_path
+    return checkout_worktree(repo, branch)
 
-def add_file_to_tip(repo: Repository, branch: Branch, content: ContentFile)->Path:
+def add_file_to_tip(repo: Repository, branch: Branch, content: ContentFile, template_repo: Optional[Repository] = None, overwrite: bool = False)->Path:
     """add_file_to_tip
     Add a file to the tip of the repo
     
@@ -123,14 +171,25 @@ def add_file_to_tip(repo: Repository, branch: Branch, content: ContentFile)->Pat
         repo (Repository): the target repo
         branch (Branch): the branch to add the file to
         content (ContentFile): the file to add
+        template_repo (Optional[Repository]): the repo the file comes from. If provided, the file is streamed
+            from the blob spool by its SHA, so each template blob is only downloaded once across all targets,
+            and files of any size are copied with bounded memory. LFS pointers are resolved when the target
+            stores the path in LFS
+        overwrite (bool): whether to replace the file if it already exists with different content
     Returns:
         path (Path): the path to the added file
     """
     clone_path = clone_tip(repo, branch)
     file_path = clone_path / content.path
     if file_path.exists():
-        fprint(f"File already exists: {file_path}")
-        return clone_path
+        if not overwrite:
+            fprint(f"File already exists: {file_path}")
+            return clone_path
+        if file_blob_sha(file_path, file_path.stat().st_size) == content.sha:
+            fprint(f"File is already up to date: {file_path}")
+            return clone_path
+    if template_repo is not None:
+        return copy_template_file(template_repo, content, clone_path)
     file_path.parent.mkdir(parents=True, exist_ok=True)
     with open(file_path, "wb") as f:
         f.write(content.decoded_content)
@@ -138,34 +197,32 @@ def add_file_to_tip(repo: Repository, branch: Branch, content: ContentFile)->Pat
 
 def push_changes_to_tip(repo: Repository, branch: Branch, commit_message: str)->Path:
     """push_changes_to_tip
-    Push the changes to the tip of the repo
+    Commit the changes in the worktree, and push them to the branch
     
     Args:
         repo (Repository): the target repo
         branch (Branch): the branch to push to
         commit_message (str): the commit message
     Returns:
-        clone_path (Path): the path to the cloned repo
+        clone_path (Path): the path to the worktree
     """
     clone_path = clone_tip(repo, branch)
-    result = check_output(f"cd {clone_path} && git add . && git commit -m '{commit_message}' && git push origin {branch.name}")
+    if not push_worktree(repo, branch, commit_message):
+        fprint(f"Nothing to push to {repo.full_name}:{branch.name}")
     return clone_path
 
 def clean_tip(repo: Repository)->Path:
     """clean_tip
-    Clean the tip of the repo
+    Remove the worktree of the repo. Its mirror is kept for the next run, within the cache size limit
     
     Args:
-        repo (Repository): the target repo
+        repo (Repository): the repo the worktree was created for (the one that is pushed to)
     Returns:
-        clone_path (Path): the path to the cloned repo
+        clone_path (Path): the path to the removed worktree
     """
-    clone_path = CLONE_DIR / repo.full_name
-    if not clone_path.exists():
-        return clone_path
-    result = check_output(f"rm -rf {clone_path}")
-    return clone_path
+    return remove_worktree(repo)
 
+@profiled("pr")
 def make_pr_fork(repo: Repository)->Repository:
     """make_pr_fork
     Create a fork of the repo
@@ -188,6 +245,7 @@ def make_pr_fork(repo: Repository)->Repository:
     return fork
     
 
+@profiled("pr")
 def make_pr_branch(repo: Repository, branch_name: str)->Branch:
     """make_pr_branch
     Create a branch on the repo
@@ -199,7 +257,7 @@ def make_pr_branch(repo: Repository, branch_name: str)->Branch:
         branch (Branch): the branch that was created
     """
     perms = get_repo_permissions(repo)
-    default_branch = repo.get_branch(repo.default_branch)
+    default_branch = repo.get_branch(get_repo_fields(repo)["default_branch"])
     default_sha = default_branch.commit.sha
     target_loc = repo
     if not perms["push"]:
@@ -214,7 +272,15 @@ def make_pr_branch(repo: Repository, branch_name: str)->Branch:
     branch = target_loc.get_branch(branch_name)
     return branch
 
-def make_pr_commit(repo: Repository, branch: Branch, structure: RepoStructureType, changes: Dict[str, ContentFile] = {}) -> Dict[str, ContentFile]:
+@profiled("commit")
+def make_pr_commit(
+    repo: Repository, 
+    branch: Branch, 
+    structure: RepoStructureType, 
+    changes: Optional[Dict[str, ContentFile]] = None,
+    template_repo: Optional[Repository] = None,
+    drifted: Collection[str] = ()
+) -> Dict[str, ContentFile]:
     """make_pr_commit
     Create a commit on the branch that adds the structure to the repo
     
@@ -223,18 +289,23 @@ def make_pr_commit(repo: Repository, branch: Branch, structure: RepoStructureTyp
         branch (Branch): the branch to commit to
         structure (RepoStructureType): the structure to commit
         changes (Dict[str, str]): the changes that were made
+        template_repo (Optional[Repository]): the template repo the structure comes from
+        drifted (Collection[str]): paths of files that exist in the repo and should be replaced
     Returns:
         changes (Dict[str, str]): the changes that were made
     """
-    for name, content in structure.items():
+    if changes is None:
+        changes = {}
+    # .gitattributes goes first, so the files after it are stored the way it says (e.g. in LFS)
+    for name, content in sorted(structure.items(), key=lambda item: item[0] != ".gitattributes"):
         if isinstance(content, ContentFile):
-            add_file_to_tip(repo, branch, content)
+            add_file_to_tip(repo, branch, content, template_repo, overwrite=content.path in drifted)
             changes[name] = content
         else:
-            make_pr_commit(repo, branch, content, changes)
+            make_pr_commit(repo, branch, content, changes, template_repo, drifted)
     return changes
 
-def prep_pr_commit(repo: Repository, branch_name: str, template: RepoTemplate = TEMPLATE)->Dict[str, ContentFile]:
+def prep_pr_commit(repo: Repository, branch_name: str, template: Optional[RepoTemplate] = None)->Dict[str, ContentFile]:
     """prep_pr_commit
     Prepare to submit a PR
     
@@ -244,13 +315,17 @@ def prep_pr_commit(repo: Repository, branch_name: str, template: RepoTemplate =
     Returns:
         changes (Dict[str, str]): the changes that were made
     """
+    if template is None:
+        template = get_default_template()
     missing, structure = check_diff(repo, template=template)
     if not structure:
         return {}
     branch = make_pr_branch(repo, branch_name)
-    changes = make_pr_commit(repo, branch, structure)
+    # Template files may come from a snapshot, without content, so they are read as blobs of the template repo
+    changes = make_pr_commit(repo, branch, structure, template_repo=template.template_repo)
     return changes
 
+@profiled("commit")
 def push_pr_commit(repo: Repository, branch_name: str, commit_message: str):
     """push_pr_commit
     Push the commit to the repo
@@ -264,6 +339,7 @@ def push_pr_commit(repo: Repository, branch_name: str, commit_message: str):
     push_changes_to_tip(repo, branch, commit_message)
     return
 
+@profiled("pr")
 def make_pr(target_repo: Repository, PR_repository: Repository, PR_branch: Branch, PR_title: str, PR_body: str):
     """make_pr
     Create a PR
@@ -280,33 +356,41 @@ def make_pr(target_repo: Repository, PR_repository: Repository, PR_branch: Branc
     for pr in prs:
         if pr.head.ref == PR_branch.name:
             pr.edit(title=PR_title, body=PR_body)
+            PULL_REQUESTS.inc("updated")
             return pr
-    pr = target_repo.create_pull(title=PR_title, body=PR_body, head=f"{PR_repository.owner.login}:{PR_branch.name}", base=target_repo.default_branch)
+    head_owner = get_repo_fields(PR_repository)["owner_login"]
+    base_branch = get_repo_fields(target_repo)["default_branch"]
+    pr = target_repo.create_pull(title=PR_title, body=PR_body, head=f"{head_owner}:{PR_branch.name}", base=base_branch)
+    PULL_REQUESTS.inc("opened")
     return pr
 
-def template_compliance_pr(repo: Repository, template: RepoTemplate = TEMPLATE):
+@writes_to_repo
+def template_compliance_pr(repo: Repository, template: Optional[RepoTemplate] = None):
     """template_compliance_pr
     Create a PR to make the repo compliant with the template
     
     Args:
         repo (Repository): the target repo
     """
+    if template is None:
+        template = get_default_template()
     repo_permissions = get_repo_permissions(repo)
     PR_repo = repo if repo_permissions["push"] else make_pr_fork(repo)
     branch_name = "repository_management_bot/template_compliance"
     commit_msg = "Add missing files to make repo compliant with template"
     pullreq_title = "Enforce Template Compliance"
-    template_repository_addr = template.template_repo.html_url
-    organization_name = template.template_repo.owner.login
-    organization_link = f"[{organization_name}]({template.template_repo.owner.html_url})"
-    template_repo_link = f"[{template.template_repo.name}]({template_repository_addr})"
+    template_fields = get_repo_fields(template.template_repo)
+    template_repository_addr = template_fields["html_url"]
+    organization_name = template_fields["owner_login"]
+    organization_link = f"[{organization_name}]({template_fields['owner_html_url']})"
+    template_repo_link = f"[{template_fields['name']}]({template_repository_addr})"
     target_repo_name = repo.full_name
     pullreq_body = f"This PR adds missing files to make the `{target_repo_name}` repository compliant with the {organization_link}'s {template_repo_link} template."
-    changes = prep_pr_commit(PR_repo, branch_name)
+    changes = prep_pr_commit(PR_repo, branch_name, template)
     if len(changes) == 0:
         return
     pullreq_body += "\n\nChanges made:\n"
-    repo_link = repo.html_url
+    repo_link = get_repo_fields(repo)["html_url"]
     branch_link = f"{repo_link}/tree/{branch_name}"
     for name, content in changes.items():
         content_link = f"{branch_link}/{content.path}"
@@ -314,7 +398,7 @@ def template_compliance_pr(repo: Repository, template: RepoTemplate = TEMPLATE):
     pullreq_body += "\nThis PR was automatically generated by the [Repository Management Bot](https://github.com/chp2001/repository-management-bot)."
     push_pr_commit(PR_repo, branch_name, commit_msg)
     make_pr(repo, PR_repo, PR_repo.get_branch(branch_name), pullreq_title, pullreq_body)
-    clean_tip(repo)
+    clean_tip(PR_repo)
     return
 
 def template_compliance_prs(org: str, template_repo: str):
@@ -331,7 +415,7 @@ def template_compliance_prs(org: str, template_repo: str):
         missing, result = check_diff(repo, template)
         if not missing:
             continue
-        userinput = input(f"{repo.full_name} is missing:\n{result}\nCreate PR? (y/N): ")
+        userinput = finput(f"{repo.full_name} is missing:\n{result}\nCreate PR? (y/N): ")
         if userinput.lower() == "y":
             template_compliance_pr(repo, template)
             print(f"PR created for {repo.full_name}")
@@ -342,7 +426,7 @@ def template_compliance_prs(org: str, template_repo: str):
             print(f"Skipping {repo.full_name}")
     return
 
-def check_template_compliance_for_repo(repo: Repository, template: RepoTemplate = TEMPLATE) -> Tuple[bool, Optional[RepoStructureType]]:
+def check_template_compliance_for_repo(repo: Repository, template: Optional[RepoTemplate] = None) -> Tuple[bool, Optional[RepoStructureType]]:
     """check_template_compliance_for_repo
     Check if the repo is compliant with the template
     
@@ -355,12 +439,36 @@ def check_template_compliance_for_repo(repo: Repository, template: RepoTemplate
     missing, result = check_diff(repo, template)
     return missing, result
 
+def resolve_template(template_name: Optional[str] = None, org_name: Optional[str] = None, local_dir: Optional[str] = None)->RepoTemplate:
+    """resolve_template
+    Load the template repo named on the command line
+    
+    Args:
+        template_name (Optional[str]): the name of the template repo ('owner/repo', or 'repo' in the org), or a local path.
+            The default template if not provided
+        org_name (Optional[str]): the organization a bare template name belongs to
+        local_dir (Optional[str]): a directory of local checkouts or mirrors the template may be in
+    Returns:
+        template (RepoTemplate): the template repo
+    """
+    if not template_name:
+        return get_default_template()
+    if local_dir and (Path(local_dir) / template_name).is_dir():
+        return RepoTemplate(str(Path(local_dir) / template_name))
+    if "/" in template_name:
+        return RepoTemplate(template_name)
+    if org_name:
+        return RepoTemplate(f"{org_name}/{template_name}")
+    raise ValueError("Template name provided without organization")
+
 def template_compliance_targeting(
     org_name: Optional[str] = None, 
     repo_name: Optional[str] = None, 
     user_name: Optional[str] = None,
-    template_name: Optional[str] = None
-    ) -> Tuple[Union[Repository, List[Repository]], RepoTemplate]:
+    template_name: Optional[str] = None,
+    local_dir: Optional[str] = None,
+    repo_filter: Optional[str] = None
+    ) -> Tuple[Union[Repository, LocalRepository, List[Repository], List[LocalRepository]], RepoTemplate]:
     """template_compliance_targeting
     Take the provided arguments and interpret them to determine which repos to target
     
@@ -368,21 +476,21 @@ def template_compliance_targeting(
         org_name (Optional[str]): the name of the organization
         repo_name (Optional[str]): the name of the repo
         user_name (Optional[str]): the name of the user
-        template_name (Optional[str]): the name of the template repo
+        template_name (Optional[str]): the name of the template repo, or a local path
+        local_dir (Optional[str]): a directory of local checkouts or mirrors to target instead of GitHub
+        repo_filter (Optional[str]): filter expressions for listed org or user repos (see repo_filter.py),
+            checked against the listing response only
     Returns:
-        target (Union[Repository, List[Repository]]): the target repo(s)
+        target (Union[Repository, LocalRepository, List[Repository], List[LocalRepository]]): the target repo(s)
         template (RepoTemplate): the template repo
     """
-    if template_name:
-        if "/" in template_name:
-            template = RepoTemplate(template_name)
-        elif org_name:
-            template = RepoTemplate(f"{org_name}/{template_name}")
+    template = resolve_template(template_name, org_name, local_dir)
+    if local_dir:
+        if repo_name:
+            target = LocalRepository(Path(local_dir) / repo_name)
         else:
-            raise ValueError("Template name provided without organization")
-    else:
-        template = TEMPLATE
-    if repo_name:
+            target = list_local_repos(local_dir)
+    elif repo_name:
         if "/" in repo_name:
             target = get_repo(repo_name)
         elif user_name:
@@ -397,90 +505,202 @@ def template_compliance_targeting(
         target = get_user_repos(user_name)
     else:
         raise ValueError("No target provided")
+    if isinstance(target, list) and not local_dir:
+        # Parsed before the listing is used, so a bad expression fails before any per-repo request
+        target = filter_repos(target, parse_repo_filter(repo_filter))
     return target, template
 
 def get_compliance_diffs(
-    target: Union[Repository, List[Repository]],
-    template: RepoTemplate
+    target: Union[Repository, LocalRepository, List[Repository], List[LocalRepository]],
+    template: RepoTemplate,
+    check_drift: bool = False,
+    search: Optional[SearchScan] = None
     ) -> Dict[str, RepoStructureType]:
     """get_compliance_diffs
     Get the missing files for each repo
     
     Args:
-        target (Union[Repository, List[Repository]]): the target repo(s)
+        target (Union[Repository, LocalRepository, List[Repository], List[LocalRepository]]): the target repo(s)
         template (RepoTemplate): the template repo
+        check_drift (bool): whether to include files that differ from the template
+        search (Optional[SearchScan]): check the repos from this scan's code search results instead of reading their trees
         
     Returns:
         diffs (Dict[str, RepoStructureType]): the missing files for each repo (if any)
     """
     diffs = {}
-    if isinstance(target, Repository):
-        missing, result = check_diff(target, template)
+    repos = target if isinstance(target, list) else [target]
+    for repo in repos:
+        if search is not None:
+            result, _ = search.check(repo)
+            missing = result is not None
+        else:
+            missing, result = check_diff(repo, template, check_drift)
         if missing:
-            diffs[target.full_name] = result
-    else:
-        for repo in target:
-            missing, result = check_diff(repo, template)
-            if missing:
-                diffs[repo.full_name] = result
+            diffs[repo.full_name] = result
     return diffs
 
+@writes_to_repo
 def make_compliance_pr(
     repo: Repository,
     template_repo: Repository,
-    diff: RepoStructureType
-) -> bool:
+    diff: RepoStructureType,
+    drifted: Collection[str] = ()
+) -> Optional[PullRequest]:
     """make_compliance_pr
     Create a PR to make the repo compliant with the template
     
     Args:
         repo (Repository): the target repo
         diff (RepoStructureType): the missing files
+        drifted (Collection[str]): paths in the diff that exist in the repo, but differ from the template
+    Returns:
+        pr (Optional[PullRequest]): the PR that was created or updated, None if no PR was made
     """
     if not diff or len(diff) == 0:
-        return False
+        return None
     repo_permissions = get_repo_permissions(repo)
     PR_repo = repo if repo_permissions["push"] else make_pr_fork(repo)
     branch_name = "repository_management_bot/template_compliance"
     commit_msg = "Add missing files to make repo compliant with template"
+    if drifted:
+        commit_msg = "Add missing and update outdated files to make repo compliant with template"
     pullreq_title = "Enforce Template Compliance"
-    template_repository_addr = template_repo.html_url
-    organization_name = template_repo.owner.login
-    organization_link = f"[{organization_name}]({template_repo.owner.html_url})"
-    template_repo_link = f"[{template_repo.name}]({template_repository_addr})"
+    template_fields = get_repo_fields(template_repo)
+    template_repository_addr = template_fields["html_url"]
+    organization_name = template_fields["owner_login"]
+    organization_link = f"[{organization_name}]({template_fields['owner_html_url']})"
+    template_repo_link = f"[{template_fields['name']}]({template_repository_addr})"
     target_repo_name = repo.full_name
     pullreq_body = f"This PR adds missing files to make the `{target_repo_name}` repository compliant with the {organization_link}'s {template_repo_link} template."
+    if drifted:
+        pullreq_body = f"This PR adds missing files and updates outdated files to make the `{target_repo_name}` repository compliant with the {organization_link}'s {template_repo_link} template."
     pr_branch = make_pr_branch(PR_repo, branch_name)
-    changes = make_pr_commit(PR_repo, pr_branch, diff)
+    changes = make_pr_commit(PR_repo, pr_branch, diff, template_repo=template_repo, drifted=drifted)
     if len(changes) == 0:
-        clean_tip(repo)
-        return False
+        clean_tip(PR_repo)
+        return None
     pullreq_body += "\n\nChanges made:\n"
-    repo_link = repo.html_url
+    repo_link = get_repo_fields(repo)["html_url"]
     branch_link = f"{repo_link}/tree/{branch_name}"
     for name, content in changes.items():
         content_link = f"{branch_link}/{content.path}"
-        pullreq_body += f" - Added [{name}]({content_link})\n"
+        action = "Updated" if content.path in drifted else "Added"
+        pullreq_body += f" - {action} [{name}]({content_link})\n"
     pullreq_body += "\nThis PR was automatically generated by the [Repository Management Bot]("
     pullreq_body += "https://github.com/chp2001/repository-management-bot)."
     fprint("-" * 80)
     fprint(pullreq_body)
     fprint("-" * 80)
-    cont = input("Create PR? (y/N): ")
+    cont = finput("Create PR? (y/N): ")
     if cont.lower() != "y":
-        clean_tip(repo)
-        return False
+        clean_tip(PR_repo)
+        return None
     push_pr_commit(PR_repo, branch_name, commit_msg)
-    make_pr(repo, PR_repo, pr_branch, pullreq_title, pullreq_body)
-    clean_tip(repo)
-    return True
+    pr = make_pr(repo, PR_repo, pr_branch, pullreq_title, pullreq_body)
+    clean_tip(PR_repo)
+    return pr
+
+# Errors that fail one repo (API errors, git commands on empty or broken repos, mirror and blob downloads),
+# which are reported for that repo instead of stopping the whole run. URLError and HTTPError are OSErrors
+REPO_ERRORS = (GithubException, subprocess.CalledProcessError, RuntimeError, OSError, BlobIntegrityError)
+
+def describe_error(error: BaseException)->str:
+    if isinstance(error, GithubException):
+        return f"{error.status} {error.data}"
+    return f"{type(error).__name__}: {error}"
+
+def dispatch_repo(
+    repo: Repository,
+    template: RepoTemplate,
+    check_drift: bool = False,
+    report: Optional[ReportWriter] = None,
+    scan_only: bool = False,
+    incremental: Optional[IncrementalScan] = None,
+    matrix: Optional[ComplianceMatrix] = None,
+    search: Optional[SearchScan] = None
+) -> Optional[PullRequest]:
+    """dispatch_repo
+    Check one repo, offer to prepare a PR if it is not compliant, and write its report record
+    
+    Args:
+        repo (Repository): the target repo
+        template (RepoTemplate): the template
+        check_drift (bool): whether to also update files that differ from the template
+        report (Optional[ReportWriter]): where to write the repo's report record
+        scan_only (bool): only check the repo, never prepare a PR
+        incremental (Optional[IncrementalScan]): check the repo through this incremental pass, reusing earlier results
+        matrix (Optional[ComplianceMatrix]): the org-wide compliance matrix to add the repo's row to
+        search (Optional[SearchScan]): check the repo from this scan's code search results instead of reading its tree
+    Returns:
+        pr (Optional[PullRequest]): the PR that was created or updated, if any
+    """
+    check_start = time.perf_counter()
+    try:
+        with WorkerBusy():
+            if incremental is not None:
+                diff, drifted = incremental.check(repo)
+            elif search is not None:
+                diff, drifted = search.check(repo)
+            else:
+                diffs = get_compliance_diffs(repo, template, check_drift)
+                diff = diffs.get(repo.full_name)
+                drifted = get_drifted_paths(repo, template) if check_drift and diff else []
+    except REPO_ERRORS as e:
+        REPOS_CHECKED.inc("error")
+        fprint(f"Could not check {repo.full_name}: {describe_error(e)}")
+        if report is not None:
+            record = make_report_record(repo.full_name, None, check_seconds=time.perf_counter() - check_start, error=describe_error(e))
+            report.write(record)
+        return None
+    check_seconds = time.perf_counter() - check_start
+    DIFF_SECONDS.observe(value=check_seconds)
+    REPOS_CHECKED.inc("compliant" if diff is None else "noncompliant")
+    score = None
+    if matrix is not None:
+        matrix.add_diff(repo.full_name, diff, drifted)
+        score = matrix.score(repo.full_name)
+    pr = None
+    pr_seconds = None
+    error = None
+    if diff is None:
+        fprint(f"{repo.full_name} is already compliant. Skipping.")
+    else:
+        missing_count = len(structure_paths(diff)) - len(drifted)
+        fprint(f"{repo.full_name} is missing {missing_count} files")
+        if drifted:
+            fprint(f"{repo.full_name} has {len(drifted)} outdated files: {', '.join(drifted)}")
+        if not scan_only:
+            cont = finput(f"Prepare PR for {repo.full_name}? (y/N): ")
+            if cont.lower() == "y":
+                pr_start = time.perf_counter()
+                try:
+                    with WorkerBusy():
+                        pr = make_compliance_pr(repo, template.template_repo, diff, drifted)
+                except REPO_ERRORS as e:
+                    error = f"Could not prepare the PR: {describe_error(e)}"
+                    fprint(f"{repo.full_name}: {error}")
+                pr_seconds = time.perf_counter() - pr_start
+    if report is not None:
+        pr_url = pr.html_url if pr is not None else None
+        report.write(make_report_record(repo.full_name, diff, drifted, pr_url, check_seconds, pr_seconds, error=error, score=score))
+    return pr
 
 def compliance_pr_dispatch(
     user_name: Optional[str] = None,
     org_name: Optional[str] = None,
     repo_name: Optional[str] = None,
-    template_name: Optional[str] = None
-):
+    template_name: Optional[str] = None,
+    check_drift: bool = False,
+    report: Optional[ReportWriter] = None,
+    scan_only: bool = False,
+    local_dir: Optional[str] = None,
+    incremental: bool = False,
+    strategy: str = "tree",
+    repo_filter: Optional[str] = None,
+    missing_any: Optional[str] = None,
+    missing_all: Optional[str] = None
+) -> List[Repository]:
     """compliance_pr_dispatch
     Create PRs to make the target repo(s) compliant with the template
     
@@ -489,47 +709,85 @@ def compliance_pr_dispatch(
         org_name (Optional[str]): the name of the organization
         repo_name (Optional[str]): the name of the repo
         template_name (Optional[str]): the name of the template repo
+        check_drift (bool): whether to also update files that differ from the template
+        report (Optional[ReportWriter]): where to stream one record per checked repo
+        scan_only (bool): check every repo without asking, and never prepare PRs
+        local_dir (Optional[str]): a directory of local checkouts or mirrors to check instead of GitHub repos
+        incremental (bool): reuse the stored results of earlier passes, and only check what changed since
+        strategy (str): how repos are checked: "tree" (read every repo's tree), "search" (one code search per template file,
+            for org or user targets) or "auto" (search when the org is much larger than the template)
+        repo_filter (Optional[str]): filter expressions for listed org or user repos, applied before any per-repo request
+        missing_any (Optional[str]): comma-separated template paths; list the checked repos missing any of them at the end
+        missing_all (Optional[str]): comma-separated template paths; list the checked repos missing all of them at the end
+    Returns:
+        result (List[Repository]): the repos that PRs were created for
     """
     target, template = template_compliance_targeting(
         user_name=user_name,
         org_name=org_name,
         repo_name=repo_name,
-        template_name=template_name
+        template_name=template_name,
+        local_dir=local_dir,
+        repo_filter=repo_filter
     )
     fprint(f"Targeting {target} with template {template.template_repo.full_name}")
-    # diffs = get_compliance_diffs(target, template)
+    if not scan_only and (local_dir or isinstance(template.template_repo, LocalRepository)):
+        # PRs are made on GitHub, from the template's GitHub blobs
+        fprint("Local repositories are only checked; no PRs will be prepared")
+        scan_only = True
+    qualifier = search_qualifier(org_name, user_name)
+    search = None
+    if choose_strategy(strategy, target, template, qualifier) == "search":
+        fprint(f"Checking repos with one code search per template file ({len(template.file_shas)} files)")
+        search = SearchScan(template, qualifier, check_drift)
+    scan = IncrementalScan(template, check_drift, search) if incremental else None
+    matrix = ComplianceMatrix(template)
+    # Checked before the scan, so a typo in a path does not cost a whole scan
+    for paths in (missing_any, missing_all):
+        if paths:
+            matrix.parse_paths(paths)
     result = []
-    if isinstance(target, Repository):
-        fprint(f"Targeting {target.full_name}")
-        diffs = get_compliance_diffs(target, template)
-        if target.full_name in diffs:
-            fprint(f"{target.full_name} is missing at least {len(diffs[target.full_name])} files")
-            cont = input("Prepare PR for {target.full_name}? (y/N): ")
-            if cont.lower() == "y":
-                if make_compliance_pr(target, template.template_repo, diffs[target.full_name]):
-                    result.append(target)
-        else:
-            fprint(f"{target.full_name} is already compliant. Skipping.")
-    else:
-        num = len(target)
-        _i = 0
-        for repo in target:
-            _i += 1
-            check = input(f"{_i}/{num}) Check {repo.full_name}? (y/N): ")
-            if check.lower() != "y":
-                continue
-            diffs = get_compliance_diffs(repo, template)
-            if repo.full_name in diffs:
-                fprint(f"{repo.full_name} is missing at least {len(diffs[repo.full_name])} files")
-                cont = input(f"Prepare PR for {repo.full_name}? (y/N): ")
-                if cont.lower() == "y":
-                    if make_compliance_pr(repo, template.template_repo, diffs[repo.full_name]):
+    # Scans never ask anything, so their repos are checked by all workers at once
+    workers = CLIENT_CONFIG["workers"] if scan_only and isinstance(target, list) else 1
+    start_scan_clock(len(target) if isinstance(target, list) else 1, workers)
+    try:
+        if not isinstance(target, list):
+            fprint(f"Targeting {target.full_name}")
+            if dispatch_repo(target, template, check_drift, report, scan_only, scan, matrix, search):
+                result.append(target)
+        elif workers > 1:
+            fprint(f"Checking {len(target)} repos with {workers} workers")
+            def check(repo: Repository)->Optional[PullRequest]:
+                SCAN_QUEUE_DEPTH.inc(amount=-1)
+                return dispatch_repo(repo, template, check_drift, report, scan_only, scan, matrix, search)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for repo, pr in zip(target, executor.map(check, target)):
+                    if pr:
                         result.append(repo)
-            else:
-                fprint(f"{repo.full_name} is already compliant. Skipping.")
+        else:
+            num = len(target)
+            _i = 0
+            for repo in target:
+                _i += 1
+                SCAN_QUEUE_DEPTH.set(value=num - _i)
+                if not scan_only:
+                    check = finput(f"{_i}/{num}) Check {repo.full_name}? (y/N): ")
+                    if check.lower() != "y":
+                        continue
+                if dispatch_repo(repo, template, check_drift, report, scan_only, scan, matrix, search):
+                    result.append(repo)
+    finally:
+        SCAN_QUEUE_DEPTH.set(value=0)
+        if scan is not None:
+            scan.save()
+            scan.report()
+        if search is not None and search.holders is not None:
+            search.report()
+        matrix.print_summary()
+        matrix.print_missing(missing_any, missing_all)
     fprint(f"PRs created for {len(result)} repos")
     fprint(result)
-    return
+    return result
     
     
 
@@ -552,7 +810,7 @@ if __name__ == "__main__":
         fprint(missing, structure)
         make_pr_commit(repo, branch, structure)
         # remove branch
-        os.system(f"cd {CLONE_DIR / repo.full_name} && git branch -D test-branch")
+        os.system(f"cd {clone_tip(repo, branch)} && git checkout --detach && git branch -D test-branch")
         clean_tip(repo)
         
         
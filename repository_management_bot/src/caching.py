@@ -1,8 +1,419 @@
-import os, sys, json, pickle
+import os, sys, io, json, pickle
 from pathlib import Path
-from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar
-from functools import wraps, cache as functools_cache
-from .adv_wrap import wrapper_gen
+from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar, Generic, Awaitable
+from functools import wraps
+from collections import OrderedDict
+import threading
+import asyncio
+import time
+from .adv_wrap import ParamType, ReturnType
+
+"""
+caching.py
+The cache used for (almost) every GitHub request. Unlike functools.cache, it is safe to call from several threads:
+concurrent calls with the same arguments are coalesced into a single call (singleflight), whose result, or exception,
+is shared by all of them. Exceptions are never cached, so the next call tries again.
+Saved caches remember when each entry was stored, and load_cache drops entries older than a maximum age,
+except for functions whose results can never change (content_cache, e.g. blobs by SHA).
+"""
+
+# The layout of files written by save_cache; files with another layout are ignored
+CACHE_FORMAT = 2
+
+KWARGS_MARK = ("<kwargs>",)
+
+KeyFunctionType = Callable[[Any], Tuple[Any, ...]]
+KEY_FUNCTIONS: Dict[type, KeyFunctionType] = {}
+
+def register_cache_key(cls: type, key_function: KeyFunctionType):
+    """register_cache_key
+    Make cached functions key arguments of a type (and its subclasses) by stable identifiers instead of by the object.
+    Two objects for the same thing (e.g. the same repo from two different listings) then share cache entries,
+    the cache does not keep the argument objects alive, and the keys can be saved to disk
+
+    args:
+        cls: type - the type of the arguments
+        key_function: KeyFunctionType - returns the identifiers of an argument, e.g. (full_name, node_id) for a repo
+    """
+    KEY_FUNCTIONS[cls] = key_function
+
+def canonical_key(value: Any)->Any:
+    """canonical_key
+    Get the cache key of one argument: the identifiers of a registered type, or the argument itself
+    """
+    for cls in type(value).__mro__:
+        key_function = KEY_FUNCTIONS.get(cls)
+        if key_function is not None:
+            return (cls.__name__,) + tuple(key_function(value))
+    return value
+
+def make_key(args: Tuple[Any, ...], kwargs: Dict[str, Any])->Tuple[Any, ...]:
+    """make_key
+    Build the cache key of a call. Like functools.cache, calls that pass the same values differently
+    (positionally or by keyword) get different keys
+    """
+    key = tuple(canonical_key(arg) for arg in args)
+    if not kwargs:
+        return key
+    return key + KWARGS_MARK + tuple((name, canonical_key(value)) for name, value in kwargs.items())
+
+class Flight:
+    """Flight
+    A call that is in progress, which callers with the same key wait for instead of calling again
+    """
+    done: threading.Event
+    owner: int
+    result: Any
+    error: Optional[BaseException]
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        self.result = None
+        self.error = None
+
+class CacheInfo:
+    """CacheInfo
+    The statistics of one cached function
+    """
+    hits: int
+    misses: int
+    coalesced: int
+    errors: int
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def as_dict(self)->Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "errors": self.errors}
+
+class CachedFunction:
+    """CachedFunction
+    The cache of one function, shared by the sync and async variants of the cache decorator
+    """
+    func: Callable[..., Any]
+    name: str
+    persist: bool
+    immutable: bool
+    entries: Dict[Tuple[Any, ...], Any]
+    stored: Dict[Tuple[Any, ...], float] # When each entry was stored, for expiring saved entries
+    flights: Dict[Tuple[Any, ...], Any]
+    info: CacheInfo
+    lock: threading.Lock
+    def __init__(self, func: Callable[..., Any], persist: bool = True, immutable: bool = False):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.persist = persist
+        self.immutable = immutable
+        self.entries = {}
+        self.stored = {}
+        self.flights = {}
+        self.info = CacheInfo()
+        self.lock = threading.Lock()
+        CACHED_FUNCTIONS.append(self)
+
+    def call(self, *args: Any, **kwargs: Any)->Any:
+        key = make_key(args, kwargs)
+        with self.lock:
+            if key in self.entries:
+                self.info.hits += 1
+                return self.entries[key]
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.info.misses += 1
+                leader = True
+            else:
+                leader = False
+                if flight.owner != threading.get_ident():
+                    self.info.coalesced += 1
+        if not leader:
+            if flight.owner == threading.get_ident():
+                # A recursive call for the same key would wait for itself
+                return self.func(*args, **kwargs)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self.func(*args, **kwargs)
+        except BaseException as e:
+            flight.error = e
+            with self.lock:
+                self.info.errors += 1
+            raise
+        else:
+            with self.lock:
+                self.store(key, flight.result)
+            return flight.result
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    async def call_async(self, *args: Any, **kwargs: Any)->Any:
+        key = make_key(args, kwargs)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if key in self.entries:
+                self.info.hits += 1
+                return self.entries[key]
+            task = self.flights.get(key)
+            if task is None or task.get_loop() is not loop:
+                task = self.flights[key] = loop.create_task(self.func(*args, **kwargs))
+                task.add_done_callback(lambda done: self.task_done(key, done))
+                self.info.misses += 1
+            else:
+                self.info.coalesced += 1
+        # Shielded, so a cancelled caller does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def task_done(self, key: Tuple[Any, ...], task: "asyncio.Task[Any]"):
+        with self.lock:
+            if self.flights.get(key) is task:
+                del self.flights[key]
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                self.info.errors += 1
+            else:
+                self.store(key, task.result())
+
+    def store(self, key: Tuple[Any, ...], value: Any, stored: Optional[float] = None):
+        # Called with the lock held
+        self.entries[key] = value
+        self.stored[key] = time.time() if stored is None else stored
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stored.clear()
+
+CACHED_FUNCTIONS: List[CachedFunction] = []
+
+def make_cached(func: Callable[ParamType, ReturnType], persist: bool, immutable: bool = False)->Callable[ParamType, ReturnType]:
+    cached = CachedFunction(func, persist, immutable)
+    @wraps(func)
+    def wrapped(*args: ParamType.args, **kwargs: ParamType.kwargs)->ReturnType:
+        return cached.call(*args, **kwargs)
+    wrapped.cache = cached # type: ignore
+    return wrapped
+
+def cache(func: Callable[ParamType, ReturnType])->Callable[ParamType, ReturnType]:
+    """cache
+    Cache the results of a function by its arguments, coalescing concurrent calls with the same arguments.
+    The cache is available as the `cache` attribute of the wrapped function
+    """
+    return make_cached(func, persist=True)
+
+def transient_cache(func: Callable[ParamType, ReturnType])->Callable[ParamType, ReturnType]:
+    """transient_cache
+    Like cache, but the entries are never saved by save_cache (e.g. for credentials and clients)
+    """
+    return make_cached(func, persist=False)
+
+def content_cache(func: Callable[ParamType, ReturnType])->Callable[ParamType, ReturnType]:
+    """content_cache
+    Like cache, for functions whose result can never change for the same arguments (e.g. a blob by its SHA).
+    Their saved entries never expire
+    """
+    return make_cached(func, persist=True, immutable=True)
+
+def async_cache(func: Callable[ParamType, Awaitable[ReturnType]])->Callable[ParamType, Awaitable[ReturnType]]:
+    """async_cache
+    The variant of cache for coroutine functions. Concurrent awaits with the same arguments share one task
+    """
+    cached = CachedFunction(func)
+    @wraps(func)
+    async def wrapped(*args: ParamType.args, **kwargs: ParamType.kwargs)->ReturnType:
+        return await cached.call_async(*args, **kwargs)
+    wrapped.cache = cached # type: ignore
+    return wrapped
+
+def cache_info()->Dict[str, Dict[str, int]]:
+    """cache_info
+    Get the statistics of every cached function that has been called
+    """
+    info = {}
+    for cached in CACHED_FUNCTIONS:
+        with cached.lock:
+            stats = cached.info.as_dict()
+            stats["size"] = len(cached.entries)
+        if stats["hits"] or stats["misses"]:
+            info[cached.name] = stats
+    return info
+
+def cache_stats()->Dict[str, Dict[str, int]]:
+    """cache_stats
+    Print the statistics of every cached function that has been called
+    """
+    info = cache_info()
+    for name, stats in sorted(info.items()):
+        print(
+            f"{name}: {stats['hits']} hits, {stats['misses']} misses, {stats['coalesced']} coalesced, "
+            f"{stats['errors']} errors, {stats['size']} entries",
+            file=sys.stderr
+        )
+    return info
+
+def cache_clear():
+    """cache_clear
+    Empty the caches of all cached functions
+    """
+    for cached in CACHED_FUNCTIONS:
+        cached.clear()
+
+KeyType = TypeVar("KeyType")
+ValueType = TypeVar("ValueType")
+
+class BoundedCache(Generic[KeyType, ValueType]):
+    """BoundedCache
+    A thread-safe mapping with a maximum size, which evicts the least recently used entries first.
+    """
+    maxsize: int
+    entries: "OrderedDict[KeyType, ValueType]"
+    lock: threading.Lock
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        
+    def get(self, key: KeyType, default: Optional[ValueType] = None)->Optional[ValueType]:
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        
+    def put(self, key: KeyType, value: ValueType):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            
+    def __contains__(self, key: KeyType)->bool:
+        with self.lock:
+            return key in self.entries
+        
+    def __len__(self)->int:
+        return len(self.entries)
+
+PersistentResolverType = Callable[[], Any]
+PERSISTENT_TYPES: Dict[type, Tuple[str, PersistentResolverType]] = {}
+
+def register_persistent_type(cls: type, name: str, resolve: PersistentResolverType):
+    """register_persistent_type
+    Keep objects of a type out of saved caches. They are saved as a reference by name, and replaced with
+    the object returned by resolve when the cache is loaded (e.g. the requester of PyGithub objects,
+    which holds the credentials and the connections of the current run)
+
+    args:
+        cls: type - the type of the objects
+        name: str - the name of the reference
+        resolve: PersistentResolverType - returns the object to use in place of the reference
+    """
+    PERSISTENT_TYPES[cls] = (name, resolve)
+
+class CachePickler(pickle.Pickler):
+    def persistent_id(self, obj: Any)->Optional[str]:
+        for cls, (name, _) in PERSISTENT_TYPES.items():
+            if isinstance(obj, cls):
+                return name
+        return None
+
+class CacheUnpickler(pickle.Unpickler):
+    resolved: Dict[str, Any]
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.resolved = {}
+
+    def persistent_load(self, pid: Any)->Any:
+        if pid not in self.resolved:
+            resolvers = {name: resolve for name, resolve in PERSISTENT_TYPES.values()}
+            if pid not in resolvers:
+                raise pickle.UnpicklingError(f"Unknown persistent reference {pid}")
+            self.resolved[pid] = resolvers[pid]()
+        return self.resolved[pid]
+
+def save_cache(path: Union[str, Path])->int:
+    """save_cache
+    Save the entries of all persistent caches to a file, with the time each entry was stored.
+    Functions whose entries cannot be pickled are skipped
+
+    args:
+        path: Union[str, Path] - the file to write
+    returns:
+        int - the number of saved entries
+    """
+    saved: Dict[str, bytes] = {}
+    count = 0
+    for cached in CACHED_FUNCTIONS:
+        if not cached.persist:
+            continue
+        with cached.lock:
+            entries = {key: (cached.stored.get(key, 0.0), value) for key, value in cached.entries.items()}
+        if not entries:
+            continue
+        buffer = io.BytesIO()
+        try:
+            CachePickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(entries)
+        except Exception as e:
+            print(f"Not saving the cache of {cached.name}: {e}", file=sys.stderr)
+            continue
+        saved[cached.name] = buffer.getvalue()
+        count += len(entries)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(temp_path, "wb") as f:
+        pickle.dump({"format": CACHE_FORMAT, "functions": saved}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    return count
+
+def load_cache(path: Union[str, Path], max_age: Optional[float] = None)->int:
+    """load_cache
+    Load the entries saved by save_cache. Entries already in memory are kept.
+    Only load files written by this program: loading a pickle can run arbitrary code
+
+    args:
+        path: Union[str, Path] - the file to read
+        max_age: Optional[float] - skip entries stored more than this many seconds ago, except those of content_cache
+            functions. None loads every entry
+    returns:
+        int - the number of loaded entries (0 if the file does not exist)
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    with open(path, "rb") as f:
+        saved: Dict[str, Any] = pickle.load(f)
+    if saved.get("format") != CACHE_FORMAT:
+        print(f"Not loading {path}: it was saved in an older format", file=sys.stderr)
+        return 0
+    oldest = None if max_age is None else time.time() - max_age
+    by_name = {cached.name: cached for cached in CACHED_FUNCTIONS if cached.persist}
+    count = 0
+    for name, data in saved["functions"].items():
+        cached = by_name.get(name)
+        if cached is None:
+            continue
+        try:
+            entries = CacheUnpickler(io.BytesIO(data)).load()
+        except Exception as e:
+            print(f"Not loading the cache of {name}: {e}", file=sys.stderr)
+            continue
+        with cached.lock:
+            for key, (stored, value) in entries.items():
+                if oldest is not None and stored < oldest and not cached.immutable:
+                    continue
+                if key not in cached.entries:
+                    cached.store(key, value, stored)
+                    count += 1
+    return count
 
-cache = wrapper_gen(functools_cache)
-cache_stats = lambda: None
\ No newline at end of file
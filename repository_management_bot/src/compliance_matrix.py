@@ -0,0 +1,208 @@
+from .includes import *
+from typing import Iterable, Iterator
+import threading
+
+from .get_template_details import RepoTemplate
+from .repo_detail import RepoStructureType, structure_paths
+
+"""
+compliance_matrix.py
+An org-wide view of compliance: one row per repo and one column per template file.
+The template's paths are indexed once, and every row and column is a Python int used as a bitset, so questions
+like "how many repos miss each file", "how compliant is each repo" or "which repos miss any of these files"
+are a few integer operations over the whole org instead of walks over nested structures.
+"""
+
+if hasattr(int, "bit_count"):
+    def popcount(bits: int)->int:
+        return bits.bit_count()
+else:
+    # int.bit_count is new in Python 3.10
+    def popcount(bits: int)->int:
+        return bin(bits).count("1")
+
+def iter_bits(bits: int)->Iterator[int]:
+    """iter_bits
+    Iterate over the indices of the set bits of a bitset, lowest first
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+MatrixKind = Literal["missing", "drifted", "any"]
+
+class ComplianceMatrix:
+    """ComplianceMatrix
+    Which template files each repo is missing (or has outdated), as bitsets over the template's paths (rows)
+    and over the repos (columns)
+    """
+    template: RepoTemplate
+    paths: List[str]
+    path_index: Dict[str, int]
+    repos: List[str]
+    repo_index: Dict[str, int]
+    missing_rows: List[int]
+    drifted_rows: List[int]
+    missing_columns: List[int]
+    drifted_columns: List[int]
+    lock: threading.Lock
+    def __init__(self, template: RepoTemplate):
+        self.template = template
+        self.paths = list(template.file_shas)
+        self.path_index = {path: i for i, path in enumerate(self.paths)}
+        self.repos = []
+        self.repo_index = {}
+        self.missing_rows = []
+        self.drifted_rows = []
+        self.missing_columns = [0] * len(self.paths)
+        self.drifted_columns = [0] * len(self.paths)
+        # Rows are added by concurrent workers in a multi-org scan
+        self.lock = threading.Lock()
+
+    def mask(self, paths: Iterable[str])->int:
+        """mask
+        Get the bitset of some template paths
+        """
+        bits = 0
+        for path in paths:
+            bits |= 1 << self.path_index[path]
+        return bits
+
+    def add(self, full_name: str, missing: Iterable[str] = (), drifted: Iterable[str] = ()):
+        """add
+        Add (or replace) the row of a repo
+
+        Args:
+            full_name (str): the full name of the repo
+            missing (Iterable[str]): the template files the repo does not have
+            drifted (Iterable[str]): the template files the repo has, but with different content
+        """
+        missing_bits = self.mask(missing)
+        drifted_bits = self.mask(drifted)
+        with self.lock:
+            if full_name in self.repo_index:
+                row = self.repo_index[full_name]
+                self.set_columns(row, self.missing_rows[row], self.missing_columns, False)
+                self.set_columns(row, self.drifted_rows[row], self.drifted_columns, False)
+                self.missing_rows[row] = missing_bits
+                self.drifted_rows[row] = drifted_bits
+            else:
+                row = len(self.repos)
+                self.repo_index[full_name] = row
+                self.repos.append(full_name)
+                self.missing_rows.append(missing_bits)
+                self.drifted_rows.append(drifted_bits)
+            self.set_columns(row, missing_bits, self.missing_columns, True)
+            self.set_columns(row, drifted_bits, self.drifted_columns, True)
+
+    def set_columns(self, row: int, row_bits: int, columns: List[int], value: bool):
+        for column in iter_bits(row_bits):
+            if value:
+                columns[column] |= 1 << row
+            else:
+                columns[column] &= ~(1 << row)
+
+    def add_diff(self, full_name: str, diff: Optional[RepoStructureType], drifted: Collection[str] = ()):
+        """add_diff
+        Add the row of a repo from its check_diff result
+        """
+        paths = structure_paths(diff) if diff else []
+        self.add(full_name, [path for path in paths if path not in drifted], [path for path in paths if path in drifted])
+
+    def row(self, full_name: str, kind: MatrixKind = "any")->int:
+        row = self.repo_index[full_name]
+        if kind == "missing":
+            return self.missing_rows[row]
+        if kind == "drifted":
+            return self.drifted_rows[row]
+        return self.missing_rows[row] | self.drifted_rows[row]
+
+    def column(self, path: str, kind: MatrixKind = "any")->int:
+        column = self.path_index[path]
+        if kind == "missing":
+            return self.missing_columns[column]
+        if kind == "drifted":
+            return self.drifted_columns[column]
+        return self.missing_columns[column] | self.drifted_columns[column]
+
+    def file_counts(self, kind: MatrixKind = "any")->Dict[str, int]:
+        """file_counts
+        Get the number of repos that are missing (or have outdated) each template file
+        """
+        return {path: popcount(self.column(path, kind)) for path in self.paths}
+
+    def score(self, full_name: str)->float:
+        """score
+        Get the share of template files a repo has up to date, from 0.0 to 1.0
+        """
+        if not self.paths:
+            return 1.0
+        return 1.0 - popcount(self.row(full_name)) / len(self.paths)
+
+    def repos_in(self, repo_bits: int)->List[str]:
+        return [self.repos[row] for row in iter_bits(repo_bits)]
+
+    def repos_missing_any(self, paths: Iterable[str], kind: MatrixKind = "any")->List[str]:
+        """repos_missing_any
+        Get the repos that are missing (or have outdated) at least one of some template files
+        """
+        repo_bits = 0
+        for path in paths:
+            repo_bits |= self.column(path, kind)
+        return self.repos_in(repo_bits)
+
+    def repos_missing_all(self, paths: Iterable[str], kind: MatrixKind = "any")->List[str]:
+        """repos_missing_all
+        Get the repos that are missing (or have outdated) all of some template files
+        """
+        repo_bits = (1 << len(self.repos)) - 1
+        for path in paths:
+            repo_bits &= self.column(path, kind)
+        return self.repos_in(repo_bits)
+
+    def parse_paths(self, paths: str)->List[str]:
+        """parse_paths
+        Parse a comma-separated list of template paths, e.g. from --missing-any
+        """
+        names = [path.strip() for path in paths.split(",") if path.strip()]
+        unknown = [path for path in names if path not in self.path_index]
+        if unknown:
+            raise ValueError(f"Not files of the template: {', '.join(unknown)}")
+        return names
+
+    def print_missing(self, missing_any: Optional[str] = None, missing_all: Optional[str] = None):
+        """print_missing
+        Print the repos that are missing (or have outdated) any or all of some template files
+
+        Args:
+            missing_any (Optional[str]): comma-separated template paths, of which the repos miss at least one
+            missing_all (Optional[str]): comma-separated template paths, all of which the repos miss
+        """
+        for paths, every, repos_missing in ((missing_any, False, self.repos_missing_any), (missing_all, True, self.repos_missing_all)):
+            if not paths:
+                continue
+            names = self.parse_paths(paths)
+            repos = repos_missing(names)
+            fprint(f"{len(repos)} repos are missing {'all' if every else 'any'} of {', '.join(names)}:")
+            for name in repos:
+                fprint(f"\t{name}")
+
+    def compliant_repos(self)->List[str]:
+        return [name for row, name in enumerate(self.repos) if not (self.missing_rows[row] | self.drifted_rows[row])]
+
+    def print_summary(self, top: int = 10):
+        """print_summary
+        Print how compliant the checked repos are, and the template files that are missing most often
+        """
+        if not self.repos:
+            return
+        average = sum(self.score(name) for name in self.repos) / len(self.repos)
+        fprint(f"{len(self.compliant_repos())}/{len(self.repos)} repos are compliant, average score {average:.1%}")
+        missing = self.file_counts("missing")
+        drifted = self.file_counts("drifted")
+        ranked = sorted(self.paths, key=lambda path: missing[path] + drifted[path], reverse=True)
+        for path in ranked[:top]:
+            if missing[path] + drifted[path] == 0:
+                break
+            fprint(f"\t{path}: missing in {missing[path]}, outdated in {drifted[path]}")
@@ -1,7 +1,10 @@
 from .includes import *
     
 from .access_gh import get_repo
-from .repo_detail import get_repo_structure, RepoStructureType
+from .repo_detail import get_repo_structure, structure_lookup, structure_paths, make_content_file, get_head_sha, RepoStructureType, StructureSource
+from .local_repo import LocalRepository, get_repo_source
+from .caching import register_cache_key, canonical_key
+from .profiling import profiled
 
 AWI_ORG_NAME = "AlabamaWaterInstitute"
 AWI_TEMPLATE_REPO = "awi-open-source-project-template"
@@ -11,6 +14,38 @@ def search_content_list(content_list: List[ContentFile], name: str) -> Optional[
         (content for content in content_list if content.name == name), None
     )
 
+SNAPSHOT_DIR = Path("snapshots")
+
+class TemplateDelta:
+    """TemplateDelta
+    The template files that changed between two template commits
+    """
+    from_sha: str
+    to_sha: str
+    added: List[str]
+    removed: List[str]
+    modified: List[str]
+    def __init__(self, from_sha: str, to_sha: str, old_shas: Dict[str, str], new_shas: Dict[str, str]):
+        self.from_sha = from_sha
+        self.to_sha = to_sha
+        self.added = [path for path in new_shas if path not in old_shas]
+        self.removed = [path for path in old_shas if path not in new_shas]
+        self.modified = [path for path, sha in new_shas.items() if path in old_shas and old_shas[path] != sha]
+
+    @property
+    def changed(self)->List[str]:
+        # The template files that repos have to be checked for again
+        return self.added + self.modified
+
+    def is_empty(self)->bool:
+        return not (self.added or self.removed or self.modified)
+
+    def __repr__(self)->str:
+        return (
+            f"TemplateDelta({self.from_sha[:7]}..{self.to_sha[:7]}: "
+            f"{len(self.added)} added, {len(self.removed)} removed, {len(self.modified)} modified)"
+        )
+
 @cache
 def get_template_details():
     # repo = get_org_repo(AWI_ORG_NAME, AWI_TEMPLATE_REPO)
@@ -21,24 +56,101 @@ def get_template_details():
     return repo, repo_dir, repo_file
 
 class RepoTemplate:
-    template_repo: Repository
+    template_repo: Union[Repository, StructureSource]
     template_structure: RepoStructureType
     file_list: List[Path]
+    file_shas: Dict[str, str]
     file_prefabs: Dict[str, Dict[str, Any]]
-    def __init__(self, repo_path: str = f"{AWI_ORG_NAME}/{AWI_TEMPLATE_REPO}"):
-        self.template_repo = get_repo(repo_path)
+    head_sha: Optional[str]
+    def __init__(self, repo_path: Union[str, StructureSource] = f"{AWI_ORG_NAME}/{AWI_TEMPLATE_REPO}", use_snapshots: bool = True):
+        # repo_path may also be a local checkout, mirror or directory, or a StructureSource object
+        self.template_repo = repo_path if isinstance(repo_path, StructureSource) else get_repo_source(repo_path)
         self.template_structure = {}
         self.file_list = []
+        self.file_shas = {}
         self.file_prefabs = {}
-        self.load_structure()
+        # The structure is stored per template commit, so an unchanged template costs one head lookup instead of a tree walk
+        self.head_sha = get_head_sha(self.template_repo) if use_snapshots else None
+        if self.head_sha is None or not self.load_snapshot(self.head_sha):
+            self.load_structure()
+            if self.head_sha is not None:
+                self.save_snapshot()
         
         
+    @profiled("template")
     def load_structure(self, subdir: str = "")->RepoStructureType:
         def file_registerer(content: ContentFile, path: str):
             self.file_list.append(Path(path))
+            self.file_shas[content.path] = content.sha
         self.template_structure = get_repo_structure(self.template_repo, subdir, file_registerer)
         return self.template_structure
     
+    def snapshot_path(self, head_sha: str)->Path:
+        return SNAPSHOT_DIR / self.template_repo.full_name / f"{head_sha}.json"
+
+    def read_snapshot(self, head_sha: str)->Optional[Dict[str, List[Any]]]:
+        """read_snapshot
+        Read the files of the template at a commit, as stored by save_snapshot
+        
+        Returns:
+            files (Optional[Dict[str, List[Any]]]): [sha, size, type] for every file path, None if there is no snapshot
+        """
+        path = self.snapshot_path(head_sha)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            return json.load(f)["files"]
+
+    @profiled("template")
+    def load_snapshot(self, head_sha: str)->bool:
+        files = self.read_snapshot(head_sha)
+        if files is None:
+            return False
+        structure: RepoStructureType = {}
+        for path, (sha, size, content_type) in files.items():
+            parts = path.split("/")
+            cur = structure
+            for part in parts[:-1]:
+                cur = cur.setdefault(part, {})
+            cur[parts[-1]] = make_content_file(path, sha, size, content_type)
+            # The directory of the file, like load_structure's file_registerer
+            self.file_list.append(Path(path.rpartition("/")[0]))
+            self.file_shas[path] = sha
+        self.template_structure = structure
+        return True
+
+    def save_snapshot(self):
+        if self.head_sha is None:
+            return
+        files = {}
+        for path in structure_paths(self.template_structure):
+            content = structure_lookup(self.template_structure, path)
+            if isinstance(content, ContentFile):
+                files[path] = [content.sha, content.size, content.type]
+        path = self.snapshot_path(self.head_sha)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"template": self.template_repo.full_name, "head_sha": self.head_sha, "files": files}, f)
+        os.replace(temp_path, path)
+
+    def delta_from(self, head_sha: str)->Optional[TemplateDelta]:
+        """delta_from
+        Get the template files that changed since an earlier template commit
+        
+        Args:
+            head_sha (str): the earlier commit
+        Returns:
+            delta (Optional[TemplateDelta]): the changes, None if there is no snapshot of either commit
+        """
+        if self.head_sha is None:
+            return None
+        old_files = self.read_snapshot(head_sha)
+        if old_files is None:
+            return None
+        old_shas = {path: entry[0] for path, entry in old_files.items()}
+        return TemplateDelta(head_sha, self.head_sha, old_shas, self.file_shas)
+
     def print_structure(self, subtree: Optional[Dict[str, Any]] = None, level: int = 0):
         if subtree is None:
             subtree = self.template_structure
@@ -52,10 +164,12 @@ class RepoTemplate:
             else:
                 fprint("\t"*level, f"{name}")
                 
-    def compare_repo_structure(self, repo: RepoStructureType)->RepoStructureType:
+    @profiled("diff")
+    def compare_repo_structure(self, repo: RepoStructureType, check_drift: bool = False)->RepoStructureType:
         """compare_repo
         Compare the structure of the template repo to another repo
         Creates and returns a structure of what parts of the template repo are missing in the other repo
+        If check_drift is set, files that are present but whose blob SHA differs from the template are included as well
         """
         other_structure = repo
         diff_structure = {}
@@ -89,14 +203,79 @@ class RepoTemplate:
                 elif not type2:
                     alldiff(name)
                     continue
+                if check_drift and loc.sha != loc2.sha:
+                    diff[name] = loc
         recurse_diff(self.template_structure, other_structure, diff_structure)
         if "README.md" not in diff_structure and "doc" in diff_structure:
             del diff_structure["doc"]
         return diff_structure
     
-    def compare_repo(self, repo: Repository)->RepoStructureType:
+    def compare_repo(self, repo: Union[Repository, LocalRepository], check_drift: bool = False)->RepoStructureType:
         repo_structure = get_repo_structure(repo)
-        return self.compare_repo_structure(repo_structure)
+        return self.compare_repo_structure(repo_structure, check_drift)
+    
+    @profiled("diff")
+    def find_drift_structure(self, repo: RepoStructureType)->List[str]:
+        """find_drift_structure
+        Find the template files that are present in another repo but have different content.
+        Only the git blob SHAs from the tree listings are compared, so no file content is downloaded.
+        
+        Args:
+            repo (RepoStructureType): the structure of the other repo
+        Returns:
+            drifted (List[str]): the paths of the template files that differ in the other repo
+        """
+        drifted = []
+        for path, sha in self.file_shas.items():
+            other = structure_lookup(repo, path)
+            if isinstance(other, ContentFile) and other.sha != sha:
+                drifted.append(path)
+        return drifted
+    
+    def structure_from_json(self, data: Dict[str, Any])->RepoStructureType:
+        """structure_from_json
+        Rebuild a structure made of template files from the output of structure_to_json
+        
+        Args:
+            data (Dict[str, Any]): the JSON-compatible structure
+        Returns:
+            structure (RepoStructureType): the structure, with the template's ContentFile objects as files
+        """
+        structure: RepoStructureType = {}
+        for name, content in data.items():
+            if isinstance(content, dict):
+                structure[name] = self.structure_from_json(content)
+                continue
+            template_file = structure_lookup(self.template_structure, content)
+            if not isinstance(template_file, ContentFile):
+                raise ValueError(f"{content} is not a file of the template {self.template_repo.full_name}")
+            structure[name] = template_file
+        return structure
+    
+    def structure_from_paths(self, paths: Collection[str])->RepoStructureType:
+        """structure_from_paths
+        Build a structure of template files from their paths, e.g. to rebuild a stored diff
+        """
+        structure: RepoStructureType = {}
+        for path in paths:
+            content = structure_lookup(self.template_structure, path)
+            if not isinstance(content, ContentFile):
+                raise ValueError(f"{path} is not a file of the template {self.template_repo.full_name}")
+            parts = path.split("/")
+            cur = structure
+            for part in parts[:-1]:
+                cur = cur.setdefault(part, {})
+            cur[parts[-1]] = content
+        return structure
+
+    def find_drift(self, repo: Union[Repository, LocalRepository])->List[str]:
+        repo_structure = get_repo_structure(repo)
+        return self.find_drift_structure(repo_structure)
+
+# Keyed by the template commit (or its files, without one), so results for an older template are never reused
+register_cache_key(RepoTemplate, lambda template: (
+    canonical_key(template.template_repo), template.head_sha or tuple(sorted(template.file_shas.items()))
+))
 
 if __name__ == "__main__":
     repo, repo_dir, repo_file = get_template_details()
@@ -0,0 +1,164 @@
+from .includes import *
+import subprocess
+import tempfile
+import base64
+
+from .access_gh import get_token_pool
+from .caching import transient_cache
+from .lazy_guard import get_repo_fields
+from .repo_detail import RepoStructureType, FileRegistererType, make_content_file, register_structure_provider
+
+"""
+git_backend.py
+Read repo structures over the git protocol instead of the REST API.
+A blobless, shallow, bare clone (`git clone --bare --filter=blob:none --depth 1`) only transfers the
+commit and its trees, and `git ls-tree -r -l` then lists every file with its blob SHA and size.
+This uses no REST quota, and moves far less data than a full clone.
+"""
+
+GIT_MODE_TYPES = {
+    "100644": "file",
+    "100755": "file",
+    "120000": "symlink",
+    "160000": "submodule"
+}
+
+def run_git(*args: str, cwd: Optional[Path] = None, env: Optional[Dict[str, str]] = None)->str:
+    """run_git
+    Run a git command, and return its output
+
+    args:
+        args: str - the arguments to git
+        cwd: Optional[Path] - the directory to run in
+        env: Optional[Dict[str, str]] - additional environment variables
+    returns:
+        str - the standard output of the command
+    """
+    full_env = dict(os.environ)
+    full_env["GIT_TERMINAL_PROMPT"] = "0"
+    if env:
+        full_env.update(env)
+    result = subprocess.run(["git", *args], cwd=cwd, env=full_env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+def git_auth_env(url: str)->Dict[str, str]:
+    """git_auth_env
+    Get the environment that authenticates git with the bot's token for an https URL.
+    The token is passed through GIT_CONFIG_* variables, so it never shows up in the process list
+    """
+    if not url.startswith("https://"):
+        return {}
+    pool = get_token_pool()
+    # Pushes made while preparing a PR run pinned to the credential that writes to the repo
+    token = pool.current().token if pool.usable() else None
+    if not token:
+        return {}
+    credentials = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}"
+    }
+
+def ls_tree_structure(git_dir: Path, ref: str = "HEAD", path: str = "", file_registerer: Optional[FileRegistererType] = None)->RepoStructureType:
+    """ls_tree_structure
+    Build a repo structure from the tree of a commit in a local git repository
+
+    args:
+        git_dir: Path - the git directory (a bare repo, or the .git directory of a checkout)
+        ref: str - the commit to list
+        path: str - only list below this directory
+        file_registerer: Optional[FileRegistererType] - called for every file, like in get_repo_structure
+    returns:
+        RepoStructureType - the structure, with complete ContentFile objects as files
+    """
+    args = ["--git-dir", str(git_dir), "ls-tree", "-r", "-l", "-z", ref]
+    if path:
+        args += ["--", path.rstrip("/") + "/"]
+    output = run_git(*args)
+    structure: RepoStructureType = {}
+    prefix = path.rstrip("/") + "/" if path else ""
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        info, _, file_path = entry.partition("\t")
+        mode, _, sha, size = info.split(maxsplit=3)
+        content_type = GIT_MODE_TYPES.get(mode, "file")
+        size = int(size) if size.strip().isdigit() else 0
+        parts = file_path[len(prefix):].split("/")
+        cur = structure
+        for part in parts[:-1]:
+            sub = cur.setdefault(part, {})
+            if not isinstance(sub, dict):
+                raise ValueError(f"{file_path} is below a file in {git_dir}")
+            cur = sub
+        content = make_content_file(file_path, sha, size, content_type)
+        cur[parts[-1]] = content
+        if file_registerer:
+            file_registerer(content, file_path.rpartition("/")[0])
+    return structure
+
+@transient_cache
+def get_git_structure(clone_url: str, path: str = "", ref: Optional[str] = None)->RepoStructureType:
+    """get_git_structure
+    Get the structure of a remote repository through a blobless, shallow clone into a temporary directory.
+    Cached for the rest of the run only: a URL says nothing about when the repo was last pushed to
+
+    args:
+        clone_url: str - any URL git can clone, e.g. https://github.com/owner/repo.git or file:///srv/repo.git
+        path: str - only list below this directory
+        ref: Optional[str] - the branch or tag to list, the default branch if not provided
+    returns:
+        RepoStructureType - the structure, with complete ContentFile objects as files
+    """
+    with tempfile.TemporaryDirectory(prefix="rmb-tree-") as temp_dir:
+        git_dir = Path(temp_dir) / "repo.git"
+        args = ["clone", "--bare", "--filter=blob:none", "--depth", "1", "--quiet"]
+        if ref:
+            args += ["--branch", ref]
+        run_git(*args, clone_url, str(git_dir), env=git_auth_env(clone_url))
+        return ls_tree_structure(git_dir, "HEAD", path)
+
+@cache
+def get_repo_git_structure(repo: Repository, path: str = "")->RepoStructureType:
+    # Cached by the repo, whose cache key includes its push time, so saved trees are not reused after a push
+    return get_git_structure(get_repo_fields(repo)["clone_url"], path)
+
+def get_repo_structure_git(repo: Repository, path: str = "", file_registerer: Optional[FileRegistererType] = None)->RepoStructureType:
+    """get_repo_structure_git
+    Structure provider for get_repo_structure that reads the tree over the git protocol
+    """
+    structure = get_repo_git_structure(repo, path)
+    if file_registerer:
+        def register(structure: RepoStructureType):
+            for content in structure.values():
+                if isinstance(content, ContentFile):
+                    file_registerer(content, content.path.rpartition("/")[0])
+                else:
+                    register(content)
+        register(structure)
+    return structure
+
+register_structure_provider("git", get_repo_structure_git)
+
+if __name__ == "__main__":
+    # Build a local bare repo, and read it back over file://
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work = Path(temp_dir) / "work"
+        bare = Path(temp_dir) / "bare.git"
+        work.mkdir()
+        (work / "doc").mkdir()
+        (work / "README.md").write_text("# Test\n")
+        (work / "doc" / "notes.txt").write_text("notes\n")
+        run_git("init", "--quiet", cwd=work)
+        run_git("add", ".", cwd=work)
+        run_git("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "--quiet", "-m", "init", cwd=work)
+        run_git("clone", "--bare", "--quiet", str(work), str(bare))
+        structure = get_git_structure(bare.resolve().as_uri())
+        for name, content in structure.items():
+            if isinstance(content, ContentFile):
+                fprint(name, content.sha, content.size)
+            else:
+                fprint(f"{name}/", {sub_name: sub.sha for sub_name, sub in content.items()})
@@ -5,7 +5,7 @@ from github.Repository import Repository
 from github.Branch import Branch
 from github.ContentFile import ContentFile
 from github.PullRequest import PullRequest
-from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar
+from typing import List, Tuple, Dict, Set, Any, Union, Callable, Literal, Optional, TypeVar, Collection
 import os, sys, json
 from pathlib import Path
 from .caching import cache, cache_stats
@@ -24,4 +24,8 @@ def fprint(*args, **kwargs):
     for k, v in kwargs.items():
         if isinstance(v, str):
             kwargs[k] = v.replace("\t", customtab)
-    print(*args, file=sys.stderr, **kwargs)
\ No newline at end of file
+    print(*args, file=sys.stderr, **kwargs)
+def finput(prompt: str = "")->str:
+    # Like input, but the prompt goes to stderr with the rest of the output, so stdout only carries reports
+    fprint(prompt, end="", flush=True)
+    return input()
@@ -0,0 +1,174 @@
+from .includes import *
+from typing import TypedDict
+import threading
+
+from .get_template_details import RepoTemplate, TemplateDelta, SNAPSHOT_DIR
+from .lazy_guard import listed_attribute
+from .repo_detail import RepoStructureType, StructureSource, structure_paths, get_blob_shas_batch
+from .search_scan import SearchScan
+
+"""
+incremental.py
+An org pass that reuses the results of earlier passes.
+The result of every checked repo is stored with the template commit it was checked against, and the version of the repo
+(its pushed_at date, or head commit for local repos). On the next pass:
+- a repo that has not changed since, checked against the same template commit, reuses its stored result (no requests)
+- a repo that has not changed, checked against an older template commit, is only checked for the template files that
+  changed in between (one batched lookup), using the template snapshots stored by RepoTemplate
+- anything else is checked in full
+One pass may be shared by several worker threads (and the orgs of a multi-org run); its state is guarded by a lock.
+"""
+
+StoredResult = TypedDict(
+    "StoredResult", # The compliance result of one repo, as stored between passes
+    {
+        "template_sha": str,
+        "version": str,
+        "missing": List[str],
+        "drifted": List[str]
+    }
+)
+
+def repo_version(repo: Union[Repository, StructureSource])->Optional[str]:
+    """repo_version
+    Get a value that changes whenever the content of a repo may have changed, without sending a request
+
+    returns:
+        Optional[str] - the version, None if it is unknown
+    """
+    if isinstance(repo, StructureSource):
+        return repo.head_sha()
+    pushed_at = listed_attribute(repo, "pushed_at")
+    return pushed_at.isoformat() if pushed_at is not None else None
+
+class IncrementalScan:
+    """IncrementalScan
+    Check repos against a template, reusing the stored results of earlier passes where they are still valid
+    """
+    template: RepoTemplate
+    check_drift: bool
+    path: Path
+    results: Dict[str, StoredResult]
+    deltas: Dict[str, Optional[TemplateDelta]]
+    counts: Dict[str, int]
+    search: Optional[SearchScan]
+    lock: threading.Lock
+    def __init__(self, template: RepoTemplate, check_drift: bool = False, search: Optional[SearchScan] = None):
+        self.template = template
+        self.check_drift = check_drift
+        # Repos that need a full check are checked from code search results instead of their trees, if set
+        self.search = search
+        # Results with and without drift differ, so they are stored separately
+        file_name = "results-drift.json" if check_drift else "results.json"
+        self.path = SNAPSHOT_DIR / template.template_repo.full_name / file_name
+        self.results = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.results = json.load(f)
+        self.deltas = {}
+        self.counts = {"reused": 0, "delta": 0, "full": 0}
+        self.lock = threading.Lock()
+
+    def count(self, kind: str):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def delta(self, template_sha: str)->Optional[TemplateDelta]:
+        with self.lock:
+            if template_sha in self.deltas:
+                return self.deltas[template_sha]
+        # Computed outside the lock; two threads may both compute the same delta, with the same result
+        delta = self.template.delta_from(template_sha)
+        with self.lock:
+            return self.deltas.setdefault(template_sha, delta)
+
+    def to_diff(self, missing: List[str], drifted: List[str])->Tuple[Optional[RepoStructureType], List[str]]:
+        if not missing and not drifted:
+            return None, []
+        # Keep the template's order, like compare_repo does
+        order = {path: i for i, path in enumerate(self.template.file_shas)}
+        paths = sorted(missing + drifted, key=lambda path: order.get(path, len(order)))
+        return self.template.structure_from_paths(paths), drifted
+
+    def store(self, repo: Union[Repository, StructureSource], version: Optional[str], missing: List[str], drifted: List[str]):
+        with self.lock:
+            if version is None or self.template.head_sha is None:
+                self.results.pop(repo.full_name, None)
+                return
+            self.results[repo.full_name] = {
+                "template_sha": self.template.head_sha,
+                "version": version,
+                "missing": missing,
+                "drifted": drifted
+            }
+
+    def full_check(self, repo: Union[Repository, StructureSource], version: Optional[str])->Tuple[Optional[RepoStructureType], List[str]]:
+        self.count("full")
+        if self.search is not None:
+            diff, search_drifted = self.search.check(repo)
+            paths = structure_paths(diff) if diff else []
+            drifted_paths = set(search_drifted)
+        else:
+            diff = self.template.compare_repo(repo, self.check_drift)
+            paths = structure_paths(diff)
+            drifted_paths = set(self.template.find_drift(repo)) if self.check_drift and paths else set()
+        missing = [path for path in paths if path not in drifted_paths]
+        drifted = [path for path in paths if path in drifted_paths]
+        self.store(repo, version, missing, drifted)
+        return self.to_diff(missing, drifted)
+
+    def check(self, repo: Union[Repository, StructureSource])->Tuple[Optional[RepoStructureType], List[str]]:
+        """check
+        Check a repo against the template
+
+        Args:
+            repo (Union[Repository, StructureSource]): the repo
+        Returns:
+            result (Tuple[Optional[RepoStructureType], List[str]]): the non-compliant files (None if compliant), and the paths among them
+                that exist in the repo but differ from the template
+        """
+        version = repo_version(repo)
+        with self.lock:
+            stored = self.results.get(repo.full_name)
+        if stored is None or version is None or stored["version"] != version or self.template.head_sha is None:
+            return self.full_check(repo, version)
+        if stored["template_sha"] == self.template.head_sha:
+            self.count("reused")
+            return self.to_diff(list(stored["missing"]), list(stored["drifted"]))
+        delta = self.delta(stored["template_sha"])
+        # Whether the repo has the template README decides if doc/ files count (see compare_repo_structure)
+        if delta is None or "README.md" in delta.changed or "README.md" in delta.removed:
+            return self.full_check(repo, version)
+        self.count("delta")
+        changed = set(delta.changed)
+        removed = set(delta.removed)
+        missing = [path for path in stored["missing"] if path not in changed and path not in removed]
+        drifted = [path for path in stored["drifted"] if path not in changed and path not in removed]
+        skip_doc = "README.md" not in stored["missing"] and "README.md" not in stored["drifted"]
+        to_check = [path for path in delta.changed if not (skip_doc and path.startswith("doc/"))]
+        repo_shas = get_blob_shas_batch(repo, to_check) if to_check else {}
+        for path in to_check:
+            repo_sha = repo_shas.get(path)
+            if repo_sha is None:
+                missing.append(path)
+            elif self.check_drift and repo_sha != self.template.file_shas[path]:
+                drifted.append(path)
+        self.store(repo, version, missing, drifted)
+        return self.to_diff(missing, drifted)
+
+    def save(self):
+        # Also held while writing, so two saves never interleave on the temporary file
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_suffix(".tmp")
+            with open(temp_path, "w") as f:
+                json.dump(self.results, f)
+            os.replace(temp_path, self.path)
+
+    def report(self):
+        with self.lock:
+            counts = dict(self.counts)
+        fprint(
+            f"Incremental pass: {counts['reused']} results reused, {counts['delta']} repos checked for "
+            f"changed template files only, {counts['full']} repos checked in full"
+        )
@@ -0,0 +1,167 @@
+from .includes import *
+from typing import TypedDict
+from collections import Counter
+import threading
+from github.GithubObject import GithubObject, CompletableGithubObject, Attribute, _NotSetType
+import github
+
+"""
+lazy_guard.py
+PyGithub objects created from listing responses are only partially filled in. Reading an attribute that
+the listing did not include silently sends one more request to complete the object (`_completeIfNotSet`).
+Done once per repository, that turns an org scan into N+1 requests.
+
+This module provides:
+- a guard mode, which detects and counts those lazy completions by call site (and can make them fail), and
+- a small data layer, which reads the fields the bot needs directly from the listing responses.
+"""
+
+GITHUB_PACKAGE_DIR = str(Path(github.__file__).parent)
+THIS_FILE = __file__
+
+class LazyCompletionError(RuntimeError):
+    """LazyCompletionError
+    Raised by the strict guard mode when a PyGithub object would be completed lazily
+    """
+    pass
+
+LAZY_COMPLETIONS: "Counter[str]" = Counter()
+_lazy_lock = threading.Lock()
+_original_complete_if_not_set: Optional[Callable[[CompletableGithubObject, Attribute], None]] = None
+_strict = False
+
+def lazy_call_site()->str:
+    """lazy_call_site
+    Describe where a lazy completion is coming from: the attribute that was read, and the first
+    frame outside of PyGithub that read it
+
+    returns:
+        str - a call site description, in the form "Class.attribute at file:line (function)"
+    """
+    frame = sys._getframe(1)
+    attribute = "?"
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename == THIS_FILE:
+            frame = frame.f_back
+            continue
+        if filename.startswith(GITHUB_PACKAGE_DIR):
+            if "self" in frame.f_locals and frame.f_code.co_name not in ("_completeIfNotSet", "_completeIfNeeded"):
+                attribute = f"{type(frame.f_locals['self']).__name__}.{frame.f_code.co_name}"
+            frame = frame.f_back
+            continue
+        return f"{attribute} at {os.path.relpath(filename)}:{frame.f_lineno} ({frame.f_code.co_name})"
+    return f"{attribute} at <unknown>"
+
+def enable_lazy_guard(strict: bool = False):
+    """enable_lazy_guard
+    Start counting lazy completions of PyGithub objects per call site
+
+    args:
+        strict: bool - raise a LazyCompletionError instead of completing the object
+    """
+    global _original_complete_if_not_set, _strict
+    _strict = strict
+    if _original_complete_if_not_set is not None:
+        return
+    original = CompletableGithubObject._completeIfNotSet
+    _original_complete_if_not_set = original
+    def guarded_complete_if_not_set(self: CompletableGithubObject, value: Attribute):
+        if isinstance(value, _NotSetType) and not self.completed:
+            site = lazy_call_site()
+            with _lazy_lock:
+                LAZY_COMPLETIONS[site] += 1
+            if _strict:
+                raise LazyCompletionError(f"Lazy completion of {type(self).__name__}: {site}")
+        return original(self, value)
+    CompletableGithubObject._completeIfNotSet = guarded_complete_if_not_set # type: ignore
+
+def disable_lazy_guard():
+    """disable_lazy_guard
+    Stop counting lazy completions
+    """
+    global _original_complete_if_not_set
+    if _original_complete_if_not_set is None:
+        return
+    CompletableGithubObject._completeIfNotSet = _original_complete_if_not_set # type: ignore
+    _original_complete_if_not_set = None
+
+def lazy_completion_stats()->Dict[str, int]:
+    """lazy_completion_stats
+    Get the number of lazy completions per call site, since the guard was enabled
+    """
+    with _lazy_lock:
+        return dict(LAZY_COMPLETIONS)
+
+def report_lazy_completions():
+    """report_lazy_completions
+    Print the lazy completions per call site, most frequent first
+    """
+    stats = lazy_completion_stats()
+    total = sum(stats.values())
+    fprint(f"Lazy completions: {total}")
+    for site, count in sorted(stats.items(), key=lambda item: item[1], reverse=True):
+        fprint(f"\t{count:6d}  {site}")
+
+def listed_attribute(obj: GithubObject, name: str, default: Any = None)->Any:
+    """listed_attribute
+    Read an attribute of a PyGithub object as given by the response that created it.
+    Never completes the object; returns the default if the response did not include the attribute.
+
+    args:
+        obj: GithubObject - the object to read from
+        name: str - the name of the attribute, e.g. "default_branch"
+        default: Any - the value to return if the attribute was not included
+    returns:
+        Any - the value of the attribute
+    """
+    value = getattr(obj, f"_{name}", None)
+    if value is None or isinstance(value, _NotSetType):
+        return default
+    return value.value
+
+RepoFields = TypedDict(
+    "RepoFields", # The fields of a repository that the bot uses on its hot paths
+    {
+        "full_name": str,
+        "name": str,
+        "html_url": str,
+        "clone_url": str,
+        "default_branch": str,
+        "owner_login": str,
+        "owner_html_url": str,
+        "permissions": Optional[Dict[str, bool]]
+    }
+)
+
+def get_repo_fields(repo: Repository)->RepoFields:
+    """get_repo_fields
+    Collect the fields the bot needs from a repository, using only the listing response when possible.
+    Fields the listing did not include fall back to normal (completing) attribute access.
+
+    args:
+        repo: Repository - the repository, usually from get_org_repos / get_user_repos
+    returns:
+        RepoFields - the fields
+    """
+    def field(obj: GithubObject, name: str)->Any:
+        value = listed_attribute(obj, name)
+        return value if value is not None else getattr(obj, name)
+    owner = field(repo, "owner")
+    listed_permissions = listed_attribute(repo, "permissions")
+    permissions = None
+    if listed_permissions is not None:
+        permissions = {
+            name: bool(listed_attribute(listed_permissions, name, False))
+            for name in ("admin", "maintain", "push", "triage", "pull")
+        }
+    return {
+        "full_name": field(repo, "full_name"),
+        "name": field(repo, "name"),
+        "html_url": field(repo, "html_url"),
+        "clone_url": field(repo, "clone_url"),
+        "default_branch": field(repo, "default_branch"),
+        "owner_login": field(owner, "login"),
+        "owner_html_url": field(owner, "html_url"),
+        "permissions": permissions
+    }
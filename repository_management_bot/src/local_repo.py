@@ -0,0 +1,176 @@
+from .includes import *
+import hashlib
+
+from .access_gh import get_repo
+from .git_backend import run_git, ls_tree_structure
+from .repo_detail import RepoStructureType, FileRegistererType, StructureSource, make_content_file
+from .caching import register_cache_key
+
+"""
+local_repo.py
+Read templates and target repos from the local filesystem, e.g. from a directory of checkouts or bare mirrors
+that is synced separately. Nothing is sent over the network, so compliance scans can be re-run on demand.
+- bare repos and checkouts are read with `git ls-tree` (the committed state of HEAD)
+- plain directories are walked with os.scandir, and their blob SHAs are computed like git would
+"""
+
+LocalKind = Literal["bare", "checkout", "directory"]
+
+def file_blob_sha(path: Path, size: int)->str:
+    """file_blob_sha
+    Compute the git blob SHA of a file on disk, without reading it into memory at once
+    """
+    blob_hash = hashlib.sha1(f"blob {size}\0".encode("utf-8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            blob_hash.update(chunk)
+    return blob_hash.hexdigest()
+
+def scan_directory_structure(root: Path, path: str = "", file_registerer: Optional[FileRegistererType] = None)->RepoStructureType:
+    """scan_directory_structure
+    Build a repo structure from a plain directory
+
+    args:
+        root: Path - the root of the repository
+        path: str - the directory to scan, relative to the root
+        file_registerer: Optional[FileRegistererType] - called for every file, like in get_repo_structure
+    returns:
+        RepoStructureType - the structure, with complete ContentFile objects as files
+    """
+    structure: RepoStructureType = {}
+    with os.scandir(root / path if path else root) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.name == ".git":
+                continue
+            entry_path = f"{path}/{entry.name}" if path else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                structure[entry.name] = scan_directory_structure(root, entry_path, file_registerer)
+                continue
+            if entry.is_symlink():
+                target = os.readlink(entry.path).encode("utf-8")
+                sha = hashlib.sha1(f"blob {len(target)}\0".encode("utf-8") + target).hexdigest()
+                content = make_content_file(entry_path, sha, len(target), "symlink")
+            else:
+                size = entry.stat().st_size
+                content = make_content_file(entry_path, file_blob_sha(Path(entry.path), size), size)
+            structure[entry.name] = content
+            if file_registerer:
+                file_registerer(content, path)
+    return structure
+
+class LocalRepository(StructureSource):
+    """LocalRepository
+    A repository on the local filesystem: a bare repo, a checkout, or a plain directory
+    """
+    path: Path
+    full_name: str
+    name: str
+    kind: LocalKind
+    content_version: Optional[str]
+    def __init__(self, path: Union[str, Path], full_name: Optional[str] = None):
+        self.path = Path(path).resolve()
+        if not self.path.is_dir():
+            raise FileNotFoundError(f"{path} is not a directory")
+        self.name = self.path.name[:-len(".git")] if self.path.name.endswith(".git") else self.path.name
+        self.full_name = full_name or f"{self.path.parent.name}/{self.name}"
+        if (self.path / ".git").exists():
+            self.kind = "checkout"
+        elif (self.path / "HEAD").is_file() and (self.path / "objects").is_dir():
+            self.kind = "bare"
+        else:
+            self.kind = "directory"
+        self.content_version = None
+
+    def git_dir(self)->Path:
+        if self.kind == "bare":
+            return self.path
+        # .git may be a file pointing elsewhere (worktrees, submodules), so ask git
+        return Path(run_git("rev-parse", "--absolute-git-dir", cwd=self.path).strip())
+
+    def get_structure(self, path: str = "", file_registerer: Optional[FileRegistererType] = None)->RepoStructureType:
+        if self.kind == "directory":
+            return scan_directory_structure(self.path, path, file_registerer)
+        return ls_tree_structure(self.git_dir(), "HEAD", path, file_registerer)
+
+    def head_sha(self)->Optional[str]:
+        if self.kind == "directory":
+            return None
+        return run_git("--git-dir", str(self.git_dir()), "rev-parse", "HEAD").strip()
+
+    def version(self)->str:
+        """version
+        Get a value that changes whenever the content of the repo changes: the HEAD commit, or for a plain directory
+        a fingerprint of the paths, sizes and modification times of its files. Read once per object, so the objects
+        of one listing see one version of the repo
+        """
+        if self.content_version is None:
+            if self.kind == "directory":
+                self.content_version = directory_fingerprint(self.path)
+            else:
+                try:
+                    self.content_version = self.head_sha() or ""
+                except RuntimeError:
+                    # No commits yet
+                    self.content_version = ""
+        return self.content_version
+
+    def __repr__(self)->str:
+        return f'LocalRepository(full_name="{self.full_name}", kind="{self.kind}")'
+
+def directory_fingerprint(root: Path)->str:
+    fingerprint = hashlib.sha1()
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(name for name in subdirectories if name != ".git")
+        for name in sorted(files):
+            stat = os.lstat(os.path.join(directory, name))
+            fingerprint.update(f"{os.path.relpath(os.path.join(directory, name), root)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return fingerprint.hexdigest()
+
+# The version is part of the key, so results saved by --cache-file are not reused once the repo was synced or changed
+register_cache_key(LocalRepository, lambda repo: (str(repo.path), repo.version()))
+
+def list_local_repos(local_dir: Union[str, Path])->List[LocalRepository]:
+    """list_local_repos
+    List the repositories in a directory of checkouts or mirrors. Every subdirectory is one repository,
+    named "<directory name>/<subdirectory name, without .git>"
+
+    args:
+        local_dir: Union[str, Path] - the directory
+    returns:
+        List[LocalRepository] - the repositories, sorted by name
+    """
+    local_dir = Path(local_dir).resolve()
+    repos = []
+    with os.scandir(local_dir) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.is_dir() and not entry.name.startswith("."):
+                repos.append(LocalRepository(entry.path))
+    return repos
+
+def get_repo_source(name: str)->Union[Repository, LocalRepository]:
+    """get_repo_source
+    Get a repository either from the local filesystem (if name is an existing directory) or from GitHub
+
+    args:
+        name: str - a path to a checkout, mirror or directory, or the full name of a GitHub repo
+    returns:
+        Union[Repository, LocalRepository] - the repository
+    """
+    if os.path.isdir(name):
+        return LocalRepository(name)
+    return get_repo(name)
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work = Path(temp_dir) / "mirrors" / "work"
+        work.mkdir(parents=True)
+        (work / "README.md").write_text("# Test\n")
+        run_git("init", "--quiet", cwd=work)
+        run_git("add", ".", cwd=work)
+        run_git("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "--quiet", "-m", "init", cwd=work)
+        run_git("clone", "--bare", "--quiet", str(work), str(work.parent / "bare.git"))
+        (work.parent / "plain").mkdir()
+        (work.parent / "plain" / "README.md").write_text("# Test\n")
+        for repo in list_local_repos(work.parent):
+            fprint(repo, {name: content.sha for name, content in repo.get_structure().items()})
@@ -0,0 +1,236 @@
+from typing import List, Tuple, Dict, Callable, Optional, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+import math
+
+from .caching import cache_info
+
+"""
+metrics.py
+Live metrics in the Prometheus text format, served over HTTP while the bot runs (enabled with --metrics-port).
+Updating a metric is one lock and one dictionary update, so the metrics stay on in production.
+Values that are already tracked elsewhere (cache statistics, token quotas) are read by collectors when scraped,
+instead of being updated on every call.
+
+This module only uses the standard library and the cache registry, so it can be imported anywhere.
+"""
+
+PREFIX = "repo_bot_"
+# Seconds; the compliance check of one repo usually takes between a few milliseconds (cached) and a few seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def format_labels(names: Sequence[str], values: LabelValues, extra: str = "")->str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape_label(value: str)->str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value: float)->str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """Metric
+    A metric with one value per combination of label values
+    """
+    kind: str = "untyped"
+    name: str
+    help: str
+    labels: Tuple[str, ...]
+    lock: threading.Lock
+    values: Dict[LabelValues, float]
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        METRICS.append(self)
+
+    def render(self)->List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    def set(self, *label_values: str, value: float):
+        with self.lock:
+            self.values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+class Histogram(Metric):
+    kind = "histogram"
+    buckets: Tuple[float, ...]
+    # label values -> [count per bucket (not cumulative), sum, count]
+    observations: Dict[LabelValues, List[float]]
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.observations = {}
+
+    def observe(self, *label_values: str, value: float):
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self.lock:
+            observation = self.observations.get(label_values)
+            if observation is None:
+                observation = self.observations[label_values] = [0.0] * (len(self.buckets) + 2)
+            observation[index] += 1
+            observation[-2] += value
+            observation[-1] += 1
+
+    def render(self)->List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            observations = [(label_values, list(observation)) for label_values, observation in self.observations.items()]
+        for label_values, observation in observations:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, observation):
+                cumulative += count
+                bucket_label = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, label_values, bucket_label)} {format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {format_value(observation[-2])}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {format_value(observation[-1])}")
+        return lines
+
+METRICS: List[Metric] = []
+COLLECTORS: List[Callable[[], None]] = []
+
+GITHUB_REQUESTS = Counter("github_requests_total", "GitHub API requests, by method, endpoint and status", ["method", "endpoint", "status"])
+GITHUB_REQUEST_SECONDS = Histogram("github_request_seconds", "GitHub API request latency", ["endpoint"])
+RATE_LIMIT_REMAINING = Gauge("rate_limit_remaining", "Remaining GitHub API quota, from the latest response of each resource", ["resource"])
+RATE_LIMIT_RESET = Gauge("rate_limit_reset_timestamp_seconds", "When the GitHub API quota of each resource resets", ["resource"])
+CREDENTIAL_REMAINING = Gauge("credential_rate_limit_remaining", "Estimated remaining core API quota of each credential", ["credential"])
+CACHE_HITS = Gauge("cache_hits", "Calls of each cached function answered from its cache", ["function"])
+CACHE_MISSES = Gauge("cache_misses", "Calls of each cached function that ran it", ["function"])
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Share of the calls of each cached function answered from its cache", ["function"])
+SCAN_QUEUE_DEPTH = Gauge("scan_queue_depth", "Repos left to check in the current scan")
+REPOS_CHECKED = Counter("repos_checked_total", "Repos checked, by result (compliant, noncompliant, error)", ["result"])
+REPOS_PER_SECOND = Gauge("repos_per_second", "Repos checked per second since the current scan started")
+DIFF_SECONDS = Histogram("diff_seconds", "Time to check one repo against the template")
+PULL_REQUESTS = Counter("pull_requests_total", "Compliance PRs, by action (opened, updated)", ["action"])
+WORKERS_BUSY = Gauge("workers_busy", "Workers checking a repo or preparing a PR right now")
+WORKER_BUSY_SECONDS = Counter("worker_busy_seconds_total", "Time workers spent checking repos or preparing PRs")
+WORKER_UTILIZATION = Gauge("worker_utilization", "Share of the workers' time spent busy since the current scan started")
+
+# The start of the current scan and its number of workers, for the rates computed when scraped
+SCAN_CLOCK: Dict[str, float] = {"start": 0.0, "workers": 1}
+
+def register_collector(collector: Callable[[], None]):
+    """register_collector
+    Run a function before every scrape, to copy values that are tracked elsewhere into gauges
+    """
+    COLLECTORS.append(collector)
+
+def collect_caches():
+    for name, stats in cache_info().items():
+        CACHE_HITS.set(name, value=stats["hits"])
+        CACHE_MISSES.set(name, value=stats["misses"])
+        calls = stats["hits"] + stats["misses"]
+        CACHE_HIT_RATIO.set(name, value=stats["hits"] / calls if calls else 0.0)
+
+def collect_scan_rates():
+    if not SCAN_CLOCK["start"]:
+        return
+    elapsed = time.monotonic() - SCAN_CLOCK["start"]
+    if elapsed <= 0:
+        return
+    with REPOS_CHECKED.lock:
+        checked = sum(REPOS_CHECKED.values.values())
+    with WORKER_BUSY_SECONDS.lock:
+        busy = sum(WORKER_BUSY_SECONDS.values.values())
+    REPOS_PER_SECOND.set(value=checked / elapsed)
+    WORKER_UTILIZATION.set(value=min(1.0, busy / (elapsed * SCAN_CLOCK["workers"])))
+
+register_collector(collect_caches)
+register_collector(collect_scan_rates)
+
+def start_scan_clock(queue_depth: int, workers: int = 1):
+    """start_scan_clock
+    Mark the start of a scan, for repos per second and worker utilization
+    """
+    SCAN_CLOCK["start"] = time.monotonic()
+    SCAN_CLOCK["workers"] = max(1, workers)
+    SCAN_QUEUE_DEPTH.set(value=queue_depth)
+
+class WorkerBusy:
+    """WorkerBusy
+    Context manager that counts a block as busy worker time
+    """
+    start: float
+    def __enter__(self)->"WorkerBusy":
+        self.start = time.perf_counter()
+        WORKERS_BUSY.inc(amount=1)
+        return self
+
+    def __exit__(self, *exc_info):
+        WORKERS_BUSY.inc(amount=-1)
+        WORKER_BUSY_SECONDS.inc(amount=time.perf_counter() - self.start)
+
+def render_metrics()->str:
+    for collector in COLLECTORS:
+        try:
+            collector()
+        except Exception:
+            # A failing collector should not take the other metrics down with it
+            pass
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        # Scrapes would otherwise be logged to stderr every few seconds
+        pass
+
+METRICS_SERVER: Optional[ThreadingHTTPServer] = None
+
+def start_metrics_server(port: int, host: str = "127.0.0.1")->ThreadingHTTPServer:
+    """start_metrics_server
+    Serve the metrics at http://host:port/metrics from a daemon thread
+
+    args:
+        port: int - the port to listen on (0 picks a free one)
+        host: str - the address to listen on; only local by default
+    returns:
+        ThreadingHTTPServer - the server
+    """
+    global METRICS_SERVER
+    if METRICS_SERVER is None:
+        METRICS_SERVER = ThreadingHTTPServer((host, port), MetricsHandler)
+        METRICS_SERVER.daemon_threads = True
+        threading.Thread(target=METRICS_SERVER.serve_forever, name="metrics-server", daemon=True).start()
+    return METRICS_SERVER
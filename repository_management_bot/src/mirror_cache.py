@@ -0,0 +1,214 @@
+from .includes import *
+import shutil
+import time
+
+from .git_backend import run_git, git_auth_env
+from .lazy_guard import get_repo_fields
+
+"""
+mirror_cache.py
+A persistent cache of bare mirrors for the clone-based PR path.
+Every repo that PRs are pushed from gets one blobless bare mirror, which is refreshed with an incremental
+`git fetch`, so repeated runs only transfer new objects. Changes are made in short-lived worktrees of the
+mirror, one per PR branch, and pushed explicitly. Mirrors are garbage collected, least recently used first,
+once the cache grows past its size limit.
+
+    clones/
+        mirrors/<owner>/<repo>.git      - the bare mirrors
+        worktrees/<owner>/<repo>        - the worktree of the PR that is being prepared
+"""
+
+CLONE_DIR = Path("clones")
+MIRROR_MAX_BYTES = 2 * 1024 ** 3
+LAST_USED_FILE = "rmb-last-used"
+
+ACTIVE_WORKTREES: Dict[str, Path] = {}
+FETCHED_MIRRORS: Set[str] = set()
+
+def configure_mirror_cache(clone_dir: Optional[Path] = None, max_bytes: Optional[int] = None):
+    """configure_mirror_cache
+    Set where mirrors are kept, and how large the cache may grow before mirrors are removed
+
+    args:
+        clone_dir: Optional[Path] - the cache directory
+        max_bytes: Optional[int] - the size limit of all mirrors together
+    """
+    global CLONE_DIR, MIRROR_MAX_BYTES
+    if clone_dir is not None:
+        CLONE_DIR = Path(clone_dir)
+    if max_bytes is not None:
+        MIRROR_MAX_BYTES = max_bytes
+
+def mirror_path(repo: Repository)->Path:
+    return CLONE_DIR / "mirrors" / f"{repo.full_name}.git"
+
+def worktree_path(repo: Repository)->Path:
+    return CLONE_DIR / "worktrees" / repo.full_name
+
+def directory_size(path: Path)->int:
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except OSError:
+                pass
+    return total
+
+def get_mirror(repo: Repository)->Path:
+    """get_mirror
+    Get the bare mirror of a repo, creating it on first use and fetching new objects once per run
+
+    args:
+        repo: Repository - the repo, usually the one PRs are pushed from
+    returns:
+        Path - the path of the bare mirror
+    """
+    clone_url = get_repo_fields(repo)["clone_url"]
+    auth_env = git_auth_env(clone_url)
+    path = mirror_path(repo)
+    if not (path / "HEAD").is_file():
+        if path.exists():
+            # Left over from an interrupted clone
+            shutil.rmtree(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Blobless: only the blobs that worktrees check out are ever downloaded
+        run_git("clone", "--bare", "--filter=blob:none", "--quiet", clone_url, str(path), env=auth_env)
+        # Track the remote's branches as remote-tracking refs, so fetches never touch branches checked out in worktrees
+        run_git("config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*", cwd=path)
+        FETCHED_MIRRORS.discard(repo.full_name)
+    if repo.full_name not in FETCHED_MIRRORS:
+        run_git("fetch", "--prune", "--quiet", "origin", cwd=path, env=auth_env)
+        FETCHED_MIRRORS.add(repo.full_name)
+    (path / LAST_USED_FILE).touch()
+    return path
+
+def checkout_worktree(repo: Repository, branch: Branch)->Path:
+    """checkout_worktree
+    Get a worktree of the repo with the branch checked out, creating it from the mirror if needed.
+    A worktree created by this run is reused; any other one at the same path is stale, and is replaced
+
+    args:
+        repo: Repository - the repo to push to
+        branch: Branch - the branch to check out
+    returns:
+        Path - the path of the worktree
+    """
+    path = worktree_path(repo)
+    if ACTIVE_WORKTREES.get(repo.full_name) == path and path.exists():
+        return path
+    mirror = get_mirror(repo)
+    if path.exists():
+        shutil.rmtree(path)
+    run_git("worktree", "prune", cwd=mirror)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    run_git(
+        "worktree", "add", "--force", "--quiet", "-B", branch.name, str(path.resolve()), f"origin/{branch.name}",
+        cwd=mirror, env=git_auth_env(get_repo_fields(repo)["clone_url"])
+    )
+    ACTIVE_WORKTREES[repo.full_name] = path
+    return path
+
+def push_worktree(repo: Repository, branch: Branch, commit_message: str)->bool:
+    """push_worktree
+    Commit everything in the worktree of the repo, and push it to the branch
+
+    args:
+        repo: Repository - the repo to push to
+        branch: Branch - the branch to push to
+        commit_message: str - the commit message
+    returns:
+        bool - whether there was anything to push
+    """
+    path = checkout_worktree(repo, branch)
+    run_git("add", "-A", cwd=path)
+    if not run_git("status", "--porcelain", cwd=path).strip():
+        return False
+    run_git("commit", "--quiet", "-m", commit_message, cwd=path)
+    env = git_auth_env(get_repo_fields(repo)["clone_url"])
+    if uses_lfs(path):
+        # The mirror has no LFS pre-push hook, so the objects of files stored in LFS are uploaded first
+        run_git("lfs", "push", "origin", "HEAD", cwd=path, env=env)
+    run_git("push", "--quiet", "origin", f"HEAD:refs/heads/{branch.name}", cwd=path, env=env)
+    return True
+
+def uses_lfs(path: Path)->bool:
+    """uses_lfs
+    Check whether a worktree stores files in Git LFS (and git-lfs is installed to handle them)
+    """
+    attributes = path / ".gitattributes"
+    if not attributes.exists() or shutil.which("git-lfs") is None:
+        return False
+    return "filter=lfs" in attributes.read_text(errors="replace")
+
+def lfs_tracked(path: Path, file_path: str)->bool:
+    """lfs_tracked
+    Check whether the attributes of a worktree route a file through Git LFS (and git-lfs is installed to handle it)
+
+    args:
+        path: Path - the worktree
+        file_path: str - the path of the file in the worktree
+    returns:
+        bool - whether the file is stored in LFS when committed
+    """
+    if shutil.which("git-lfs") is None:
+        return False
+    # Prints "<path>: filter: <value>", with "unspecified" when no attribute applies
+    output = run_git("check-attr", "filter", "--", file_path, cwd=path)
+    return output.strip().endswith(": filter: lfs")
+
+def remove_worktree(repo: Repository)->Path:
+    """remove_worktree
+    Remove the worktree of the repo (the mirror is kept), then bring the cache back within its size limit
+
+    args:
+        repo: Repository - the repo the worktree was created for
+    returns:
+        Path - the path of the removed worktree
+    """
+    path = worktree_path(repo)
+    ACTIVE_WORKTREES.pop(repo.full_name, None)
+    if path.exists():
+        shutil.rmtree(path)
+    mirror = mirror_path(repo)
+    if (mirror / "HEAD").is_file():
+        run_git("worktree", "prune", cwd=mirror)
+    gc_mirrors()
+    return path
+
+def gc_mirrors(max_bytes: Optional[int] = None)->List[Path]:
+    """gc_mirrors
+    Remove the least recently used mirrors until the cache is within its size limit.
+    Mirrors with a worktree in use are never removed
+
+    args:
+        max_bytes: Optional[int] - the size limit, MIRROR_MAX_BYTES if not provided
+    returns:
+        List[Path] - the removed mirrors
+    """
+    if max_bytes is None:
+        max_bytes = MIRROR_MAX_BYTES
+    mirror_root = CLONE_DIR / "mirrors"
+    if not mirror_root.exists():
+        return []
+    in_use = set(ACTIVE_WORKTREES)
+    mirrors = []
+    for head in mirror_root.glob("*/*.git/HEAD"):
+        mirror = head.parent
+        marker = mirror / LAST_USED_FILE
+        last_used = marker.stat().st_mtime if marker.exists() else 0.0
+        full_name = f"{mirror.parent.name}/{mirror.name[:-len('.git')]}"
+        mirrors.append((last_used, full_name, mirror, directory_size(mirror)))
+    total = sum(size for _, _, _, size in mirrors)
+    removed = []
+    for last_used, full_name, mirror, size in sorted(mirrors):
+        if total <= max_bytes:
+            break
+        if full_name in in_use:
+            continue
+        shutil.rmtree(mirror)
+        FETCHED_MIRRORS.discard(full_name)
+        total -= size
+        removed.append(mirror)
+        fprint(f"Removed mirror {full_name} ({size / 1024 ** 2:.1f} MB, last used {time.ctime(last_used)})")
+    return removed
@@ -0,0 +1,263 @@
+from .includes import *
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from .access_gh import CLIENT_CONFIG, get_token_pool, get_user_orgs, get_org_repos
+from .build_pr import resolve_template, dispatch_repo
+from .get_template_details import RepoTemplate
+from .reporting import ReportWriter
+from .incremental import IncrementalScan
+from .compliance_matrix import ComplianceMatrix
+from .search_scan import SearchScan, choose_strategy, search_qualifier
+from .repo_filter import parse_repo_filter, filter_repos
+from .metrics import SCAN_QUEUE_DEPTH, start_scan_clock
+
+"""
+multi_org.py
+Check many orgs in one run: --org takes a comma-separated list of orgs, or "all" for every org of the authenticated user.
+The template is loaded once, and every org shares it, the response cache and the workers.
+Every API request made for an org is charged to it, and workers always take their next repo from the org that
+has used the fewest requests so far, so a big or expensive org can not starve the others.
+With a request budget, every org gets an equal share of it, and the share an org does not need is split
+among the orgs that are still going.
+"""
+
+ALL_ORGS = "all"
+# Progress is printed every time an org gets this much closer to done
+PROGRESS_STEP = 0.1
+
+def is_multi_org(org_name: Optional[str])->bool:
+    if not org_name:
+        return False
+    return "," in org_name or org_name.strip().lower() == ALL_ORGS
+
+def parse_org_names(org_name: str)->List[str]:
+    """parse_org_names
+    Get the orgs named by --org: a comma-separated list, or "all" for every org of the authenticated user
+    """
+    if org_name.strip().lower() == ALL_ORGS:
+        names = [org.login for org in get_user_orgs()]
+        fprint(f"Checking all {len(names)} orgs of the authenticated user: {', '.join(names)}")
+    else:
+        names = [name.strip() for name in org_name.split(",") if name.strip()]
+    # Keep the given order, without duplicates
+    return list(dict.fromkeys(names))
+
+class RequestBudget:
+    """RequestBudget
+    The API requests made for each org, and the fair share of an optional total each org may use
+    """
+    total: Optional[int]
+    spent: Dict[str, int]
+    finished: Set[str]
+    lock: threading.Lock
+    def __init__(self, orgs: List[str], total: Optional[int] = None):
+        self.total = total
+        self.spent = {org: 0 for org in orgs}
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def charge(self, org: str):
+        with self.lock:
+            self.spent[org] += 1
+
+    def share(self)->Optional[float]:
+        """share
+        Get how many requests each org that is still going may use in total, None without a budget
+        """
+        if self.total is None:
+            return None
+        with self.lock:
+            going = len(self.spent) - len(self.finished)
+            if going == 0:
+                return 0.0
+            left = self.total - sum(self.spent[org] for org in self.finished)
+            return left / going
+
+    def exhausted(self, org: str)->bool:
+        share = self.share()
+        return share is not None and self.spent[org] >= share
+
+    def finish(self, org: str):
+        with self.lock:
+            self.finished.add(org)
+
+    def used(self)->int:
+        with self.lock:
+            return sum(self.spent.values())
+
+class OrgProgress:
+    """OrgProgress
+    How far the check of one org is
+    """
+    org: str
+    total: int
+    checked: int
+    in_flight: int
+    reported: int
+    def __init__(self, org: str, total: int):
+        self.org = org
+        self.total = total
+        self.checked = 0
+        self.in_flight = 0
+        self.reported = 0
+
+class MultiOrgScan:
+    """MultiOrgScan
+    The repos left to check in every org, handed to workers one at a time from the org that has used the fewest requests
+    """
+    queues: Dict[str, "deque[Repository]"]
+    progress: Dict[str, OrgProgress]
+    budget: RequestBudget
+    lock: threading.Lock
+    def __init__(self, targets: Dict[str, List[Repository]], budget: RequestBudget):
+        self.queues = {org: deque(repos) for org, repos in targets.items()}
+        self.progress = {org: OrgProgress(org, len(repos)) for org, repos in targets.items()}
+        self.budget = budget
+        self.lock = threading.Lock()
+        for org, repos in targets.items():
+            if not repos:
+                budget.finish(org)
+
+    def next(self)->Optional[Tuple[str, Repository]]:
+        """next
+        Take the next repo to check, None once every org is done (or out of budget)
+        """
+        with self.lock:
+            candidates = [org for org, queue in self.queues.items() if queue and not self.budget.exhausted(org)]
+            if not candidates:
+                return None
+            org = min(candidates, key=lambda org: (self.budget.spent[org], self.progress[org].checked))
+            self.progress[org].in_flight += 1
+            SCAN_QUEUE_DEPTH.inc(amount=-1)
+            return org, self.queues[org].popleft()
+
+    def done(self, org: str):
+        with self.lock:
+            progress = self.progress[org]
+            progress.in_flight -= 1
+            progress.checked += 1
+            if not self.queues[org] and progress.in_flight == 0:
+                # Its unused share goes to the orgs that are still going
+                self.budget.finish(org)
+            step = int(progress.checked / max(1, progress.total) / PROGRESS_STEP)
+            if step > progress.reported or progress.checked == progress.total:
+                progress.reported = step
+                fprint(f"[{org}] {progress.checked}/{progress.total} repos checked, {self.budget.spent[org]} requests")
+
+    def skipped(self, org: str)->int:
+        return len(self.queues[org])
+
+def list_org_targets(orgs: List[str], budget: RequestBudget, repo_filter: Optional[str], workers: int)->Dict[str, List[Repository]]:
+    # Parsed before any listing, so a bad expression fails before the first request
+    filters = parse_repo_filter(repo_filter)
+    pool = get_token_pool()
+    def list_org(org: str)->List[Repository]:
+        with pool.charging(lambda: budget.charge(org)):
+            return filter_repos(get_org_repos(org), filters)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(orgs, executor.map(list_org, orgs)))
+
+def multi_org_dispatch(
+    org_names: str,
+    template_name: Optional[str] = None,
+    check_drift: bool = False,
+    report: Optional[ReportWriter] = None,
+    scan_only: bool = False,
+    incremental: bool = False,
+    strategy: str = "tree",
+    repo_filter: Optional[str] = None,
+    request_budget: Optional[int] = None,
+    missing_any: Optional[str] = None,
+    missing_all: Optional[str] = None
+) -> List[Repository]:
+    """multi_org_dispatch
+    Check the repos of several orgs against one template, sharing the workers and a request budget between the orgs
+
+    Args:
+        org_names (str): a comma-separated list of orgs, or "all" for every org of the authenticated user
+        template_name (Optional[str]): the name of the template repo. A bare name is looked up in the first org
+        check_drift (bool): whether to also update files that differ from the template
+        report (Optional[ReportWriter]): where to stream one record per checked repo, of every org
+        scan_only (bool): check every repo without asking, and never prepare PRs. Only scans use more than one worker,
+            since preparing PRs asks for confirmation
+        incremental (bool): reuse the stored results of earlier passes, and only check what changed since
+        strategy (str): how repos are checked ("tree", "search" or "auto"), chosen for each org
+        repo_filter (Optional[str]): filter expressions for the listed repos of every org
+        request_budget (Optional[int]): the most API requests to make for all orgs together, shared fairly between them
+        missing_any (Optional[str]): comma-separated template paths; list the checked repos of each org missing any of them
+        missing_all (Optional[str]): comma-separated template paths; list the checked repos of each org missing all of them
+    Returns:
+        result (List[Repository]): the repos that PRs were created for
+    """
+    orgs = parse_org_names(org_names)
+    if not orgs:
+        raise ValueError(f"No orgs in {org_names!r}")
+    template = resolve_template(template_name, orgs[0])
+    for paths in (missing_any, missing_all):
+        if paths:
+            ComplianceMatrix(template).parse_paths(paths)
+    fprint(f"Targeting {len(orgs)} orgs with template {template.template_repo.full_name}")
+    workers = CLIENT_CONFIG["workers"] if scan_only else 1
+    budget = RequestBudget(orgs, request_budget)
+    targets = list_org_targets(orgs, budget, repo_filter, workers)
+    # One incremental pass for all orgs, since its results are stored per template
+    scan = IncrementalScan(template, check_drift) if incremental else None
+    searches: Dict[str, SearchScan] = {}
+    if scan is None:
+        for org, repos in targets.items():
+            qualifier = search_qualifier(org, None)
+            if choose_strategy(strategy, repos, template, qualifier) == "search":
+                searches[org] = SearchScan(template, qualifier, check_drift)
+        if searches:
+            fprint(f"Checking {', '.join(searches)} with one code search per template file ({len(template.file_shas)} files)")
+    matrices = {org: ComplianceMatrix(template) for org in orgs}
+    queue = MultiOrgScan(targets, budget)
+    total = sum(len(repos) for repos in targets.values())
+    fprint(f"{total} repos to check in {len(orgs)} orgs, with {workers} workers")
+    start_scan_clock(total, workers)
+    pool = get_token_pool()
+    result: List[Repository] = []
+    def work():
+        while True:
+            item = queue.next()
+            if item is None:
+                return
+            org, repo = item
+            try:
+                with pool.charging(lambda: budget.charge(org)):
+                    if dispatch_repo(repo, template, check_drift, report, scan_only, scan, matrices[org], searches.get(org)):
+                        result.append(repo)
+            finally:
+                queue.done(org)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(work) for _ in range(workers)]
+            for future in futures:
+                future.result()
+    finally:
+        SCAN_QUEUE_DEPTH.set(value=0)
+        if scan is not None:
+            scan.save()
+            scan.report()
+        for org in orgs:
+            fprint(f"{org}:")
+            matrices[org].print_summary()
+            matrices[org].print_missing(missing_any, missing_all)
+            if org in searches and searches[org].holders is not None:
+                searches[org].report()
+        print_org_summary(queue, matrices)
+    fprint(f"PRs created for {len(result)} repos")
+    return result
+
+def print_org_summary(queue: MultiOrgScan, matrices: Dict[str, ComplianceMatrix]):
+    fprint(f"{'org':<30}{'repos':>8}{'checked':>9}{'compliant':>11}{'skipped':>9}{'requests':>10}")
+    for org, progress in queue.progress.items():
+        fprint(
+            f"{org:<30}{progress.total:>8}{progress.checked:>9}{len(matrices[org].compliant_repos()):>11}"
+            f"{queue.skipped(org):>9}{queue.budget.spent[org]:>10}"
+        )
+    skipped = sum(queue.skipped(org) for org in queue.queues)
+    if skipped:
+        fprint(f"{skipped} repos were not checked, the request budget of {queue.budget.total} ran out")
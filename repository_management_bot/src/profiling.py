@@ -0,0 +1,194 @@
+from typing import List, Tuple, Dict, Any, Callable, Optional, TypeVar, Iterator
+from pathlib import Path
+from functools import wraps
+from contextlib import contextmanager
+import cProfile
+import pstats
+import tracemalloc
+import threading
+import time
+import io
+import sys
+
+"""
+profiling.py
+Per-phase CPU and memory profiling, enabled with --profile.
+Every phase of a run (import, auth, template, listing, structure, diff, commit, pr) gets its own cProfile profiler and
+tracemalloc measurements, and a report with its cumulative-time call trees and top allocators.
+Phases nest: while an inner phase runs, the outer phase's profiler is paused, so time is counted in the innermost phase only.
+Allocations of an inner phase are also included in the outer phase.
+
+This module only uses the standard library, so it can be imported (and started) before anything else.
+"""
+
+ReturnType = TypeVar("ReturnType")
+
+PHASES = ["import", "auth", "template", "listing", "structure", "diff", "commit", "pr"]
+REPORT_TOP = 30
+TRACEBACK_FRAMES = 5
+
+class PhaseStats:
+    """PhaseStats
+    The measurements of one phase, over all of its runs
+    """
+    name: str
+    profiler: cProfile.Profile
+    runs: int
+    seconds: float
+    allocations: Dict[Any, List[int]]
+    def __init__(self, name: str):
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.runs = 0
+        self.seconds = 0.0
+        # traceback -> [size difference, count difference]
+        self.allocations = {}
+
+    def add_allocations(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+        for stat in after.compare_to(before, "traceback"):
+            if stat.size_diff <= 0:
+                continue
+            totals = self.allocations.setdefault(stat.traceback, [0, 0])
+            totals[0] += stat.size_diff
+            totals[1] += stat.count_diff
+
+PROFILE_DIR: Optional[Path] = None
+PHASE_STATS: Dict[str, PhaseStats] = {}
+# The phases entered on the profiled thread, innermost last: (name, start time, overhead at start, tracemalloc snapshot)
+PHASE_STACK: List[Tuple[str, float, float, Optional[tracemalloc.Snapshot]]] = []
+PROFILED_THREAD: Optional[int] = None
+# The time spent taking and comparing snapshots, which is left out of the wall time of the phases
+SNAPSHOT_SECONDS = 0.0
+
+def take_snapshot()->tracemalloc.Snapshot:
+    global SNAPSHOT_SECONDS
+    start = time.perf_counter()
+    snapshot = tracemalloc.take_snapshot()
+    SNAPSHOT_SECONDS += time.perf_counter() - start
+    return snapshot
+
+def record_allocations(stats: PhaseStats, before: tracemalloc.Snapshot):
+    global SNAPSHOT_SECONDS
+    after = take_snapshot()
+    start = time.perf_counter()
+    stats.add_allocations(before, after)
+    SNAPSHOT_SECONDS += time.perf_counter() - start
+
+def enable_profiling(directory: Path):
+    """enable_profiling
+    Start profiling phases, and tracing memory allocations. Only the calling thread is profiled
+
+    args:
+        directory: Path - where write_profile_reports writes the reports
+    """
+    global PROFILE_DIR, PROFILED_THREAD
+    PROFILE_DIR = Path(directory)
+    PROFILED_THREAD = threading.get_ident()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEBACK_FRAMES)
+
+def profiling_enabled()->bool:
+    return PROFILE_DIR is not None and threading.get_ident() == PROFILED_THREAD
+
+@contextmanager
+def profile_phase(name: str)->Iterator[None]:
+    """profile_phase
+    Profile a block of code as a phase. Does nothing unless profiling is enabled.
+    Re-entering the phase that is already innermost (e.g. through recursion) continues it
+
+    args:
+        name: str - the name of the phase
+    """
+    if not profiling_enabled() or (PHASE_STACK and PHASE_STACK[-1][0] == name):
+        yield
+        return
+    stats = PHASE_STATS.get(name)
+    if stats is None:
+        stats = PHASE_STATS[name] = PhaseStats(name)
+    if PHASE_STACK:
+        PHASE_STATS[PHASE_STACK[-1][0]].profiler.disable()
+    # Snapshots are only compared for the outermost run of a phase, so recursive phases are not counted twice
+    outermost = all(entry[0] != name for entry in PHASE_STACK)
+    snapshot = take_snapshot() if outermost else None
+    PHASE_STACK.append((name, time.perf_counter(), SNAPSHOT_SECONDS, snapshot))
+    stats.profiler.enable()
+    try:
+        yield
+    finally:
+        stats.profiler.disable()
+        end = time.perf_counter()
+        _, start, overhead, before = PHASE_STACK.pop()
+        stats.runs += 1
+        stats.seconds += end - start - (SNAPSHOT_SECONDS - overhead)
+        if before is not None:
+            record_allocations(stats, before)
+        if PHASE_STACK:
+            PHASE_STATS[PHASE_STACK[-1][0]].profiler.enable()
+
+def profiled(name: str)->Callable[[Callable[..., ReturnType]], Callable[..., ReturnType]]:
+    """profiled
+    Decorator version of profile_phase. Place it under @cache, so cache hits are not profiled
+    """
+    def decorator(func: Callable[..., ReturnType])->Callable[..., ReturnType]:
+        @wraps(func)
+        def wrapped(*args: Any, **kwargs: Any)->ReturnType:
+            if not profiling_enabled():
+                return func(*args, **kwargs)
+            with profile_phase(name):
+                return func(*args, **kwargs)
+        return wrapped
+    return decorator
+
+def format_phase_report(stats: PhaseStats)->str:
+    """format_phase_report
+    Build the text report of one phase: its time, the functions with the most cumulative time and what they call,
+    and the code that allocated the most memory
+    """
+    out = io.StringIO()
+    out.write(f"Phase: {stats.name}\n")
+    out.write(f"Runs: {stats.runs}, wall time: {stats.seconds:.3f}s\n\n")
+    profile_stats = pstats.Stats(stats.profiler, stream=out)
+    if profile_stats.total_calls:
+        profile_stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE)
+        out.write("=== Cumulative time ===\n")
+        profile_stats.print_stats(REPORT_TOP)
+        out.write("=== Call tree (callees of the top functions) ===\n")
+        profile_stats.print_callees(REPORT_TOP // 2)
+    out.write("=== Top allocators (net new memory, including nested phases) ===\n")
+    top = sorted(stats.allocations.items(), key=lambda item: item[1][0], reverse=True)[:REPORT_TOP]
+    if not top:
+        out.write("(none)\n")
+    for traceback, (size, count) in top:
+        out.write(f"{size / 1024:10.1f} KiB in {count} blocks\n")
+        for line in traceback.format(limit=TRACEBACK_FRAMES, most_recent_first=True):
+            out.write(f"    {line}\n")
+    return out.getvalue()
+
+def write_profile_reports()->List[Path]:
+    """write_profile_reports
+    Write the report of every phase that ran, as <phase>.txt (readable) and <phase>.prof (for pstats or snakeviz),
+    and a summary of all phases
+
+    returns:
+        List[Path] - the written reports
+    """
+    if PROFILE_DIR is None:
+        return []
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    written = []
+    summary = io.StringIO()
+    summary.write(f"{'phase':<12}{'runs':>8}{'seconds':>12}{'net KiB':>12}\n")
+    order = [name for name in PHASES if name in PHASE_STATS] + sorted(set(PHASE_STATS) - set(PHASES))
+    for name in order:
+        stats = PHASE_STATS[name]
+        report_path = PROFILE_DIR / f"{name}.txt"
+        report_path.write_text(format_phase_report(stats))
+        stats.profiler.dump_stats(str(PROFILE_DIR / f"{name}.prof"))
+        written.append(report_path)
+        net_kib = sum(size for size, _ in stats.allocations.values()) / 1024
+        summary.write(f"{name:<12}{stats.runs:>8}{stats.seconds:>12.3f}{net_kib:>12.1f}\n")
+    summary_path = PROFILE_DIR / "summary.txt"
+    summary_path.write_text(summary.getvalue())
+    written.append(summary_path)
+    print(summary.getvalue(), file=sys.stderr, end="")
+    return written
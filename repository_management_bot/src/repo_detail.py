@@ -1,19 +1,303 @@
 from __future__ import annotations
 from .includes import *
+from abc import ABC, abstractmethod
 
 from .access_gh import get_repo_dir
+from .lazy_guard import get_repo_fields
+from github import Github
+from github.Requester import Requester
+from .caching import BoundedCache, transient_cache
+from .profiling import profiled
 
 RepoStructureType = Dict[str, Union[ContentFile, "RepoStructureType"]]
+FileRegistererType = Callable[[ContentFile, str], None]
+StructureProviderType = Callable[[Repository, str, Optional[FileRegistererType]], RepoStructureType]
 
 
-def get_repo_structure(repo: Repository, path: str = "", file_registerer: Optional[Callable[[ContentFile, str], None]] = None)->Dict[str, Any]:
+def get_repo_structure_api(repo: Repository, path: str = "", file_registerer: Optional[FileRegistererType] = None)->Dict[str, Any]:
     repo_dir = get_repo_dir(repo, path)
     repo_structure = {}
     for content in repo_dir:
         if content.type == "dir":
-            repo_structure[content.name] = get_repo_structure(repo, content.path)
+            repo_structure[content.name] = get_repo_structure_api(repo, content.path, file_registerer)
         else:
             repo_structure[content.name] = content
             if file_registerer:
                 file_registerer(content, path)
-    return repo_structure
\ No newline at end of file
+    return repo_structure
+
+STRUCTURE_PROVIDERS: Dict[str, StructureProviderType] = {
+    "api": get_repo_structure_api
+}
+STRUCTURE_PROVIDER = "api"
+
+def register_structure_provider(name: str, provider: StructureProviderType):
+    """register_structure_provider
+    Make another way of reading repo structures available to set_structure_provider
+    
+    args:
+        name: str - the name to select the provider by
+        provider: StructureProviderType - called like get_repo_structure
+    """
+    STRUCTURE_PROVIDERS[name] = provider
+
+def set_structure_provider(name: str):
+    """set_structure_provider
+    Select how get_repo_structure reads repo structures for the rest of the run
+    
+    args:
+        name: str - the name of a registered provider, e.g. "api" (the Contents API) or "git"
+    """
+    global STRUCTURE_PROVIDER
+    if name not in STRUCTURE_PROVIDERS:
+        raise ValueError(f"Unknown structure provider {name}, expected one of {', '.join(STRUCTURE_PROVIDERS)}")
+    STRUCTURE_PROVIDER = name
+
+class StructureSource(ABC):
+    """StructureSource
+    A repository that is not read through GitHub (e.g. a local checkout or mirror), and provides its own structure.
+    get_repo_structure reads these directly, whichever structure provider is selected
+    """
+    full_name: str
+    name: str
+    @abstractmethod
+    def get_structure(self, path: str = "", file_registerer: Optional[FileRegistererType] = None)->RepoStructureType:
+        ...
+
+    def head_sha(self)->Optional[str]:
+        # The commit the structure is read from, None if the source has no commits
+        return None
+
+@profiled("structure")
+def get_repo_structure(repo: Union[Repository, StructureSource], path: str = "", file_registerer: Optional[FileRegistererType] = None)->Dict[str, Any]:
+    if isinstance(repo, StructureSource):
+        return repo.get_structure(path, file_registerer)
+    return STRUCTURE_PROVIDERS[STRUCTURE_PROVIDER](repo, path, file_registerer)
+
+@transient_cache
+def get_detached_requester()->Requester:
+    # A requester that is never used to send anything, for objects that are not built from API responses
+    return Github().requester
+
+def make_content_file(path: str, sha: str, size: int, content_type: str = "file")->ContentFile:
+    """make_content_file
+    Build a complete ContentFile for a file that was not listed through the Contents API
+    (e.g. from `git ls-tree`), so it can be used in repo structures like any other
+    
+    args:
+        path: str - the path of the file in the repo
+        sha: str - the git blob SHA of the file
+        size: int - the size of the file, in bytes
+        content_type: str - "file", "symlink" or "submodule"
+    returns:
+        ContentFile - the file. It is marked complete, so reading missing attributes never sends a request
+    """
+    attributes = {
+        "name": path.rpartition("/")[2],
+        "path": path,
+        "sha": sha,
+        "size": size,
+        "type": content_type
+    }
+    return ContentFile(get_detached_requester(), {}, attributes, completed=True)
+
+def structure_lookup(structure: RepoStructureType, path: str)->Union[ContentFile, RepoStructureType, None]:
+    """structure_lookup
+    Find the entry at a path inside of a repo structure
+    
+    args:
+        structure: RepoStructureType - the structure to search
+        path: str - the path to the entry, in the form "dir/subdir/file"
+    returns:
+        Union[ContentFile, RepoStructureType, None] - the entry, or None if the path does not exist
+    """
+    cur: Union[ContentFile, RepoStructureType, None] = structure
+    for part in path.split("/"):
+        if not part:
+            continue
+        if not isinstance(cur, dict) or part not in cur:
+            return None
+        cur = cur[part]
+    return cur
+
+
+SubtreeStatsType = Tuple[int, int]
+TREE_STATS: BoundedCache[str, SubtreeStatsType] = BoundedCache(4096)
+HISTORY_BATCH_SIZE = 100
+
+def get_subtree_stats(repo: Repository, tree_sha: str)->SubtreeStatsType:
+    """get_subtree_stats
+    Get the total size and number of files below a git tree.
+    The whole tree is fetched with one recursive request, and the stats of every subtree in it
+    are computed in a single bottom-up pass and cached by tree SHA, so later lookups of nested
+    directories (or unchanged directories in other commits) are free.
+    Trees too big for one recursive response (truncated by GitHub) are walked one level at a time instead,
+    so the totals are always complete.
+    
+    args:
+        repo: Repository - the repository that holds the tree
+        tree_sha: str - the SHA of the tree (the `sha` of a directory ContentFile)
+    returns:
+        SubtreeStatsType - (total_size, total_files)
+    """
+    cached = TREE_STATS.get(tree_sha)
+    if cached is not None:
+        return cached
+    tree = repo.get_git_tree(tree_sha, recursive=True)
+    if tree.truncated:
+        return walk_subtree_stats(repo, tree_sha)
+    dir_shas: Dict[str, str] = {"": tree_sha}
+    totals: Dict[str, List[int]] = {"": [0, 0]}
+    for element in tree.tree:
+        if element.type == "tree":
+            dir_shas[element.path] = element.sha
+            totals.setdefault(element.path, [0, 0])
+        elif element.type == "blob":
+            parent = element.path.rpartition("/")[0]
+            total = totals.setdefault(parent, [0, 0])
+            total[0] += element.size or 0
+            total[1] += 1
+    # Deepest directories first, so every directory is complete before it is added to its parent
+    for path in sorted(totals, key=lambda p: p.count("/") if p else -1, reverse=True):
+        if not path:
+            continue
+        parent = path.rpartition("/")[0]
+        parent_total = totals.setdefault(parent, [0, 0])
+        parent_total[0] += totals[path][0]
+        parent_total[1] += totals[path][1]
+    for path, sha in dir_shas.items():
+        size, files = totals[path]
+        TREE_STATS.put(sha, (size, files))
+    size, files = totals[""]
+    return size, files
+
+def walk_subtree_stats(repo: Repository, tree_sha: str)->SubtreeStatsType:
+    # The files of this level, plus the stats of every subtree, each of which may fit in one recursive request
+    size = 0
+    files = 0
+    for element in repo.get_git_tree(tree_sha).tree:
+        if element.type == "tree":
+            subtree_size, subtree_files = get_subtree_stats(repo, element.sha)
+            size += subtree_size
+            files += subtree_files
+        elif element.type == "blob":
+            size += element.size or 0
+            files += 1
+    TREE_STATS.put(tree_sha, (size, files))
+    return size, files
+
+@transient_cache
+def get_head_sha(repo: Union[Repository, StructureSource])->Optional[str]:
+    """get_head_sha
+    Get the commit at the head of the default branch of a repo, with one small request (or none, for local sources).
+    Cached for the rest of the run only
+    
+    args:
+        repo: Union[Repository, StructureSource] - the repository
+    returns:
+        Optional[str] - the commit SHA, None if the repository has no commits
+    """
+    if isinstance(repo, StructureSource):
+        return repo.head_sha()
+    branch = get_repo_fields(repo)["default_branch"]
+    return repo.get_git_ref(f"heads/{branch}").object.sha
+
+def get_blob_shas_batch(repo: Union[Repository, StructureSource], paths: List[str])->Dict[str, Optional[str]]:
+    """get_blob_shas_batch
+    Look up the blob SHAs of a few paths on the default branch, without listing the whole tree.
+    Paths are batched into aliased GraphQL object lookups, like get_last_modified_batch
+    
+    args:
+        repo: Union[Repository, StructureSource] - the repository to query
+        paths: List[str] - the file paths to look up
+    returns:
+        Dict[str, Optional[str]] - the blob SHA of each path, None if it is not a file in the repo
+    """
+    results: Dict[str, Optional[str]] = {}
+    if isinstance(repo, StructureSource):
+        structure = repo.get_structure()
+        for path in paths:
+            content = structure_lookup(structure, path)
+            results[path] = content.sha if isinstance(content, ContentFile) else None
+        return results
+    owner, name = get_repo_fields(repo)["full_name"].split("/")
+    branch = get_repo_fields(repo)["default_branch"]
+    for start in range(0, len(paths), HISTORY_BATCH_SIZE):
+        batch = paths[start:start + HISTORY_BATCH_SIZE]
+        params = ", ".join(f"$p{i}: String!" for i in range(len(batch)))
+        fields = " ".join(f"p{i}: object(expression: $p{i}) {{ ... on Blob {{ oid }} }}" for i in range(len(batch)))
+        query = f"query($owner: String!, $name: String!, {params}) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}"
+        variables: Dict[str, Any] = {"owner": owner, "name": name}
+        variables.update({f"p{i}": f"{branch}:{path}" for i, path in enumerate(batch)})
+        _, data = repo.requester.graphql_query(query, variables)
+        repository = data["data"]["repository"] or {}
+        for i, path in enumerate(batch):
+            blob = repository.get(f"p{i}")
+            results[path] = blob.get("oid") if blob else None
+    return results
+
+def get_last_modified_batch(repo: Repository, paths: List[str])->Dict[str, Optional[str]]:
+    """get_last_modified_batch
+    Get the date of the last commit on the default branch that touched each path.
+    Paths are batched into aliased GraphQL history lookups, so a whole directory costs one request
+    (per HISTORY_BATCH_SIZE entries) instead of one request per file.
+    
+    args:
+        repo: Repository - the repository to query
+        paths: List[str] - the paths to look up (files or directories)
+    returns:
+        Dict[str, Optional[str]] - the ISO 8601 commit date for each path, None if unknown
+    """
+    results: Dict[str, Optional[str]] = {}
+    owner, name = repo.full_name.split("/")
+    for start in range(0, len(paths), HISTORY_BATCH_SIZE):
+        batch = paths[start:start + HISTORY_BATCH_SIZE]
+        params = ", ".join(f"$p{i}: String!" for i in range(len(batch)))
+        fields = " ".join(
+            f"p{i}: history(first: 1, path: $p{i}) {{ nodes {{ committedDate }} }}" for i in range(len(batch))
+        )
+        query = (
+            f"query($owner: String!, $name: String!, {params}) {{ repository(owner: $owner, name: $name) {{ "
+            f"defaultBranchRef {{ target {{ ... on Commit {{ {fields} }} }} }} }} }}"
+        )
+        variables: Dict[str, Any] = {"owner": owner, "name": name}
+        variables.update({f"p{i}": path for i, path in enumerate(batch)})
+        _, data = repo.requester.graphql_query(query, variables)
+        ref = data["data"]["repository"]["defaultBranchRef"]
+        target = ref["target"] if ref else {}
+        for i, path in enumerate(batch):
+            nodes = target.get(f"p{i}", {}).get("nodes", [])
+            results[path] = nodes[0]["committedDate"] if nodes else None
+    return results
+
+def structure_paths(structure: RepoStructureType)->List[str]:
+    """structure_paths
+    List the paths of all files in a repo structure
+    
+    args:
+        structure: RepoStructureType - the structure
+    returns:
+        List[str] - the paths of the files, in the order of the structure
+    """
+    paths = []
+    for name, content in structure.items():
+        if isinstance(content, ContentFile):
+            paths.append(content.path)
+        else:
+            paths.extend(structure_paths(content))
+    return paths
+
+def structure_to_json(structure: RepoStructureType)->Dict[str, Any]:
+    """structure_to_json
+    Convert a repo structure into plain data that can be written as JSON.
+    Files become their path, directories stay nested dictionaries (including empty ones)
+    
+    args:
+        structure: RepoStructureType - the structure
+    returns:
+        Dict[str, Any] - the JSON-compatible structure
+    """
+    return {
+        name: content.path if isinstance(content, ContentFile) else structure_to_json(content)
+        for name, content in structure.items()
+    }
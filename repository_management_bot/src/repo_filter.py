@@ -0,0 +1,138 @@
+from .includes import *
+from datetime import datetime, timedelta, timezone
+import re
+
+from .lazy_guard import listed_attribute
+
+"""
+repo_filter.py
+Filter repos before anything is requested for them, using only the fields of the listing response.
+Filters are written as space-separated expressions, all of which must match:
+    archived=false fork=false size>0 pushed_at>=2024-01-01 pushed_at>90d topics~python language=Python,Go visibility!=private
+- operators: = != > >= < <= and ~ (contains, for topics and text)
+- a comma-separated value matches any of its items; with != it matches none of them (visibility!=private,internal)
+- dates are ISO dates, or "<N>d" for N days ago
+- "mirror" and "empty" are derived from mirror_url and size. size is in KB and updated lazily by GitHub,
+  so a repo that was just pushed to can still look empty; empty is never filtered on unless asked for
+"""
+
+FILTER_FIELDS: Dict[str, str] = {
+    "archived": "bool",
+    "disabled": "bool",
+    "fork": "bool",
+    "private": "bool",
+    "is_template": "bool",
+    "mirror": "bool",
+    "empty": "bool",
+    "size": "int",
+    "stargazers_count": "int",
+    "pushed_at": "date",
+    "created_at": "date",
+    "updated_at": "date",
+    "topics": "list",
+    "language": "str",
+    "visibility": "str",
+    "name": "str",
+    "full_name": "str"
+}
+FILTER_EXPRESSION = re.compile(r"^(?P<field>[a-z_]+)(?P<op>!=|>=|<=|=|>|<|~)(?P<value>.*)$")
+
+class RepoFilter:
+    """RepoFilter
+    One filter expression, e.g. "size>0"
+    """
+    field: str
+    op: str
+    values: List[Any]
+    def __init__(self, expression: str):
+        match = FILTER_EXPRESSION.match(expression)
+        if match is None:
+            raise ValueError(f"Invalid repo filter {expression}, expected <field><operator><value>")
+        self.field = match["field"]
+        self.op = match["op"]
+        if self.field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown repo filter field {self.field}, expected one of {', '.join(FILTER_FIELDS)}")
+        self.values = [parse_filter_value(FILTER_FIELDS[self.field], value) for value in match["value"].split(",")]
+
+    def matches(self, repo: Repository)->bool:
+        value = repo_filter_value(repo, self.field)
+        if self.op == "!=":
+            return all(compare_filter_value(value, self.op, expected) for expected in self.values)
+        return any(compare_filter_value(value, self.op, expected) for expected in self.values)
+
+    def __repr__(self)->str:
+        return f'RepoFilter("{self.field}{self.op}{",".join(map(str, self.values))}")'
+
+def parse_filter_value(kind: str, value: str)->Any:
+    if kind == "bool":
+        if value.lower() not in ("true", "false"):
+            raise ValueError(f"Expected true or false, got {value}")
+        return value.lower() == "true"
+    if kind == "int":
+        return int(value)
+    if kind == "date":
+        if value.endswith("d") and value[:-1].isdigit():
+            return datetime.now(timezone.utc) - timedelta(days=int(value[:-1]))
+        date = datetime.fromisoformat(value)
+        return date if date.tzinfo is not None else date.replace(tzinfo=timezone.utc)
+    return value
+
+def repo_filter_value(repo: Repository, field: str)->Any:
+    """repo_filter_value
+    Read a filter field of a repo from its listing response, without completing it
+    """
+    if field == "mirror":
+        return listed_attribute(repo, "mirror_url") is not None
+    if field == "empty":
+        return listed_attribute(repo, "size", 0) == 0
+    value = listed_attribute(repo, field)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    if value is None and FILTER_FIELDS[field] == "bool":
+        return False
+    return value
+
+def compare_filter_value(value: Any, op: str, expected: Any)->bool:
+    if op == "~":
+        if isinstance(value, list):
+            return expected in value
+        return value is not None and str(expected).lower() in str(value).lower()
+    if isinstance(value, str) and isinstance(expected, str):
+        value, expected = value.lower(), expected.lower()
+    if op == "=":
+        return value == expected
+    if op == "!=":
+        return value != expected
+    if value is None:
+        return False
+    if op == ">":
+        return value > expected
+    if op == ">=":
+        return value >= expected
+    if op == "<":
+        return value < expected
+    return value <= expected
+
+def parse_repo_filter(expressions: Optional[str])->List[RepoFilter]:
+    """parse_repo_filter
+    Parse space-separated filter expressions. "none" (or nothing) gives no filters
+    """
+    if not expressions or expressions.strip().lower() == "none":
+        return []
+    return [RepoFilter(expression) for expression in expressions.split()]
+
+def filter_repos(repos: List[Repository], filters: List[RepoFilter])->List[Repository]:
+    """filter_repos
+    Keep the repos that match every filter
+
+    args:
+        repos: List[Repository] - repos from a listing
+        filters: List[RepoFilter] - the filters
+    returns:
+        List[Repository] - the matching repos, in the same order
+    """
+    if not filters:
+        return repos
+    kept = [repo for repo in repos if all(repo_filter.matches(repo) for repo_filter in filters)]
+    fprint(f"Filtered out {len(repos) - len(kept)} of {len(repos)} repos")
+    return kept
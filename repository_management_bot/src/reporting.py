@@ -0,0 +1,129 @@
+from .includes import *
+from typing import TypedDict, TextIO
+import csv
+import threading
+
+from .repo_detail import RepoStructureType, structure_paths
+
+"""
+reporting.py
+Stream compliance results as one record per repo, in JSONL or CSV, while a scan runs.
+Every record is flushed as soon as it is written, so nothing is held back in memory,
+and consumers can process the report while it is still being written.
+"""
+
+ReportFormat = Literal["jsonl", "csv"]
+
+ReportRecord = TypedDict(
+    "ReportRecord", # The compliance result for one repo
+    {
+        "repo": str,
+        "compliant": bool,
+        "missing_count": int,
+        "missing": List[str],
+        "drifted_count": int,
+        "drifted": List[str],
+        "score": Optional[float],
+        "pr_url": Optional[str],
+        "check_seconds": float,
+        "pr_seconds": Optional[float],
+        "error": Optional[str]
+    }
+)
+REPORT_FIELDS = list(ReportRecord.__annotations__)
+
+def make_report_record(
+    full_name: str,
+    diff: Optional[RepoStructureType],
+    drifted: Collection[str] = (),
+    pr_url: Optional[str] = None,
+    check_seconds: float = 0.0,
+    pr_seconds: Optional[float] = None,
+    error: Optional[str] = None,
+    score: Optional[float] = None
+)->ReportRecord:
+    """make_report_record
+    Build the report record of one repo
+
+    Args:
+        full_name (str): the full name of the repo
+        diff (Optional[RepoStructureType]): the non-compliant files, as returned by check_diff
+        drifted (Collection[str]): the paths in the diff that exist in the repo but differ from the template
+        pr_url (Optional[str]): the URL of the PR that was opened or updated, if any
+        check_seconds (float): how long the compliance check took
+        pr_seconds (Optional[float]): how long preparing the PR took, if one was prepared
+        error (Optional[str]): why the repo could not be checked, if it failed
+        score (Optional[float]): the share of template files the repo has up to date, from the compliance matrix
+    Returns:
+        record (ReportRecord): the record
+    """
+    paths = structure_paths(diff) if diff else []
+    missing = [path for path in paths if path not in drifted]
+    drifted = [path for path in paths if path in drifted]
+    return {
+        "repo": full_name,
+        "compliant": error is None and not paths,
+        "missing_count": len(missing),
+        "missing": missing,
+        "drifted_count": len(drifted),
+        "drifted": drifted,
+        "score": round(score, 4) if score is not None else None,
+        "pr_url": pr_url,
+        "check_seconds": round(check_seconds, 3),
+        "pr_seconds": round(pr_seconds, 3) if pr_seconds is not None else None,
+        "error": error
+    }
+
+class ReportWriter:
+    """ReportWriter
+    Write report records to a file (or stdout, with "-") as they come in
+    """
+    destination: str
+    format: ReportFormat
+    stream: TextIO
+    csv_writer: Optional["csv.DictWriter[str]"]
+    records: int
+    lock: threading.Lock
+    def __init__(self, destination: str = "-", format: Optional[ReportFormat] = None):
+        self.destination = destination
+        if format is None:
+            format = "csv" if destination.endswith(".csv") else "jsonl"
+        if format not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown report format {format}, expected 'jsonl' or 'csv'")
+        self.format = format
+        if destination == "-":
+            self.stream = sys.stdout
+        else:
+            Path(destination).parent.mkdir(parents=True, exist_ok=True)
+            self.stream = open(destination, "w", newline="")
+        self.csv_writer = None
+        if self.format == "csv":
+            self.csv_writer = csv.DictWriter(self.stream, fieldnames=REPORT_FIELDS)
+            self.csv_writer.writeheader()
+        self.records = 0
+        self.lock = threading.Lock()
+
+    def write(self, record: ReportRecord):
+        # Workers of a multi-org scan share one report
+        with self.lock:
+            if self.csv_writer is not None:
+                row: Dict[str, Any] = dict(record)
+                row["missing"] = ";".join(record["missing"])
+                row["drifted"] = ";".join(record["drifted"])
+                self.csv_writer.writerow(row)
+            else:
+                self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+            self.records += 1
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+    def __enter__(self)->"ReportWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any):
+        self.close()
@@ -0,0 +1,186 @@
+from .includes import *
+from datetime import datetime, timedelta, timezone
+import math
+import threading
+
+from .access_gh import search_code
+from .get_template_details import RepoTemplate
+from .lazy_guard import listed_attribute
+from .repo_detail import RepoStructureType, StructureSource, get_blob_shas_batch
+
+"""
+search_scan.py
+Check a whole org (or user) against a template with code search instead of reading every repo's tree.
+Each template file costs one paginated search ("which repos in the org have this path"), and the results are inverted
+into the files each repo is missing. With 8 template files and 2,000 repos, that is a few dozen searches instead of
+2,000 trees.
+
+Code search can be wrong in one direction: a file it does not report may still exist (the index lags behind pushes,
+forks are not indexed, large and binary files are skipped, and results stop at 1000). So every file a repo seems to
+be missing (or to have outdated) is verified with one batched lookup per repo, and repos pushed to since the index may
+have caught up are verified in full.
+The searches run once, on the first check; workers that check repos at the same time wait for them.
+"""
+
+ScanStrategy = Literal["auto", "tree", "search"]
+SCAN_STRATEGIES: List[str] = ["auto", "tree", "search"]
+
+# GitHub stops returning code search results after this many
+SEARCH_RESULT_LIMIT = 1000
+# Repos pushed to within this long may not be in the search index yet
+SEARCH_INDEX_LAG = timedelta(days=1)
+# Code search allows far fewer requests per minute than the core API, so one search page is weighed as this many requests
+SEARCH_REQUEST_COST = 8
+
+def search_qualifier(org_name: Optional[str] = None, user_name: Optional[str] = None)->Optional[str]:
+    if org_name:
+        return f"org:{org_name}"
+    if user_name:
+        return f"user:{user_name}"
+    return None
+
+def path_query(qualifier: str, path: str)->str:
+    directory, _, file_name = path.rpartition("/")
+    return f"{qualifier} filename:{file_name} path:{'/' + directory if directory else '/'}"
+
+def choose_strategy(
+    strategy: str,
+    target: Union[Repository, StructureSource, List[Repository], List[StructureSource]],
+    template: RepoTemplate,
+    qualifier: Optional[str]
+)->str:
+    """choose_strategy
+    Resolve a scan strategy to "tree" or "search"
+
+    args:
+        strategy: str - "auto", "tree" or "search"
+        target: the target repo(s)
+        template: RepoTemplate - the template
+        qualifier: Optional[str] - the search qualifier of the target owner, None if the target is not an org or user
+    returns:
+        str - the strategy to use. "auto" picks search when the estimated search cost is well below one tree per repo
+    """
+    if strategy not in SCAN_STRATEGIES:
+        raise ValueError(f"Unknown scan strategy {strategy}, expected one of {', '.join(SCAN_STRATEGIES)}")
+    searchable = qualifier is not None and isinstance(target, list) and not any(isinstance(repo, StructureSource) for repo in target)
+    if strategy == "search" and not searchable:
+        fprint("The search strategy needs GitHub repos of an org or user as the target; reading trees instead")
+        return "tree"
+    if strategy != "auto":
+        return strategy
+    if not searchable or not target or not template.file_shas:
+        return "tree"
+    pages = math.ceil(min(len(target), SEARCH_RESULT_LIMIT) / 100)
+    search_cost = len(template.file_shas) * pages * SEARCH_REQUEST_COST
+    return "search" if search_cost < len(target) else "tree"
+
+class SearchScan:
+    """SearchScan
+    Check repos against a template from code search results, verifying the results search may have gotten wrong
+    """
+    template: RepoTemplate
+    check_drift: bool
+    qualifier: str
+    holders: Optional[Dict[str, Dict[str, str]]]
+    incomplete: Set[str]
+    counts: Dict[str, int]
+    lock: threading.Lock
+    search_lock: threading.Lock
+    def __init__(self, template: RepoTemplate, qualifier: str, check_drift: bool = False):
+        self.template = template
+        self.qualifier = qualifier
+        self.check_drift = check_drift
+        # repo full name -> {template path: blob SHA in the search index}
+        self.holders = None
+        # template paths whose search results were cut off, so a repo missing from them proves nothing
+        self.incomplete = set()
+        self.counts = {"searches": 0, "trusted": 0, "verified": 0}
+        # Guards counts; search_lock is held while the searches run, so they run once
+        self.lock = threading.Lock()
+        self.search_lock = threading.Lock()
+
+    def count(self, kind: str):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def search(self):
+        """search
+        Run one code search per template file, and invert the results into the files each repo holds
+        """
+        holders: Dict[str, Dict[str, str]] = {}
+        for path in self.template.file_shas:
+            total, results = search_code(path_query(self.qualifier, path))
+            self.count("searches")
+            if total > len(results):
+                self.incomplete.add(path)
+            for content in results:
+                if content.path == path:
+                    holders.setdefault(content.repository.full_name, {})[path] = content.sha
+        # Only published once complete, so no check ever sees part of the results
+        self.holders = holders
+
+    def ensure_searched(self)->Dict[str, Dict[str, str]]:
+        if self.holders is None:
+            with self.search_lock:
+                if self.holders is None:
+                    self.search()
+        return self.holders
+
+    def is_borderline(self, repo: Repository)->bool:
+        # Forks are not in the search index, and recent pushes may not be either
+        if listed_attribute(repo, "fork"):
+            return True
+        pushed_at = listed_attribute(repo, "pushed_at")
+        if pushed_at is None:
+            return True
+        if pushed_at.tzinfo is None:
+            pushed_at = pushed_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - pushed_at < SEARCH_INDEX_LAG
+
+    def check(self, repo: Repository)->Tuple[Optional[RepoStructureType], List[str]]:
+        """check
+        Check a repo against the template
+
+        Args:
+            repo (Repository): the repo, one of the org or user's repos
+        Returns:
+            result (Tuple[Optional[RepoStructureType], List[str]]): the non-compliant files (None if compliant), and the paths among them
+                that exist in the repo but differ from the template
+        """
+        indexed = self.ensure_searched().get(repo.full_name, {})
+        if self.is_borderline(repo):
+            suspect = list(self.template.file_shas)
+        else:
+            suspect = [
+                path for path, sha in self.template.file_shas.items()
+                if indexed.get(path) is None or (self.check_drift and indexed[path] != sha)
+            ]
+        shas = dict(indexed)
+        if suspect:
+            self.count("verified")
+            shas.update(get_blob_shas_batch(repo, suspect))
+        else:
+            self.count("trusted")
+        missing = [path for path in self.template.file_shas if shas.get(path) is None]
+        drifted = [
+            path for path, sha in self.template.file_shas.items()
+            if self.check_drift and shas.get(path) is not None and shas[path] != sha
+        ]
+        # Like compare_repo_structure, doc/ only counts for repos that lack the template README
+        if "README.md" not in missing and "README.md" not in drifted:
+            missing = [path for path in missing if not path.startswith("doc/")]
+            drifted = [path for path in drifted if not path.startswith("doc/")]
+        if not missing and not drifted:
+            return None, []
+        paths = set(missing) | set(drifted)
+        return self.template.structure_from_paths([path for path in self.template.file_shas if path in paths]), drifted
+
+    def report(self):
+        with self.lock:
+            counts = dict(self.counts)
+        fprint(
+            f"Search pass: {counts['searches']} searches, {counts['trusted']} repos resolved from search alone, "
+            f"{counts['verified']} repos verified with lookups"
+        )
+        if self.incomplete:
+            fprint(f"Search results were cut off at {SEARCH_RESULT_LIMIT} for: {', '.join(sorted(self.incomplete))}")
@@ -0,0 +1,217 @@
+from .includes import *
+from typing import TypedDict
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .access_gh import CLIENT_CONFIG, ClientConfig, configure_client
+from .get_template_details import RepoTemplate
+from .repo_detail import RepoStructureType, structure_to_json, structure_paths, set_structure_provider
+from . import git_backend
+from .local_repo import LocalRepository
+from .build_pr import template_compliance_targeting, get_compliance_diffs
+
+"""
+sharding.py
+Split an org scan into deterministic shards, so that it can run across a process pool or separate machines.
+Every shard writes its partial results to a JSON file, and merging the files gives the same result that
+get_compliance_diffs gives for a single process. Shards only check the repos' trees: reports, incremental passes
+and code search strategies are not available in sharded scans.
+"""
+
+SHARD_DIR = Path("shards")
+
+ScanSpec = TypedDict(
+    "ScanSpec", # What to scan, as given on the command line
+    {
+        "user_name": Optional[str],
+        "org_name": Optional[str],
+        "repo_name": Optional[str],
+        "template_name": Optional[str],
+        "check_drift": bool,
+        "structure_provider": str,
+        "local_dir": Optional[str],
+        "repo_filter": Optional[str]
+    }
+)
+
+def shard_of(full_name: str, shard_count: int)->int:
+    """shard_of
+    Get the shard a repository belongs to. Stable across processes, machines and runs
+    (unlike hash(), which is salted per process)
+
+    Args:
+        full_name (str): the full name of the repo
+        shard_count (int): the total number of shards
+    Returns:
+        shard (int): the shard index, in range(shard_count)
+    """
+    digest = hashlib.sha1(full_name.encode("utf-8")).hexdigest()
+    return int(digest, 16) % shard_count
+
+def parse_shard(shard: str)->Tuple[int, int]:
+    """parse_shard
+    Parse a shard given as "index/count", e.g. "0/4"
+
+    Returns:
+        shard_tup (Tuple[int, int]): (index, count)
+    """
+    index, _, count = shard.partition("/")
+    shard_index, shard_count = int(index), int(count)
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard}, expected index/count with 0 <= index < count")
+    return shard_index, shard_count
+
+def shard_path(shard_dir: Path, shard: int, shard_count: int)->Path:
+    return shard_dir / f"shard-{shard:04d}-of-{shard_count:04d}.json"
+
+def scan_shard(spec: ScanSpec, shard: int, shard_count: int, shard_dir: Path = SHARD_DIR)->Path:
+    """scan_shard
+    Scan the repos of one shard, and write the partial compliance results
+
+    Args:
+        spec (ScanSpec): what to scan
+        shard (int): the index of the shard to scan
+        shard_count (int): the total number of shards
+        shard_dir (Path): where to write the results
+    Returns:
+        path (Path): the path of the written results
+    """
+    target, template = template_compliance_targeting(
+        user_name=spec["user_name"],
+        org_name=spec["org_name"],
+        repo_name=spec["repo_name"],
+        template_name=spec["template_name"],
+        local_dir=spec["local_dir"],
+        repo_filter=spec.get("repo_filter")
+    )
+    repos = target if isinstance(target, list) else [target]
+    # Keep the listing position, so merged results come back in the order of a single process scan
+    selected = [(index, repo) for index, repo in enumerate(repos) if shard_of(repo.full_name, shard_count) == shard]
+    fprint(f"Shard {shard}/{shard_count}: scanning {len(selected)} of {len(repos)} repos")
+    diffs = get_compliance_diffs([repo for _, repo in selected], template, spec["check_drift"])
+    results = {
+        # Local templates are found again by their path
+        "template": str(template.template_repo.path) if isinstance(template.template_repo, LocalRepository) else template.template_repo.full_name,
+        "shard": shard,
+        "shard_count": shard_count,
+        "template_sha": template.head_sha,
+        "check_drift": spec["check_drift"],
+        "scanned": len(selected),
+        "diffs": [
+            [index, repo.full_name, structure_to_json(diffs[repo.full_name])]
+            for index, repo in selected if repo.full_name in diffs
+        ]
+    }
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    path = shard_path(shard_dir, shard, shard_count)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(results, f)
+    os.replace(temp_path, path)
+    return path
+
+def scan_shard_process(spec: ScanSpec, shard: int, shard_count: int, shard_dir: str, client_config: ClientConfig)->str:
+    """scan_shard_process
+    Entry point of a pool process: apply the parent's client settings, then scan the shard
+    """
+    configure_client(**client_config)
+    set_structure_provider(spec["structure_provider"])
+    return str(scan_shard(spec, shard, shard_count, Path(shard_dir)))
+
+def merge_shard_results(shard_dir: Path = SHARD_DIR, template: Optional[RepoTemplate] = None)->Dict[str, RepoStructureType]:
+    """merge_shard_results
+    Combine the results of all shards into the output get_compliance_diffs gives for a single process
+
+    Args:
+        shard_dir (Path): where the shard results were written
+        template (Optional[RepoTemplate]): the template, loaded from the shard results if not provided
+    Returns:
+        diffs (Dict[str, RepoStructureType]): the missing files for each repo (if any)
+    """
+    shard_files = sorted(shard_dir.glob("shard-*-of-*.json"))
+    if not shard_files:
+        raise FileNotFoundError(f"No shard results in {shard_dir}")
+    shards = []
+    for shard_file in shard_files:
+        with open(shard_file) as f:
+            shards.append(json.load(f))
+    shard_counts = {shard["shard_count"] for shard in shards}
+    templates = {shard["template"] for shard in shards}
+    template_shas = {shard.get("template_sha") for shard in shards}
+    check_drifts = {shard["check_drift"] for shard in shards}
+    if len(shard_counts) != 1 or len(templates) != 1 or len(template_shas) != 1 or len(check_drifts) != 1:
+        raise ValueError(
+            f"Shard results in {shard_dir} come from different scans: shard counts {shard_counts}, "
+            f"templates {templates} at {template_shas}, drift checks {check_drifts}"
+        )
+    shard_count = shard_counts.pop()
+    missing_shards = set(range(shard_count)) - {shard["shard"] for shard in shards}
+    if missing_shards:
+        raise ValueError(f"Missing results for shards {sorted(missing_shards)} of {shard_count}")
+    if template is None:
+        template = RepoTemplate(templates.pop())
+    template_sha = template_shas.pop()
+    if template_sha is not None and template.head_sha is not None and template.head_sha != template_sha:
+        raise ValueError(f"The shards were scanned against template commit {template_sha}, but it is now at {template.head_sha}")
+    entries = [entry for shard in shards for entry in shard["diffs"]]
+    entries.sort(key=lambda entry: entry[0])
+    return {full_name: template.structure_from_json(diff) for _, full_name, diff in entries}
+
+def run_sharded_scan(spec: ScanSpec, shard_count: int, shard_dir: Path = SHARD_DIR)->Dict[str, RepoStructureType]:
+    """run_sharded_scan
+    Scan all shards in a pool of processes (one per shard), then merge their results
+
+    Args:
+        spec (ScanSpec): what to scan
+        shard_count (int): the number of shards and processes
+        shard_dir (Path): where to write the shard results
+    Returns:
+        diffs (Dict[str, RepoStructureType]): the missing files for each repo (if any)
+    """
+    for stale in shard_dir.glob("shard-*-of-*.json"):
+        stale.unlink()
+    # spawn rather than fork, so no process inherits another's open connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=shard_count, mp_context=context) as pool:
+        futures = [
+            pool.submit(scan_shard_process, spec, shard, shard_count, str(shard_dir), dict(CLIENT_CONFIG))
+            for shard in range(shard_count)
+        ]
+        for future in futures:
+            fprint(f"Wrote {future.result()}")
+    return merge_shard_results(shard_dir)
+
+def shard_dispatch(
+    spec: ScanSpec,
+    shards: Optional[int] = None,
+    shard: Optional[str] = None,
+    merge: bool = False,
+    shard_dir: Path = SHARD_DIR
+):
+    """shard_dispatch
+    Run the sharded scan mode selected on the command line
+
+    Args:
+        spec (ScanSpec): what to scan
+        shards (Optional[int]): scan with this many local processes, then merge
+        shard (Optional[str]): only scan this shard ("index/count"), e.g. on one of several machines
+        merge (bool): merge previously written shard results
+        shard_dir (Path): where shard results are written and read
+    """
+    if shard:
+        shard_index, shard_count = parse_shard(shard)
+        path = scan_shard(spec, shard_index, shard_count, shard_dir)
+        fprint(f"Wrote {path}")
+        if not merge:
+            return
+    if shards and not shard:
+        diffs = run_sharded_scan(spec, shards, shard_dir)
+    else:
+        diffs = merge_shard_results(shard_dir)
+    for full_name, diff in diffs.items():
+        paths = structure_paths(diff)
+        fprint(f"{full_name} has {len(paths)} non-compliant files:")
+        for path in paths:
+            fprint(f"\t{path}")
+    fprint(f"{len(diffs)} repos are not compliant")
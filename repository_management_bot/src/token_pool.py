@@ -0,0 +1,325 @@
+from .includes import *
+from github import Auth, GithubIntegration
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+import urllib.request
+
+"""
+token_pool.py
+Spread the bot's API traffic over several credentials, so it is not capped at one account's rate limit.
+Credentials are given as space-separated entries:
+- gh                                   the token of the GitHub CLI (the default)
+- env:NAME                             a token in an environment variable
+- file:PATH                            one token per line
+- app:APP_ID:INSTALLATION_ID:KEY_PATH  a GitHub App installation, whose tokens are minted from the app's private key
+Reads go to the credential with the most remaining quota. Writes for a repo (and everything else done while
+preparing its PR) always use the same credential, so branches, forks, pushes and PRs belong to one identity.
+App installation tokens are renewed by a background thread before they expire; the old token stays valid until
+then, so requests in flight are never held up. The same thread keeps the remaining quota of every credential in
+sync with GitHub (the rate limit endpoint does not count against the quota).
+
+All credentials are expected to be able to read the targeted repos.
+"""
+
+CredentialKind = Literal["token", "app"]
+
+# App installation tokens are renewed this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=10)
+# How often the background thread renews tokens and syncs the remaining quota
+REFRESH_INTERVAL = 60.0
+# The assumed quota of a credential that has not been synced yet
+DEFAULT_RATE_LIMIT = 5000
+
+class Credential:
+    """Credential
+    One identity the bot can send requests as, with its estimated remaining quota
+    """
+    name: str
+    kind: CredentialKind
+    token: Optional[str]
+    expires_at: Optional[datetime]
+    remaining: int
+    limit: int
+    reset_at: float
+    def __init__(self, name: str, kind: CredentialKind = "token", token: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.token = token
+        self.expires_at = None
+        self.remaining = DEFAULT_RATE_LIMIT
+        self.limit = DEFAULT_RATE_LIMIT
+        self.reset_at = 0.0
+
+    def needs_refresh(self)->bool:
+        if self.token is None:
+            return True
+        return self.expires_at is not None and datetime.now(timezone.utc) >= self.expires_at - TOKEN_REFRESH_MARGIN
+
+    def refresh(self, base_url: str):
+        pass
+
+    def available(self)->int:
+        # Quota that was used up is back after the reset time
+        if self.reset_at and time.time() >= self.reset_at:
+            return self.limit
+        return self.remaining
+
+    def __repr__(self)->str:
+        return f'Credential(name="{self.name}", remaining={self.remaining}/{self.limit})'
+
+class AppInstallationCredential(Credential):
+    """AppInstallationCredential
+    A GitHub App installation, whose short-lived tokens are minted from the app's private key
+    """
+    app_id: str
+    installation_id: int
+    private_key: str
+    def __init__(self, app_id: str, installation_id: int, private_key: str):
+        super().__init__(f"app:{app_id}:{installation_id}", "app")
+        self.app_id = app_id
+        self.installation_id = installation_id
+        self.private_key = private_key
+
+    def refresh(self, base_url: str):
+        integration = GithubIntegration(auth=Auth.AppAuth(self.app_id, self.private_key), base_url=base_url)
+        authorization = integration.get_access_token(self.installation_id)
+        expires_at = authorization.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        # Swapped in one assignment each, so concurrent readers see either the old or the new token
+        self.expires_at = expires_at
+        self.token = authorization.token
+
+def parse_credentials(spec: str, gh_token: Callable[[], str])->List[Credential]:
+    """parse_credentials
+    Parse the credential entries described at the top of this module
+
+    args:
+        spec: str - space-separated credential entries
+        gh_token: Callable[[], str] - gets the token of the GitHub CLI
+    returns:
+        List[Credential] - the credentials, in the given order
+    """
+    credentials: List[Credential] = []
+    for entry in spec.split():
+        kind, _, value = entry.partition(":")
+        if kind == "gh":
+            credentials.append(Credential("gh", token=gh_token()))
+        elif kind == "env":
+            token = os.environ.get(value)
+            if not token:
+                raise ValueError(f"Credential {entry}: environment variable {value} is not set")
+            credentials.append(Credential(entry, token=token))
+        elif kind == "file":
+            with open(value) as f:
+                tokens = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+            if not tokens:
+                raise ValueError(f"Credential {entry}: no tokens in {value}")
+            credentials.extend(Credential(f"{entry}#{i}", token=token) for i, token in enumerate(tokens))
+        elif kind == "app":
+            parts = value.split(":", 2)
+            if len(parts) != 3 or not parts[1].isdigit():
+                raise ValueError(f"Credential {entry}: expected app:APP_ID:INSTALLATION_ID:KEY_PATH")
+            app_id, installation_id, key_path = parts
+            with open(key_path) as f:
+                credentials.append(AppInstallationCredential(app_id, int(installation_id), f.read()))
+        else:
+            raise ValueError(f"Unknown credential {entry}, expected gh, env:NAME, file:PATH or app:APP_ID:INSTALLATION_ID:KEY_PATH")
+    if not credentials:
+        raise ValueError("No credentials given")
+    return credentials
+
+# The credential that requests of the current thread (or task) are pinned to, if any
+PINNED_CREDENTIAL: ContextVar[Optional[Credential]] = ContextVar("PINNED_CREDENTIAL", default=None)
+# Called for every API request of the current thread (or task), to charge it to a budget, if any
+REQUEST_CHARGE: ContextVar[Optional[Callable[[], None]]] = ContextVar("REQUEST_CHARGE", default=None)
+
+class TokenPool:
+    """TokenPool
+    A set of credentials that requests are spread over
+    """
+    credentials: List[Credential]
+    base_url: str
+    writers: Dict[str, Credential]
+    lock: threading.Lock
+    stop: threading.Event
+    refresher: Optional[threading.Thread]
+    auth: "PooledAuth"
+    def __init__(self, credentials: List[Credential], base_url: str):
+        self.credentials = credentials
+        self.base_url = base_url
+        self.writers = {}
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.refresher = None
+        self.auth = PooledAuth(self)
+        # Tokens are needed before the first request; later refreshes happen in the background
+        for credential in credentials:
+            if credential.needs_refresh():
+                credential.refresh(base_url)
+
+    def usable(self)->List[Credential]:
+        return [credential for credential in self.credentials if credential.token]
+
+    def choose_read(self)->Credential:
+        """choose_read
+        Pick the credential with the most remaining quota
+        """
+        with self.lock:
+            return max(self.usable(), key=lambda credential: credential.available())
+
+    def choose_write(self, full_name: str)->Credential:
+        """choose_write
+        Get the credential that writes to a repo. The first write picks the credential with the most remaining quota
+        (preferring user tokens, which can fork and own branches), and every later write to the repo uses it as well
+        """
+        with self.lock:
+            credential = self.writers.get(full_name)
+            if credential is None:
+                candidates = [credential for credential in self.usable() if credential.kind == "token"] or self.usable()
+                credential = max(candidates, key=lambda credential: credential.available())
+                self.writers[full_name] = credential
+            return credential
+
+    def current(self)->Credential:
+        """current
+        Get the credential for the next request: the pinned one, or the one with the most remaining quota.
+        Picking a credential (e.g. for a git command) does not count as a request; see record_request
+        """
+        pinned = PINNED_CREDENTIAL.get()
+        if pinned is not None:
+            return pinned
+        return self.choose_read()
+
+    def record_request(self, credential: Credential):
+        """record_request
+        Count one REST API request against the estimated quota of a credential,
+        and charge it to the budget of the current thread (or task), if any
+        """
+        with self.lock:
+            if credential.reset_at and time.time() >= credential.reset_at:
+                credential.remaining = credential.limit
+                credential.reset_at = 0.0
+            credential.remaining -= 1
+        charge = REQUEST_CHARGE.get()
+        if charge is not None:
+            charge()
+
+    def identity(self)->Credential:
+        """identity
+        Get the credential that "the authenticated user" refers to: the pinned one, or the first one
+        """
+        return PINNED_CREDENTIAL.get() or self.credentials[0]
+
+    @contextmanager
+    def pinned(self, credential: Optional[Credential] = None)->Iterator[Credential]:
+        """pinned
+        Send every request of the block as one credential (the identity, by default).
+        Used for requests whose result depends on who is asking, like /user/repos
+        """
+        credential = credential or self.identity()
+        reset = PINNED_CREDENTIAL.set(credential)
+        try:
+            yield credential
+        finally:
+            PINNED_CREDENTIAL.reset(reset)
+
+    @contextmanager
+    def writing(self, full_name: str)->Iterator[Credential]:
+        """writing
+        Send every request of the block as the credential that writes to a repo
+        """
+        with self.pinned(self.choose_write(full_name)) as credential:
+            yield credential
+
+    @contextmanager
+    def charging(self, charge: Callable[[], None])->Iterator[None]:
+        """charging
+        Call a function for every API request of the block (every record_request), e.g. to count the requests made for one org
+        """
+        reset = REQUEST_CHARGE.set(charge)
+        try:
+            yield
+        finally:
+            REQUEST_CHARGE.reset(reset)
+
+    def sync_rate_limit(self, credential: Credential):
+        request = urllib.request.Request(
+            f"{self.base_url}/rate_limit",
+            headers={"Authorization": f"token {credential.token}", "Accept": "application/vnd.github+json"}
+        )
+        with urllib.request.urlopen(request, timeout=15) as response:
+            core = json.load(response)["resources"]["core"]
+        with self.lock:
+            credential.remaining = core["remaining"]
+            credential.limit = core["limit"]
+            credential.reset_at = float(core["reset"])
+
+    def refresh_all(self):
+        for credential in self.credentials:
+            try:
+                if credential.needs_refresh():
+                    credential.refresh(self.base_url)
+                self.sync_rate_limit(credential)
+            except Exception as e:
+                # Keep going with the current token and estimate; the next round tries again
+                print(f"Could not refresh credential {credential.name}: {e}", file=sys.stderr)
+
+    def start_refresher(self):
+        """start_refresher
+        Start the background thread that renews tokens and syncs the remaining quota
+        """
+        if self.refresher is not None:
+            return
+        def refresh_loop():
+            while not self.stop.wait(REFRESH_INTERVAL):
+                self.refresh_all()
+        self.refresher = threading.Thread(target=refresh_loop, name="token-refresher", daemon=True)
+        self.refresher.start()
+
+    def stats(self)->Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                credential.name: {
+                    "remaining": credential.remaining,
+                    "limit": credential.limit,
+                    "expires_at": credential.expires_at.isoformat() if credential.expires_at else None,
+                    "writes_for": sum(1 for writer in self.writers.values() if writer is credential)
+                }
+                for credential in self.credentials
+            }
+
+    def __len__(self)->int:
+        return len(self.credentials)
+
+class PooledAuth(Auth.Auth):
+    """PooledAuth
+    PyGithub authentication that picks a credential of the pool for every request
+    """
+    pool: TokenPool
+    def __init__(self, pool: TokenPool):
+        self.pool = pool
+
+    @property
+    def token_type(self)->str:
+        return "token"
+
+    @property
+    def token(self)->str:
+        return self.pool.current().token
+
+    def authentication(self, headers: dict):
+        # Called once for every request PyGithub sends, so this is where requests are counted
+        credential = self.pool.current()
+        self.pool.record_request(credential)
+        headers["Authorization"] = f"token {credential.token}"
+
+    def mask_authentication(self, headers: dict):
+        if "authorization" in headers:
+            headers["authorization"] = "token (token removed)"
+        if "Authorization" in headers:
+            headers["Authorization"] = "token (token removed)"
@@ -0,0 +1,15 @@
+from types import SimpleNamespace
+from typing import Any, Callable
+import pytest
+from github.Repository import Repository
+
+# Objects built from listing responses, without a client: they can never complete themselves
+OFFLINE_REQUESTER = SimpleNamespace(is_not_lazy=False)
+
+def listed_repo(full_name: str, **attributes: Any)->Repository:
+    attributes = {"full_name": full_name, "name": full_name.split("/")[-1], **attributes}
+    return Repository(requester=OFFLINE_REQUESTER, headers={}, attributes=attributes, completed=True)
+
+@pytest.fixture
+def make_repo()->Callable[..., Repository]:
+    return listed_repo
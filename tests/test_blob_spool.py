@@ -0,0 +1,76 @@
+import hashlib
+import pytest
+from repository_management_bot.src import blob_spool, mirror_cache
+from repository_management_bot.src.blob_spool import BlobIntegrityError, read_lfs_pointer, spool_blob, spool_lfs_object, spool_path
+from repository_management_bot.src.git_backend import run_git
+from repository_management_bot.src.local_repo import LocalRepository, file_blob_sha
+
+OID = hashlib.sha256(b"large file\n").hexdigest()
+
+def pointer(oid: str = f"sha256:{OID}", size: str = "11")->bytes:
+    return f"version https://git-lfs.github.com/spec/v1\noid {oid}\nsize {size}\n".encode("utf-8")
+
+@pytest.fixture
+def spool(monkeypatch, tmp_path):
+    monkeypatch.setattr(mirror_cache, "CLONE_DIR", tmp_path / "clones")
+    return tmp_path / "clones" / "blobs"
+
+@pytest.fixture
+def checkout(tmp_path):
+    work = tmp_path / "org" / "template"
+    work.mkdir(parents=True)
+    (work / "README.md").write_text("# Template\n")
+    run_git("init", "--quiet", cwd=work)
+    run_git("add", "-A", cwd=work)
+    run_git("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "--quiet", "-m", "init", cwd=work)
+    return LocalRepository(work)
+
+def test_read_lfs_pointer(tmp_path):
+    path = tmp_path / "pointer"
+    path.write_bytes(pointer())
+    assert read_lfs_pointer(path) == (OID, 11)
+
+@pytest.mark.parametrize("data", [
+    b"# Not a pointer\n",
+    pointer(oid="md5:0123"),
+    pointer(size="many"),
+    pointer() + b"x" * blob_spool.LFS_POINTER_MAX_SIZE
+])
+def test_read_lfs_pointer_rejects_other_files(tmp_path, data):
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    assert read_lfs_pointer(path) is None
+
+def test_spool_blob_from_a_local_repo(spool, checkout):
+    sha = file_blob_sha(checkout.path / "README.md", 11)
+    path = spool_blob(checkout, sha)
+    assert path == spool / sha[:2] / sha
+    assert path.read_text() == "# Template\n"
+    # Spooled once, then read from the spool
+    path.write_text("changed")
+    assert spool_blob(checkout, sha).read_text() == "changed"
+
+def test_spool_blob_rejects_a_mismatched_blob(monkeypatch, spool, checkout):
+    sha = file_blob_sha(checkout.path / "README.md", 11)
+    def export_local_blob(repo, sha, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("# Tampered\n")
+    monkeypatch.setattr(blob_spool, "export_local_blob", export_local_blob)
+    with pytest.raises(BlobIntegrityError):
+        spool_blob(checkout, sha)
+    assert not spool_path(sha).exists()
+
+def test_spool_lfs_object_checks_its_sha256(spool, checkout):
+    objects = checkout.git_dir() / "lfs" / "objects"
+    good = objects / OID[:2] / OID[2:4] / OID
+    good.parent.mkdir(parents=True)
+    good.write_bytes(b"large file\n")
+    assert spool_lfs_object(checkout, OID, 11).read_bytes() == b"large file\n"
+    bad_oid = hashlib.sha256(b"other file\n").hexdigest()
+    bad = objects / bad_oid[:2] / bad_oid[2:4] / bad_oid
+    bad.parent.mkdir(parents=True)
+    bad.write_bytes(b"corrupted\n")
+    with pytest.raises(BlobIntegrityError):
+        spool_lfs_object(checkout, bad_oid, 11)
+    assert not blob_spool.lfs_spool_path(bad_oid).exists()
+    assert spool_lfs_object(checkout, "0" * 64, 11) is None
@@ -0,0 +1,99 @@
+import threading
+import time
+import pytest
+from repository_management_bot.src.caching import cache, transient_cache, content_cache, register_cache_key, make_key, save_cache, load_cache, BoundedCache
+
+class Thing:
+    def __init__(self, ident: str, version: int):
+        self.ident = ident
+        self.version = version
+
+register_cache_key(Thing, lambda thing: (thing.ident, thing.version))
+
+def test_concurrent_calls_are_coalesced():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+    @cache
+    def slow(x):
+        calls.append(x)
+        started.set()
+        release.wait(5)
+        return x * 2
+    results = []
+    leader = threading.Thread(target=lambda: results.append(slow(21)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(slow(21))) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    # Give the followers time to join the flight
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+    assert calls == [21]
+    assert results == [42] * 5
+    info = slow.cache.info
+    assert (info.misses, info.coalesced) == (1, 4)
+
+def test_errors_are_shared_but_not_cached():
+    calls = []
+    @cache
+    def failing(x):
+        calls.append(x)
+        if len(calls) == 1:
+            raise RuntimeError("first call fails")
+        return x
+    with pytest.raises(RuntimeError):
+        failing(1)
+    assert failing(1) == 1
+    assert calls == [1, 1]
+
+def test_recursive_calls_with_the_same_key_do_not_deadlock():
+    calls = []
+    @cache
+    def again(x):
+        calls.append(x)
+        return x if len(calls) > 1 else again(x) + 1
+    assert again(1) == 2
+    assert again(1) == 2
+    assert calls == [1, 1]
+
+def test_registered_types_are_keyed_by_their_identifiers():
+    assert make_key((Thing("a", 1),), {}) == make_key((Thing("a", 1),), {})
+    assert make_key((Thing("a", 1),), {}) != make_key((Thing("a", 2),), {})
+    assert make_key((1,), {}) != make_key((), {"x": 1})
+
+def test_saved_entries_expire_unless_immutable(tmp_path):
+    @cache
+    def listing(x):
+        return [x]
+    @content_cache
+    def blob(x):
+        return x * 3
+    @transient_cache
+    def client(x):
+        return object()
+    listing(1)
+    blob(2)
+    client(3)
+    path = tmp_path / "cache.pkl"
+    assert save_cache(path) >= 2
+    for cached in (listing.cache, blob.cache, client.cache):
+        cached.clear()
+    # Entries stored just now are older than a max age of -1 seconds
+    load_cache(path, max_age=-1)
+    assert not listing.cache.entries and not client.cache.entries
+    assert list(blob.cache.entries.values()) == [6]
+    load_cache(path, max_age=3600)
+    assert list(listing.cache.entries.values()) == [[1]]
+    assert not client.cache.entries
+
+def test_bounded_cache_evicts_the_least_recently_used():
+    bounded = BoundedCache(2)
+    bounded.put("a", 1)
+    bounded.put("b", 2)
+    bounded.get("a")
+    bounded.put("c", 3)
+    assert "a" in bounded and "c" in bounded and "b" not in bounded
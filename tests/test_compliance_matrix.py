@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+import pytest
+from repository_management_bot.src.compliance_matrix import ComplianceMatrix, iter_bits, popcount
+
+PATHS = ["README.md", "LICENSE", "SECURITY.md", "doc/index.md"]
+
+@pytest.fixture
+def matrix()->ComplianceMatrix:
+    matrix = ComplianceMatrix(SimpleNamespace(file_shas={path: f"sha-{i}" for i, path in enumerate(PATHS)}))
+    matrix.add("org/a", missing=["LICENSE", "SECURITY.md"])
+    matrix.add("org/b", missing=["LICENSE"], drifted=["README.md"])
+    matrix.add("org/c")
+    return matrix
+
+def test_bits():
+    assert list(iter_bits(0b10110)) == [1, 2, 4]
+    assert popcount(0b10110) == 3
+
+def test_counts_and_scores(matrix):
+    assert matrix.file_counts("missing") == {"README.md": 0, "LICENSE": 2, "SECURITY.md": 1, "doc/index.md": 0}
+    assert matrix.file_counts("drifted")["README.md"] == 1
+    assert matrix.score("org/a") == 0.5
+    assert matrix.score("org/c") == 1.0
+    assert matrix.compliant_repos() == ["org/c"]
+
+def test_queries(matrix):
+    assert matrix.repos_missing_any(["SECURITY.md", "README.md"]) == ["org/a", "org/b"]
+    assert matrix.repos_missing_any(["README.md"], "missing") == []
+    assert matrix.repos_missing_all(["LICENSE", "SECURITY.md"]) == ["org/a"]
+    assert matrix.repos_missing_all(["doc/index.md"]) == []
+
+def test_replacing_a_row_updates_the_columns(matrix):
+    matrix.add("org/a", missing=["doc/index.md"])
+    assert matrix.repos_missing_any(["LICENSE"]) == ["org/b"]
+    assert matrix.repos_missing_any(["doc/index.md"]) == ["org/a"]
+    assert len(matrix.repos) == 3
+
+def test_print_missing(matrix, capsys):
+    matrix.print_missing(missing_any="SECURITY.md", missing_all="LICENSE,README.md")
+    output = capsys.readouterr()
+    text = output.out + output.err
+    assert "1 repos are missing any of SECURITY.md" in text
+    assert "1 repos are missing all of LICENSE, README.md" in text
+
+def test_unknown_paths_are_rejected(matrix):
+    with pytest.raises(ValueError, match="NOTES.md"):
+        matrix.parse_paths("LICENSE, NOTES.md")
@@ -0,0 +1,63 @@
+import os
+import pytest
+from repository_management_bot.src.git_backend import run_git, git_auth_env, ls_tree_structure, get_git_structure
+from repository_management_bot.src.local_repo import file_blob_sha
+
+def commit_all(work, message):
+    run_git("add", "-A", cwd=work)
+    run_git("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "--quiet", "-m", message, cwd=work)
+
+@pytest.fixture
+def bare_repo(tmp_path):
+    work = tmp_path / "work"
+    (work / "doc" / "api").mkdir(parents=True)
+    (work / "README.md").write_text("# Test\n")
+    (work / "doc" / "notes.txt").write_text("notes\n")
+    (work / "doc" / "api" / "index.md").write_bytes(b"x" * 3000)
+    os.symlink("README.md", work / "LINK")
+    run_git("init", "--quiet", "--initial-branch", "main", cwd=work)
+    commit_all(work, "init")
+    bare = tmp_path / "bare.git"
+    run_git("clone", "--bare", "--quiet", str(work), str(bare))
+    return work, bare
+
+def test_ls_tree_structure(bare_repo):
+    work, bare = bare_repo
+    registered = []
+    structure = ls_tree_structure(bare, file_registerer=lambda content, path: registered.append((content.path, path)))
+    readme = structure["README.md"]
+    assert readme.sha == file_blob_sha(work / "README.md", 7)
+    assert readme.size == 7
+    index = structure["doc"]["api"]["index.md"]
+    assert (index.path, index.size) == ("doc/api/index.md", 3000)
+    assert structure["doc"]["notes.txt"].path == "doc/notes.txt"
+    assert structure["LINK"].type == "symlink"
+    assert ("doc/api/index.md", "doc/api") in registered
+    assert ("README.md", "") in registered
+
+def test_ls_tree_structure_below_a_directory(bare_repo):
+    _, bare = bare_repo
+    structure = ls_tree_structure(bare, path="doc")
+    assert set(structure) == {"notes.txt", "api"}
+    assert structure["api"]["index.md"].path == "doc/api/index.md"
+
+def test_get_git_structure_over_file_urls(bare_repo):
+    work, bare = bare_repo
+    url = bare.resolve().as_uri()
+    structure = get_git_structure(url)
+    assert structure["README.md"].sha == ls_tree_structure(bare)["README.md"].sha
+    (work / "LICENSE").write_text("MIT\n")
+    commit_all(work, "license")
+    run_git("push", "--quiet", str(bare), "main:other", cwd=work)
+    assert "LICENSE" not in get_git_structure(url, ref="main")
+    assert "LICENSE" in get_git_structure(url, ref="other")
+
+def test_repos_without_commits_fail(tmp_path):
+    bare = tmp_path / "empty.git"
+    run_git("init", "--bare", "--quiet", str(bare))
+    with pytest.raises(RuntimeError):
+        ls_tree_structure(bare)
+
+def test_only_https_urls_get_credentials():
+    assert git_auth_env("file:///srv/repo.git") == {}
+    assert git_auth_env("git@github.com:o/a.git") == {}
@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional
+import pytest
+from repository_management_bot.src import incremental
+from repository_management_bot.src.get_template_details import TemplateDelta
+from repository_management_bot.src.incremental import IncrementalScan
+from repository_management_bot.src.repo_detail import StructureSource, make_content_file
+
+OLD_SHAS = {"README.md": "r1", "LICENSE": "l1", "doc/index.md": "d1"}
+
+class StubRepo(StructureSource):
+    def __init__(self, full_name: str, version: str, files: Dict[str, str]):
+        self.full_name = full_name
+        self.name = full_name.split("/")[-1]
+        self.version = version
+        self.files = files
+
+    def get_structure(self, path="", file_registerer=None):
+        return {}
+
+    def head_sha(self)->Optional[str]:
+        return self.version
+
+class StubTemplate:
+    """A template at head_sha, that remembers its files at earlier commits"""
+    def __init__(self, head_sha: str, file_shas: Dict[str, str], history: Dict[str, Dict[str, str]]):
+        self.head_sha = head_sha
+        self.file_shas = file_shas
+        self.history = history
+        self.template_repo = StubRepo("org/template", head_sha, file_shas)
+        self.compared: List[str] = []
+
+    def delta_from(self, head_sha: str)->Optional[TemplateDelta]:
+        if head_sha not in self.history:
+            return None
+        return TemplateDelta(head_sha, self.head_sha, self.history[head_sha], self.file_shas)
+
+    def structure_from_paths(self, paths: List[str]):
+        # Flat, keyed by path: enough for structure_paths and the assertions
+        return {path: make_content_file(path, self.file_shas[path], 0) for path in paths}
+
+    def compare_repo(self, repo: StubRepo, check_drift: bool = False):
+        self.compared.append(repo.full_name)
+        paths = [
+            path for path, sha in self.file_shas.items()
+            if repo.files.get(path) is None or (check_drift and repo.files[path] != sha)
+        ]
+        if "README.md" not in paths:
+            paths = [path for path in paths if not path.startswith("doc/")]
+        return self.structure_from_paths(paths)
+
+    def find_drift(self, repo: StubRepo)->List[str]:
+        return [path for path, sha in self.file_shas.items() if repo.files.get(path) not in (None, sha)]
+
+@pytest.fixture
+def lookups(monkeypatch, tmp_path):
+    monkeypatch.setattr(incremental, "SNAPSHOT_DIR", tmp_path)
+    calls = []
+    def get_blob_shas_batch(repo, paths):
+        calls.append((repo.full_name, list(paths)))
+        return {path: repo.files.get(path) for path in paths}
+    monkeypatch.setattr(incremental, "get_blob_shas_batch", get_blob_shas_batch)
+    return calls
+
+def first_pass(repos: List[StubRepo], check_drift: bool = False):
+    template = StubTemplate("t1", dict(OLD_SHAS), {})
+    scan = IncrementalScan(template, check_drift)
+    results = [scan.check(repo) for repo in repos]
+    scan.save()
+    return results
+
+def second_pass(template: StubTemplate, repos: List[StubRepo], check_drift: bool = False):
+    scan = IncrementalScan(template, check_drift)
+    return scan, [scan.check(repo) for repo in repos]
+
+def test_same_template_commit_reuses_results(lookups):
+    repo = StubRepo("org/a", "v1", {"README.md": "r1"})
+    assert list(first_pass([repo])[0][0]) == ["LICENSE"]
+    template = StubTemplate("t1", dict(OLD_SHAS), {})
+    scan, [(diff, drifted)] = second_pass(template, [repo])
+    assert list(diff) == ["LICENSE"]
+    assert scan.counts == {"reused": 1, "delta": 0, "full": 0}
+    assert template.compared == [] and lookups == []
+
+def test_unchanged_repo_is_only_checked_for_changed_files(lookups):
+    repo = StubRepo("org/a", "v1", {"README.md": "r1", "LICENSE": "l1"})
+    first_pass([repo])
+    # SECURITY.md was added, LICENSE changed and doc/index.md removed since t1
+    new_shas = {"README.md": "r1", "LICENSE": "l2", "SECURITY.md": "s1"}
+    template = StubTemplate("t2", new_shas, {"t1": OLD_SHAS})
+    scan, [(diff, drifted)] = second_pass(template, [repo])
+    assert scan.counts == {"reused": 0, "delta": 1, "full": 0}
+    assert template.compared == []
+    assert lookups == [("org/a", ["SECURITY.md", "LICENSE"])]
+    assert list(diff) == ["SECURITY.md"] and drifted == []
+
+def test_delta_reports_drift_of_changed_files(lookups):
+    repo = StubRepo("org/a", "v1", {"README.md": "r1", "LICENSE": "l1"})
+    first_pass([repo], check_drift=True)
+    template = StubTemplate("t2", {"README.md": "r1", "LICENSE": "l2"}, {"t1": OLD_SHAS})
+    scan, [(diff, drifted)] = second_pass(template, [repo], check_drift=True)
+    assert scan.counts["delta"] == 1
+    assert drifted == ["LICENSE"]
+
+def test_removed_files_are_dropped_from_stored_results(lookups):
+    repo = StubRepo("org/a", "v1", {"LICENSE": "l1"})
+    # Without the README, doc/ files count
+    assert sorted(first_pass([repo])[0][0]) == ["README.md", "doc/index.md"]
+    template = StubTemplate("t2", {"README.md": "r1", "LICENSE": "l1"}, {"t1": OLD_SHAS})
+    scan, [(diff, _)] = second_pass(template, [repo])
+    assert scan.counts["delta"] == 1
+    assert list(diff) == ["README.md"]
+
+def test_doc_files_are_skipped_for_repos_with_the_readme(lookups):
+    repo = StubRepo("org/a", "v1", {"README.md": "r1", "LICENSE": "l1"})
+    first_pass([repo])
+    template = StubTemplate("t2", {**OLD_SHAS, "doc/guide.md": "g1"}, {"t1": OLD_SHAS})
+    scan, [(diff, _)] = second_pass(template, [repo])
+    assert scan.counts["delta"] == 1
+    assert lookups == []
+    assert diff is None
+
+def test_changed_repo_is_checked_in_full(lookups):
+    first_pass([StubRepo("org/a", "v1", {"README.md": "r1"})])
+    repo = StubRepo("org/a", "v2", {"README.md": "r1", "LICENSE": "l1"})
+    template = StubTemplate("t1", dict(OLD_SHAS), {})
+    scan, [(diff, _)] = second_pass(template, [repo])
+    assert scan.counts == {"reused": 0, "delta": 0, "full": 1}
+    assert template.compared == ["org/a"]
+    assert diff is None
+
+def test_readme_change_forces_a_full_check(lookups):
+    repo = StubRepo("org/a", "v1", {"README.md": "r1", "LICENSE": "l1"})
+    first_pass([repo])
+    template = StubTemplate("t2", {**OLD_SHAS, "README.md": "r2"}, {"t1": OLD_SHAS})
+    scan, _ = second_pass(template, [repo])
+    assert scan.counts == {"reused": 0, "delta": 0, "full": 1}
+    assert template.compared == ["org/a"]
+    assert lookups == []
+
+def test_unknown_template_commit_forces_a_full_check(lookups):
+    repo = StubRepo("org/a", "v1", {"README.md": "r1"})
+    first_pass([repo])
+    template = StubTemplate("t3", dict(OLD_SHAS), {})
+    scan, _ = second_pass(template, [repo])
+    assert scan.counts["full"] == 1
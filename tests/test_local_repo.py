@@ -0,0 +1,37 @@
+import subprocess
+from repository_management_bot.src.caching import canonical_key
+from repository_management_bot.src.local_repo import LocalRepository, file_blob_sha
+
+def git(*args, cwd):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd, check=True, capture_output=True)
+
+def test_file_blob_sha_matches_git(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"hello\n")
+    assert file_blob_sha(path, path.stat().st_size) == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+def test_checkout_key_follows_head(tmp_path):
+    git("init", "--quiet", cwd=tmp_path)
+    (tmp_path / "README.md").write_text("# Test\n")
+    git("add", "-A", cwd=tmp_path)
+    git("commit", "--quiet", "-m", "first", cwd=tmp_path)
+    first = canonical_key(LocalRepository(tmp_path))
+    assert first == canonical_key(LocalRepository(tmp_path))
+    (tmp_path / "LICENSE").write_text("MIT\n")
+    git("add", "-A", cwd=tmp_path)
+    git("commit", "--quiet", "-m", "second", cwd=tmp_path)
+    assert canonical_key(LocalRepository(tmp_path)) != first
+
+def test_directory_key_follows_its_files(tmp_path):
+    (tmp_path / "README.md").write_text("# Test\n")
+    repo = LocalRepository(tmp_path)
+    assert repo.kind == "directory"
+    first = canonical_key(repo)
+    assert first == canonical_key(LocalRepository(tmp_path))
+    (tmp_path / "doc").mkdir()
+    (tmp_path / "doc" / "notes.md").write_text("notes\n")
+    assert canonical_key(LocalRepository(tmp_path)) != first
+
+def test_repo_without_commits_has_a_key(tmp_path):
+    git("init", "--quiet", cwd=tmp_path)
+    assert canonical_key(LocalRepository(tmp_path))[-1] == ""
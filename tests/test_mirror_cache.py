@@ -0,0 +1,55 @@
+import os
+import pytest
+from repository_management_bot.src import mirror_cache
+from repository_management_bot.src.mirror_cache import gc_mirrors, LAST_USED_FILE
+
+def fake_mirror(clone_dir, full_name: str, size: int, last_used: float):
+    mirror = clone_dir / "mirrors" / f"{full_name}.git"
+    (mirror / "objects").mkdir(parents=True)
+    (mirror / "HEAD").write_text("ref: refs/heads/main\n")
+    (mirror / "objects" / "pack").write_bytes(b"x" * size)
+    marker = mirror / LAST_USED_FILE
+    marker.touch()
+    os.utime(marker, (last_used, last_used))
+    return mirror
+
+@pytest.fixture
+def clone_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(mirror_cache, "CLONE_DIR", tmp_path)
+    monkeypatch.setattr(mirror_cache, "ACTIVE_WORKTREES", {})
+    monkeypatch.setattr(mirror_cache, "FETCHED_MIRRORS", set())
+    return tmp_path
+
+def test_gc_mirrors_removes_least_recently_used(clone_dir):
+    oldest = fake_mirror(clone_dir, "org/oldest", 1000, 100)
+    older = fake_mirror(clone_dir, "org/older", 1000, 200)
+    newest = fake_mirror(clone_dir, "other/newest", 1000, 300)
+    mirror_cache.FETCHED_MIRRORS.update({"org/oldest", "org/older", "other/newest"})
+    assert gc_mirrors(2500) == [oldest]
+    assert not oldest.exists() and older.exists() and newest.exists()
+    assert mirror_cache.FETCHED_MIRRORS == {"org/older", "other/newest"}
+
+def test_gc_mirrors_skips_mirrors_in_use(clone_dir):
+    in_use = fake_mirror(clone_dir, "org/in-use", 1000, 100)
+    idle = fake_mirror(clone_dir, "org/idle", 1000, 200)
+    recent = fake_mirror(clone_dir, "org/recent", 1000, 300)
+    mirror_cache.ACTIVE_WORKTREES["org/in-use"] = clone_dir / "worktrees" / "org" / "in-use"
+    mirror_cache.FETCHED_MIRRORS.update({"org/in-use", "org/idle", "org/recent"})
+    assert gc_mirrors(1500) == [idle, recent]
+    assert in_use.exists()
+    assert mirror_cache.FETCHED_MIRRORS == {"org/in-use"}
+
+def test_gc_mirrors_within_limit(clone_dir):
+    mirror = fake_mirror(clone_dir, "org/repo", 1000, 100)
+    assert gc_mirrors(10 ** 6) == []
+    assert mirror.exists()
+
+def test_gc_mirrors_removes_unmarked_mirrors_first(clone_dir):
+    used = fake_mirror(clone_dir, "org/used", 1000, 100)
+    unmarked = fake_mirror(clone_dir, "org/unmarked", 1000, 300)
+    (unmarked / LAST_USED_FILE).unlink()
+    assert gc_mirrors(1500) == [unmarked]
+    assert used.exists()
+
+def test_gc_mirrors_without_mirrors(clone_dir):
+    assert gc_mirrors(0) == []
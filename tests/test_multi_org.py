@@ -0,0 +1,64 @@
+from repository_management_bot.src.multi_org import RequestBudget, MultiOrgScan, is_multi_org, parse_org_names
+
+def test_multi_org_names():
+    assert is_multi_org("a,b")
+    assert is_multi_org("ALL")
+    assert not is_multi_org("a")
+    assert not is_multi_org(None)
+    assert parse_org_names("a, b,,a") == ["a", "b"]
+
+def test_every_org_gets_an_equal_share():
+    budget = RequestBudget(["a", "b", "c", "d"], 100)
+    assert budget.share() == 25
+    for _ in range(25):
+        budget.charge("a")
+    assert budget.exhausted("a")
+    assert not budget.exhausted("b")
+
+def test_unused_shares_go_to_the_orgs_still_going():
+    budget = RequestBudget(["a", "b", "c"], 90)
+    for _ in range(10):
+        budget.charge("a")
+    budget.finish("a")
+    assert budget.share() == 40
+    assert budget.used() == 10
+
+def test_no_budget_never_runs_out():
+    budget = RequestBudget(["a"])
+    budget.charge("a")
+    assert budget.share() is None
+    assert not budget.exhausted("a")
+
+def run_scan(targets, costs, total=None):
+    # Checks the repos one at a time, charging each repo's cost to its org
+    budget = RequestBudget(list(targets), total)
+    scan = MultiOrgScan(targets, budget)
+    order = []
+    while True:
+        item = scan.next()
+        if item is None:
+            return scan, order
+        org, repo = item
+        for _ in range(costs[org]):
+            budget.charge(org)
+        order.append(org)
+        scan.done(org)
+
+def test_the_org_that_used_the_fewest_requests_goes_next():
+    scan, order = run_scan({"big": [f"big/{i}" for i in range(6)], "small": ["small/0", "small/1"]}, {"big": 1, "small": 1})
+    assert order[:4] == ["big", "small", "big", "small"]
+    assert order.count("big") == 6
+
+def test_an_expensive_org_does_not_starve_the_others():
+    targets = {"costly": [f"costly/{i}" for i in range(10)], "cheap": [f"cheap/{i}" for i in range(10)]}
+    scan, order = run_scan(targets, {"costly": 10, "cheap": 1}, total=100)
+    # The cheap org is checked completely, and the costly one gets the rest of the budget
+    assert order.count("cheap") == 10
+    assert scan.skipped("cheap") == 0
+    assert scan.budget.spent["costly"] <= 100 - scan.budget.spent["cheap"] + 10
+    assert scan.skipped("costly") > 0
+
+def test_orgs_without_repos_are_finished_at_once():
+    scan, order = run_scan({"empty": [], "a": ["a/0"]}, {"empty": 1, "a": 1}, total=10)
+    assert order == ["a"]
+    assert "empty" in scan.budget.finished
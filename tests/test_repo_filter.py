@@ -0,0 +1,43 @@
+import pytest
+from repository_management_bot.src.repo_filter import RepoFilter, parse_repo_filter, filter_repos
+
+def test_values_match_any(make_repo):
+    repo_filter = RepoFilter("language=Python,Go")
+    assert repo_filter.matches(make_repo("o/a", language="Go"))
+    assert not repo_filter.matches(make_repo("o/b", language="Rust"))
+
+def test_negated_values_match_none(make_repo):
+    repo_filter = RepoFilter("visibility!=private,internal")
+    assert repo_filter.matches(make_repo("o/a", visibility="public"))
+    assert not repo_filter.matches(make_repo("o/b", visibility="private"))
+    assert not repo_filter.matches(make_repo("o/c", visibility="internal"))
+
+def test_all_expressions_must_match(make_repo):
+    repos = [
+        make_repo("o/a", archived=False, fork=False),
+        make_repo("o/b", archived=True, fork=False),
+        make_repo("o/c", archived=False, fork=True)
+    ]
+    assert filter_repos(repos, parse_repo_filter("archived=false fork=false")) == repos[:1]
+
+def test_dates_and_topics(make_repo):
+    repo = make_repo("o/a", pushed_at="2024-06-01T00:00:00Z", topics=["python", "cli"])
+    assert RepoFilter("pushed_at>=2024-01-01").matches(repo)
+    assert not RepoFilter("pushed_at<2024-01-01").matches(repo)
+    assert RepoFilter("topics~cli").matches(repo)
+    assert not RepoFilter("topics~go").matches(repo)
+
+def test_missing_fields(make_repo):
+    repo = make_repo("o/a")
+    # Bool fields that were not listed count as false, other comparisons fail
+    assert RepoFilter("archived=false").matches(repo)
+    assert not RepoFilter("stargazers_count>0").matches(repo)
+
+def test_none_disables_filtering():
+    assert parse_repo_filter("none") == []
+    assert parse_repo_filter(None) == []
+
+@pytest.mark.parametrize("expression", ["archived", "color=red", "archived=maybe"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        RepoFilter(expression)
@@ -0,0 +1,58 @@
+from repository_management_bot.gui.search_index import SearchIndex, split_words, narrows
+
+def make_index()->SearchIndex:
+    index = SearchIndex()
+    index.add("a", ["repository-management_bot", "Python", ["ci", "github"]])
+    index.add("b", ["repo-mgmt-bot", "Go", None])
+    index.add("c", ["data-pipeline", "Python", ["etl"]])
+    return index
+
+def test_split_words():
+    assert split_words("Repo-Management_bot.py") == ["repo", "management", "bot", "py"]
+
+def test_terms_match_inside_words():
+    index = make_index()
+    assert index.search("mgmt") == {"b"}
+    assert index.search("pipe") == {"c"}
+    assert index.search("agem") == {"a"}
+
+def test_every_term_must_match():
+    index = make_index()
+    assert index.search("python bot") == {"a"}
+    assert index.search("python github etl") == set()
+
+def test_short_terms_match_the_start_of_words():
+    index = make_index()
+    assert index.search("go") == {"b"}
+    assert index.search("e") == {"c"}
+    # "it" is inside "github", not at the start of a word
+    assert index.search("it") == set()
+
+def test_empty_query_matches_everything():
+    assert make_index().search("  -- ") is None
+
+def test_typing_on_narrows_the_previous_result():
+    index = make_index()
+    assert index.search("p") == {"a", "c"}
+    assert index.search("py") == {"a", "c"}
+    assert index.search("pyt") == {"a", "c"}
+    assert index.search("pyth e") == {"c"}
+    # Deleting characters searches again
+    assert index.search("b") == {"a", "b"}
+
+def test_replacing_and_removing_rows():
+    index = make_index()
+    index.add("b", ["renamed"])
+    assert index.search("mgmt") == set()
+    assert index.search("renamed") == {"b"}
+    index.remove("b")
+    assert index.search("renamed") == set()
+    assert len(index) == 2
+
+def test_narrows():
+    assert narrows(("pyt",), ("pyth",))
+    assert narrows(("py",), ("pyt",)) is False
+    assert narrows(("p",), ("py",))
+    assert narrows(("pyth",), ("pyt",)) is False
+    assert narrows(("bot",), ("bot", "go"))
+    assert narrows(("bot", "go"), ("bot",)) is False
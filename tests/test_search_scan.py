@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import time
+from types import SimpleNamespace
+from repository_management_bot.src import search_scan
+from repository_management_bot.src.search_scan import SearchScan
+
+FILE_SHAS = {"README.md": "r1", "LICENSE": "l1"}
+
+def make_template():
+    return SimpleNamespace(file_shas=dict(FILE_SHAS), structure_from_paths=lambda paths: {path: None for path in paths})
+
+def indexed(full_name, path, sha):
+    return SimpleNamespace(path=path, sha=sha, repository=SimpleNamespace(full_name=full_name))
+
+def test_concurrent_checks_share_one_search(monkeypatch, make_repo):
+    searches = []
+    lookups = []
+    def search_code(query):
+        searches.append(query)
+        # Slow enough for every worker to arrive while the searches run
+        time.sleep(0.05)
+        if "filename:README.md" in query:
+            return 2, [indexed("o/a", "README.md", "r1"), indexed("o/b", "README.md", "r1")]
+        return 1, [indexed("o/a", "LICENSE", "l1")]
+    def get_blob_shas_batch(repo, paths):
+        lookups.append(repo.full_name)
+        return {path: None for path in paths}
+    monkeypatch.setattr(search_scan, "search_code", search_code)
+    monkeypatch.setattr(search_scan, "get_blob_shas_batch", get_blob_shas_batch)
+    pushed_at = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    repos = [make_repo(name, pushed_at=pushed_at, fork=False) for name in ["o/a", "o/b"] * 4]
+    scan = SearchScan(make_template(), "org:o")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(scan.check, repos))
+    assert len(searches) == 2
+    # Only o/b seemed to miss a file; o/a was resolved from the search results alone
+    assert set(lookups) == {"o/b"}
+    assert results[0] == (None, [])
+    assert list(results[1][0]) == ["LICENSE"]
+    assert scan.counts == {"searches": 2, "trusted": 4, "verified": 4}
+
+def test_recent_pushes_are_verified(monkeypatch, make_repo):
+    monkeypatch.setattr(search_scan, "search_code", lambda query: (0, []))
+    monkeypatch.setattr(search_scan, "get_blob_shas_batch", lambda repo, paths: dict(FILE_SHAS))
+    repo = make_repo("o/new", pushed_at=datetime.now(timezone.utc).isoformat(), fork=False)
+    scan = SearchScan(make_template(), "org:o")
+    assert scan.check(repo) == (None, [])
+    assert scan.counts["verified"] == 1
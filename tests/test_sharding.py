@@ -0,0 +1,60 @@
+import json
+from types import SimpleNamespace
+import pytest
+from repository_management_bot.src.sharding import shard_of, parse_shard, shard_path, merge_shard_results
+
+TEMPLATE = SimpleNamespace(head_sha="abc", structure_from_json=lambda diff: diff)
+
+def write_shard(shard_dir, shard, shard_count, diffs, template_sha="abc", check_drift=False):
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    with open(shard_path(shard_dir, shard, shard_count), "w") as f:
+        json.dump({
+            "template": "org/template",
+            "shard": shard,
+            "shard_count": shard_count,
+            "template_sha": template_sha,
+            "check_drift": check_drift,
+            "scanned": len(diffs),
+            "diffs": diffs
+        }, f)
+
+def test_shard_of_is_stable_and_in_range():
+    names = [f"org/repo-{i}" for i in range(200)]
+    shards = [shard_of(name, 4) for name in names]
+    assert shards == [shard_of(name, 4) for name in names]
+    assert set(shards) == {0, 1, 2, 3}
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    for shard in ["4/4", "-1/4", "0/0"]:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+def test_merge_keeps_the_listing_order(tmp_path):
+    write_shard(tmp_path, 0, 2, [[0, "org/a", {"LICENSE": 1}], [3, "org/d", {"README.md": 1}]])
+    write_shard(tmp_path, 1, 2, [[1, "org/b", {"LICENSE": 1}]])
+    merged = merge_shard_results(tmp_path, TEMPLATE)
+    assert list(merged) == ["org/a", "org/b", "org/d"]
+    assert merged["org/d"] == {"README.md": 1}
+
+def test_merge_needs_every_shard(tmp_path):
+    write_shard(tmp_path, 0, 3, [])
+    write_shard(tmp_path, 2, 3, [])
+    with pytest.raises(ValueError, match=r"\[1\]"):
+        merge_shard_results(tmp_path, TEMPLATE)
+
+@pytest.mark.parametrize("changes", [{"check_drift": True}, {"template_sha": "def"}])
+def test_merge_rejects_shards_of_different_scans(tmp_path, changes):
+    write_shard(tmp_path, 0, 2, [])
+    write_shard(tmp_path, 1, 2, [], **changes)
+    with pytest.raises(ValueError, match="different scans"):
+        merge_shard_results(tmp_path, TEMPLATE)
+
+def test_merge_rejects_a_template_that_moved_on(tmp_path):
+    write_shard(tmp_path, 0, 1, [], template_sha="old")
+    with pytest.raises(ValueError, match="template commit"):
+        merge_shard_results(tmp_path, TEMPLATE)
+
+def test_merge_without_results(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        merge_shard_results(tmp_path, TEMPLATE)
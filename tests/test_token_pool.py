@@ -0,0 +1,68 @@
+import time
+from repository_management_bot.src.token_pool import TokenPool, Credential, parse_credentials
+
+def make_pool(*remaining: int)->TokenPool:
+    credentials = []
+    for i, count in enumerate(remaining):
+        credential = Credential(f"token#{i}", token=f"secret{i}")
+        credential.remaining = count
+        credentials.append(credential)
+    return TokenPool(credentials, "https://api.github.com")
+
+def send_request(pool: TokenPool)->str:
+    headers = {}
+    pool.auth.authentication(headers)
+    return headers["Authorization"]
+
+def test_reads_rotate_to_the_most_remaining_quota():
+    pool = make_pool(10, 8)
+    used = [send_request(pool) for _ in range(6)]
+    assert used[:3] == ["token secret0"] * 3
+    assert set(used[3:]) == {"token secret0", "token secret1"}
+    assert abs(pool.credentials[0].remaining - pool.credentials[1].remaining) <= 1
+
+def test_picking_a_credential_does_not_count_a_request():
+    pool = make_pool(10)
+    for _ in range(3):
+        pool.current()
+        _ = pool.auth.token
+    assert pool.credentials[0].remaining == 10
+
+def test_every_request_is_counted_and_charged_once():
+    pool = make_pool(10)
+    charged = []
+    with pool.charging(lambda: charged.append(1)):
+        send_request(pool)
+        send_request(pool)
+        pool.current()
+    send_request(pool)
+    assert pool.credentials[0].remaining == 7
+    assert len(charged) == 2
+
+def test_quota_is_back_after_the_reset_time():
+    pool = make_pool(0, 5)
+    pool.credentials[0].limit = 100
+    pool.credentials[0].reset_at = time.time() - 1
+    assert send_request(pool) == "token secret0"
+    assert pool.credentials[0].remaining == 99
+
+def test_pinned_requests_use_the_pinned_credential():
+    pool = make_pool(1, 100)
+    with pool.pinned(pool.credentials[0]):
+        assert send_request(pool) == "token secret0"
+    assert pool.credentials[0].remaining == 0
+
+def test_writes_to_a_repo_stick_to_one_credential():
+    pool = make_pool(10, 20)
+    with pool.writing("o/a") as first:
+        assert first is pool.credentials[1]
+    pool.credentials[1].remaining = 0
+    assert pool.choose_write("o/a") is first
+    assert pool.choose_write("o/b") is pool.credentials[0]
+
+def test_parse_credentials(tmp_path, monkeypatch):
+    token_file = tmp_path / "tokens"
+    token_file.write_text("# comment\nfirst\n\nsecond\n")
+    monkeypatch.setenv("BOT_TOKEN", "from-env")
+    credentials = parse_credentials(f"gh env:BOT_TOKEN file:{token_file}", lambda: "from-gh")
+    assert [credential.token for credential in credentials] == ["from-gh", "from-env", "first", "second"]